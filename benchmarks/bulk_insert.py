@@ -0,0 +1,116 @@
+"""Rows per second added through POST, one row per request and in bulk
+
+Starts request_handler.py on a copy of kennel.sqlite3 and adds animals three
+ways: one POST per row, one POST of a JSON array and one POST of NDJSON
+(application/x-ndjson), then prints the rows per second of each.
+
+    python benchmarks/bulk_insert.py --rows 100000 --single-rows 2000
+
+The bulk modes are meant to reach 50k rows/s. They only do from Python 3.12,
+see views/bulk.insert_many.
+"""
+import argparse
+import http.client
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ANIMAL = {
+    "name": "Bulk",
+    "breed": "Mutt",
+    "status": "Kennel",
+    "location_id": 1,
+    "customer_id": 1,
+}
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def post(conn, body, content_type="application/json"):
+    conn.request("POST", "/animals", body, {"Content-Type": content_type})
+    response = conn.getresponse()
+    data = response.read()
+    if response.status != 201:
+        raise RuntimeError(f"POST /animals answered {response.status}: {data[:200]}")
+    return json.loads(data)
+
+
+def single(conn, rows):
+    body = json.dumps(ANIMAL).encode()
+    for _ in range(rows):
+        post(conn, body)
+
+
+def array(conn, rows):
+    ids = post(conn, json.dumps([ANIMAL] * rows).encode())["ids"]
+    assert len(ids) == rows
+
+
+def ndjson(conn, rows):
+    line = json.dumps(ANIMAL)
+    body = "\n".join([line] * rows).encode()
+    ids = post(conn, body, "application/x-ndjson")["ids"]
+    assert len(ids) == rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000, help="rows per bulk POST")
+    parser.add_argument("--single-rows", type=int, default=2000)
+    parser.add_argument("--port", type=int, default=8096)
+    parser.add_argument("--engine", default="threaded")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "kennel.sqlite3")
+        shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+        server = subprocess.Popen(
+            [
+                sys.executable,
+                os.path.join(ROOT, "request_handler.py"),
+                "--db", path,
+                "--port", str(args.port),
+                "--engine", args.engine,
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        try:
+            wait_for_port(args.port)
+            conn = http.client.HTTPConnection("127.0.0.1", args.port, timeout=600)
+            print(f"{'mode':<12}{'rows':>10}{'seconds':>10}{'rows/s':>12}")
+            for (mode, run, rows) in (
+                ("single", single, args.single_rows),
+                ("json array", array, args.rows),
+                ("ndjson", ndjson, args.rows),
+            ):
+                started = time.perf_counter()
+                run(conn, rows)
+                elapsed = time.perf_counter() - started
+                print(f"{mode:<12}{rows:>10}{elapsed:>10.2f}{rows / elapsed:>12.0f}")
+            conn.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""Time of GET /animals with the per-row JSON cache cold, warm, and after a
+share of the animals changed
+
+Fills a copy of kennel.sqlite3 with animals, then calls get_all_animals
+through the views, first with the fragment cache off, then with it on:
+once to fill it, once fully cached, and once after updating --changed of
+the rows. Each body is checked against the uncached one.
+
+    python benchmarks/fragment_cache.py --animals 100000 --changed 0.01
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cache  # noqa: E402
+import db  # noqa: E402
+import migrations  # noqa: E402
+from serialize import build_database  # noqa: E402
+from views import get_all_animals  # noqa: E402
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - started, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--animals", type=int, default=100000)
+    parser.add_argument("--changed", type=float, default=0.01)
+    parser.add_argument("--cache-mb", type=float, default=64)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "kennel.sqlite3")
+        build_database(path, args.animals)
+        migrations.migrate(path)
+        db.configure(path=path)
+
+        max_bytes = int(args.cache_mb * 2**20)
+        cache.configure(fragment_bytes=0)
+        (uncached, expected) = timed(get_all_animals)
+        cache.configure(fragment_bytes=max_bytes)
+        runs = [
+            ("uncached", uncached, expected),
+            ("cold",) + timed(get_all_animals),
+            ("warm",) + timed(get_all_animals),
+        ]
+        for (name, seconds, body) in runs:
+            if body != expected:
+                raise RuntimeError(f"{name}: the cached body differs")
+
+        # Every step-th animal changes, so only those rows miss the cache
+        step = max(1, round(1 / args.changed))
+        conn = sqlite3.connect(path)
+        conn.execute("UPDATE Animal SET status = 'Treatment' WHERE id % ? = 0", (step,))
+        conn.commit()
+        conn.close()
+        (seconds, body) = timed(get_all_animals)
+        cache.configure(fragment_bytes=0)
+        if body != get_all_animals():
+            raise RuntimeError("changed: the cached body differs")
+        runs.append((f"{args.changed:.0%} changed", seconds, body))
+
+        print(f"{args.animals} animals, fragment cache {args.cache_mb:g} MB")
+        print(f"{'run':<22}{'seconds':>9}")
+        for (name, seconds, _) in runs:
+            print(f"{name:<22}{seconds:>9.3f}")
+        db.close_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""Write throughput of sqlite with each write committing alone, and with the
+writes of every thread committed in batches by db.WriteQueue
+
+Writers alternate create_animal and update_animal for --seconds on a
+migrated copy of kennel.sqlite3, first through the views as they are, then
+with configure_writes() at each --windows value (milliseconds).
+
+    python benchmarks/group_commit.py --writers 1,16,64 --windows 0,2
+
+The copy is made in --tmp, which should be on the disk to measure; tmpfs
+ignores fsync.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+from views import create_animal, update_animal  # noqa: E402
+
+
+def animal(n):
+    return {
+        "name": f"Animal {n}",
+        "breed": "Mutt",
+        "status": "Kennel",
+        "location_id": n % 2 + 1,
+        "customer_id": n % 4 + 1,
+    }
+
+
+def throughput(writers, seconds):
+    """Returns the writes per second the writers get through together"""
+    deadline = time.perf_counter() + seconds
+    counts = [0] * writers
+
+    def write(number):
+        id = None
+        while time.perf_counter() < deadline:
+            if id is None:
+                id = create_animal(animal(number))["id"]
+            else:
+                update_animal(id, animal(number))
+                id = None
+            counts[number] += 1
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", default="1,16,64")
+    parser.add_argument("--windows", default="0,2")
+    parser.add_argument("--max-batch", type=int, default=256)
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument(
+        "--pragma-profile", choices=sorted(db.PRAGMA_PROFILES), default="default"
+    )
+    parser.add_argument("--tmp", default=None, help="where to copy the database")
+    args = parser.parse_args()
+    writer_counts = [int(value) for value in args.writers.split(",")]
+    windows = [float(value) for value in args.windows.split(",")]
+
+    workdir = tempfile.mkdtemp(dir=args.tmp)
+    try:
+        path = os.path.join(workdir, "kennel.sqlite3")
+        shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+        migrations.migrate(path)
+        db.configure(path=path, pragmas=db.PRAGMA_PROFILES[args.pragma_profile])
+
+        print(f"writes/s over {args.seconds:g} s, {args.pragma_profile} pragmas")
+        print(
+            f"{'commits':<16}" + "".join(f"{n:>9} w" for n in writer_counts)
+            + f"{'per batch':>11}"
+        )
+        for window in [None] + windows:
+            queue = db.configure_writes(
+                None if window is None else window / 1000, args.max_batch
+            )
+            rates = [throughput(writers, args.seconds) for writers in writer_counts]
+            label = "each alone" if queue is None else f"batched {window:g} ms"
+            per_batch = "" if queue is None else f"{queue.writes / queue.batches:.1f}"
+            print(
+                f"{label:<16}" + "".join(f"{rate:>11.0f}" for rate in rates)
+                + f"{per_batch:>11}"
+            )
+        db.configure_writes(None)
+        db.close_all()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
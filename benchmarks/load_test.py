@@ -0,0 +1,242 @@
+"""Load test for the kennel API server
+
+Starts request_handler.py in a child process for every serving mode, hits it
+with concurrent clients and prints latency percentiles so the modes can be
+compared side by side.
+
+    python benchmarks/load_test.py --clients 64 --requests 50 --modes serial,pool
+
+Pre-fork scaling is measured the same way; give the clients their own
+processes so they can keep every server core busy:
+
+    python benchmarks/load_test.py --modes pool,prefork --processes auto \
+        --client-processes 4 --slow-clients 0
+
+Keep-alive is compared by running every mode with a new connection per
+request and with one persistent connection per client:
+
+    python benchmarks/load_test.py --modes pool,asyncio --connections both
+"""
+import argparse
+import http.client
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    """Asks the OS for a port nobody is listening on"""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server did not start listening on {port}")
+
+
+def start_server(port, server_args, database):
+    process = subprocess.Popen(
+        [sys.executable, "request_handler.py", "--port", str(port), "--db", database]
+        + server_args,
+        cwd=ROOT,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    wait_for_port(port)
+    return process
+
+
+def percentile(samples, pct):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def run_client(port, path, requests, keep_alive, latencies, errors):
+    """Makes `requests` GETs, on one persistent connection when keep_alive is
+    set, otherwise on a new connection each time"""
+    conn = None
+    for _ in range(requests):
+        started = time.perf_counter()
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+            conn.request("GET", path)
+            response = conn.getresponse()
+            response.read()
+            if not keep_alive or response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException):
+            errors.append(1)
+            if conn is not None:
+                conn.close()
+            conn = None
+            continue
+        latencies.append(time.perf_counter() - started)
+    if conn is not None:
+        conn.close()
+
+
+def run_slow_client(port, path, stop):
+    """Trickles requests in byte by byte, like a client on a bad network"""
+    request = f"GET {path} HTTP/1.0\r\nHost: localhost\r\n\r\n".encode()
+    while not stop.is_set():
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=30) as sock:
+                for byte in request:
+                    if stop.is_set():
+                        return
+                    sock.sendall(bytes([byte]))
+                    time.sleep(0.05)
+                while sock.recv(65536):
+                    pass
+        except OSError:
+            return
+
+
+def run_clients(port, path, clients, requests, keep_alive):
+    latencies = []
+    errors = []
+    threads = [
+        threading.Thread(
+            target=run_client,
+            args=(port, path, requests, keep_alive, latencies, errors),
+        )
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, len(errors)
+
+
+def run_load(port, args, keep_alive):
+    """Runs the clients, spread over --client-processes so the load generator
+    is not held back by its own GIL"""
+    stop = threading.Event()
+    slow = [
+        threading.Thread(target=run_slow_client, args=(port, args.path, stop), daemon=True)
+        for _ in range(args.slow_clients)
+    ]
+    for thread in slow:
+        thread.start()
+
+    shares = [
+        args.clients // args.client_processes
+        + (1 if i < args.clients % args.client_processes else 0)
+        for i in range(args.client_processes)
+    ]
+    started = time.perf_counter()
+    if args.client_processes == 1:
+        results = [
+            run_clients(port, args.path, args.clients, args.requests, keep_alive)
+        ]
+    else:
+        with multiprocessing.Pool(args.client_processes) as pool:
+            results = pool.starmap(
+                run_clients,
+                [
+                    (port, args.path, share, args.requests, keep_alive)
+                    for share in shares
+                    if share
+                ],
+            )
+    elapsed = time.perf_counter() - started
+    stop.set()
+
+    latencies = [sample for result in results for sample in result[0]]
+    errors = sum(result[1] for result in results)
+    return latencies, errors, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=20, help="requests per client")
+    parser.add_argument("--path", default="/animals")
+    parser.add_argument("--workers", type=int, default=16)
+    parser.add_argument("--backlog", type=int, default=128)
+    parser.add_argument("--slow-clients", type=int, default=1)
+    parser.add_argument("--processes", default="auto", help="workers for prefork mode")
+    parser.add_argument("--client-processes", type=int, default=1)
+    parser.add_argument("--modes", default="serial,pool", help="serial, pool, asyncio, prefork")
+    parser.add_argument(
+        "--server-args",
+        default="",
+        help="extra request_handler.py options for every mode, e.g. '--cache-ttl 0'",
+    )
+    parser.add_argument(
+        "--connections",
+        default="new",
+        help="new (a connection per request), keep-alive, or both",
+    )
+    args = parser.parse_args()
+
+    modes = {
+        "serial": [],
+        "pool": ["--workers", str(args.workers), "--backlog", str(args.backlog)],
+        "asyncio": ["--engine", "asyncio", "--workers", str(args.workers)],
+        "prefork": [
+            "--processes", args.processes,
+            "--workers", str(args.workers),
+            "--backlog", str(args.backlog),
+        ],
+    }
+
+    print(
+        f"{args.clients} clients x {args.requests} requests of GET {args.path}, "
+        f"{args.slow_clients} slow client(s)"
+    )
+    connections = ["new", "keep-alive"] if args.connections == "both" else [args.connections]
+    print(
+        f"{'mode':<10}{'conn':<12}{'req/s':>10}{'req/s/cl':>10}"
+        f"{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}{'errors':>8}"
+    )
+    workdir = tempfile.mkdtemp()
+    database = os.path.join(workdir, "kennel.sqlite3")
+    shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), database)
+    for mode in args.modes.split(","):
+        for connection in connections:
+            port = free_port()
+            server = start_server(port, modes[mode] + args.server_args.split(), database)
+            try:
+                latencies, errors, elapsed = run_load(
+                    port, args, connection == "keep-alive"
+                )
+            finally:
+                server.terminate()
+                server.wait()
+
+            rate = len(latencies) / elapsed
+            print(
+                f"{mode:<10}{connection:<12}{rate:>10.0f}{rate / args.clients:>10.1f}"
+                f"{percentile(latencies, 50) * 1000:>10.1f}"
+                f"{percentile(latencies, 99) * 1000:>10.1f}"
+                f"{max(latencies, default=float('nan')) * 1000:>10.1f}"
+                f"{errors:>8}"
+            )
+    shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Time of the repository.py operations at 1M animals, over the hash-indexed
+tables and over the lists they replaced
+
+Fills both with the same animals, then times retrieve, update and delete of
+random ids, create, and find by customer (1 in 1000 rows) and by status (1 in
+4). The lists are scanned the way repository.py did before, so their
+operations run --list-ops times only.
+
+    python benchmarks/memory_engine.py --rows 1000000 --ops 100000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import repository  # noqa: E402
+
+STATUSES = ("Admitted", "Kennel", "Treatment", "Discharged")
+
+
+def animal(n):
+    return {
+        "id": n,
+        "name": f"Animal {n}",
+        "breed": "Mutt",
+        "location_id": n % 2 + 1,
+        "customer_id": n % 1000 + 1,
+        "status": STATUSES[n % len(STATUSES)],
+    }
+
+
+class ListRepository:
+    """The list-based repository.py, with the copy retrieve made instead of
+    changing the stored row, so the results stay comparable"""
+
+    def __init__(self, database):
+        self.database = database
+
+    def retrieve(self, id, resource):
+        requested_data = None
+        for data in self.database[resource]:
+            if data["id"] == id:
+                requested_data = dict(data)
+        return requested_data
+
+    def find(self, resource, field, value):
+        return [data for data in self.database[resource] if data[field] == value]
+
+    def create(self, resource, newdata):
+        newdata["id"] = self.database[resource][-1]["id"] + 1
+        self.database[resource].append(newdata)
+        return newdata
+
+    def update(self, id, updated_data, resource):
+        for (index, data) in enumerate(self.database[resource]):
+            if data["id"] == id:
+                self.database[resource][index] = updated_data
+                break
+
+    def delete(self, id, resource):
+        data_index = -1
+        for (index, data) in enumerate(self.database[resource]):
+            if data["id"] == id:
+                data_index = index
+        if data_index >= 0:
+            self.database[resource].pop(data_index)
+
+
+def per_op(function, arguments):
+    """Returns the microseconds per call of the function"""
+    started = time.perf_counter()
+    for args in arguments:
+        function(*args)
+    return (time.perf_counter() - started) / len(arguments) * 1e6
+
+
+def time_operations(store, ids):
+    """Times each operation on ids picked before, so both stores see the same"""
+    return {
+        "retrieve": per_op(store.retrieve, [(id, "animals") for id in ids]),
+        "update": per_op(store.update, [(id, animal(id), "animals") for id in ids]),
+        "find customer": per_op(
+            store.find, [("animals", "customer_id", id % 1000 + 1) for id in ids[:1000]]
+        ),
+        "find status": per_op(
+            store.find, [("animals", "status", "Treatment")] * max(1, len(ids) // 1000)
+        ),
+        "create": per_op(store.create, [("animals", animal(0)) for _ in ids]),
+        "delete": per_op(store.delete, [(id, "animals") for id in ids]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--ops", type=int, default=100000)
+    parser.add_argument("--list-ops", type=int, default=20)
+    args = parser.parse_args()
+
+    seed = [animal(n) for n in range(1, args.rows + 1)]
+    random.seed(1)
+
+    started = time.perf_counter()
+    repository.DATABASE = repository.Database(
+        dict(repository.SEED, animals=[dict(row) for row in seed])
+    )
+    loaded = time.perf_counter() - started
+    tables = time_operations(
+        repository, random.sample(range(1, args.rows + 1), args.ops)
+    )
+    lists = time_operations(
+        ListRepository({"animals": seed}),
+        random.sample(range(1, args.rows + 1), args.list_ops),
+    )
+
+    print(f"{args.rows} animals, loaded into tables in {loaded:.2f} s")
+    print(f"{'operation':<14}{'lists us':>12}{'tables us':>11}{'speedup':>10}")
+    for (name, table_us) in tables.items():
+        print(
+            f"{name:<14}{lists[name]:>12.1f}{table_us:>11.2f}"
+            f"{lists[name] / table_us:>9.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Mixed read/write benchmark for the sqlite pragma profiles
+
+Reader threads call get_all_animals() while writer processes create, update
+and delete animals on a copy of kennel.sqlite3. Run once per pragma profile
+to see whether readers wait on writers.
+
+    python benchmarks/mixed_read_write.py --readers 8 --writers 2 --seconds 5
+"""
+import argparse
+import multiprocessing
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+from views import create_animal, delete_animal, get_all_animals, update_animal  # noqa: E402
+
+
+def percentile(samples, pct):
+    if not samples:
+        return float("nan")
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def write_loop(path, pragmas, seconds, results):
+    db.configure(path=path, pragmas=pragmas)
+    writes = 0
+    errors = 0
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        animal = {
+            "name": "Bench",
+            "breed": "Mutt",
+            "status": "Kennel",
+            "location_id": 1,
+            "customer_id": 1,
+        }
+        try:
+            create_animal(animal)
+            animal["status"] = "Treatment"
+            update_animal(animal["id"], animal)
+            delete_animal(animal["id"])
+            writes += 3
+        except sqlite3.OperationalError:
+            errors += 1
+    results.put((writes, errors))
+
+
+def read_loop(seconds, latencies, errors):
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        started = time.perf_counter()
+        try:
+            get_all_animals()
+        except sqlite3.OperationalError:
+            errors.append(1)
+            continue
+        latencies.append(time.perf_counter() - started)
+
+
+def run(profile, args, workdir):
+    path = os.path.join(workdir, f"{profile}.sqlite3")
+    shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+    pragmas = db.PRAGMA_PROFILES[profile]
+    db.configure(path=path, pragmas=pragmas)
+
+    results = multiprocessing.Queue()
+    writers = [
+        multiprocessing.Process(
+            target=write_loop, args=(path, pragmas, args.seconds, results)
+        )
+        for _ in range(args.writers)
+    ]
+    latencies = []
+    read_errors = []
+    readers = [
+        threading.Thread(target=read_loop, args=(args.seconds, latencies, read_errors))
+        for _ in range(args.readers)
+    ]
+    for worker in writers + readers:
+        worker.start()
+    for reader in readers:
+        reader.join()
+    writes = 0
+    write_errors = 0
+    for _ in writers:
+        (count, errors) = results.get()
+        writes += count
+        write_errors += errors
+    for writer in writers:
+        writer.join()
+    db.close_all()
+
+    print(
+        f"{profile:<12}{len(latencies) / args.seconds:>10.0f}"
+        f"{percentile(latencies, 50) * 1000:>10.2f}"
+        f"{percentile(latencies, 99) * 1000:>10.2f}"
+        f"{max(latencies, default=float('nan')) * 1000:>10.2f}"
+        f"{len(read_errors):>8}{writes / args.seconds:>10.0f}{write_errors:>8}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5)
+    parser.add_argument("--profiles", default="default,concurrent")
+    args = parser.parse_args()
+
+    print(f"{args.readers} reader threads, {args.writers} writer processes, {args.seconds}s")
+    print(
+        f"{'profile':<12}{'reads/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'max ms':>10}"
+        f"{'rerr':>8}{'writes/s':>10}{'werr':>8}"
+    )
+    with tempfile.TemporaryDirectory() as workdir:
+        for profile in args.profiles.split(","):
+            run(profile, args, workdir)
+
+
+if __name__ == "__main__":
+    main()
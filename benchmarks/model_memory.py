@@ -0,0 +1,84 @@
+"""Memory held by 100k model instances, with __slots__ and with a __dict__
+
+Builds the instances of every model twice, from the Record models and from
+plain classes with the same attributes kept in a __dict__, the way the
+models were written before, and prints the bytes tracemalloc counts per
+instance. Also times to_dict, which replaced reading __dict__.
+
+    python benchmarks/model_memory.py --instances 100000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from models import Animal, Customer, Employee, Location  # noqa: E402
+
+
+def plain_class(model):
+    """Returns a class with the attributes of a model in a __dict__"""
+
+    class Plain:
+        def __init__(self, *args):
+            for (name, value) in zip(model.__slots__, args):
+                setattr(self, name, value)
+            for name in model.__slots__[len(args):]:
+                setattr(self, name, None)
+
+    Plain.__name__ = f"Plain{model.__name__}"
+    return Plain
+
+
+# Constructor arguments of instance n of each model
+ARGUMENTS = {
+    Animal: lambda n: (n, f"Animal {n}", "Mutt", "Kennel", 1, 2),
+    Customer: lambda n: (n, f"Customer {n}", "1 Main St", f"c{n}@x.com", "secret"),
+    Employee: lambda n: (n, f"Employee {n}", "1 Main St", 1),
+    Location: lambda n: (n, f"Location {n}", "1 Main St"),
+}
+
+
+def measure(cls, arguments, instances):
+    """Returns the bytes allocated for the instances, less their arguments"""
+    values = [arguments(n) for n in range(instances)]
+    tracemalloc.start()
+    objects = [cls(*args) for args in values]
+    (size, _) = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del objects
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instances", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{args.instances} instances")
+    print(
+        f"{'model':<10}{'__dict__ MB':>12}{'slots MB':>10}{'dict B':>8}"
+        f"{'slots B':>9}{'to_dict us':>12}"
+    )
+    for (model, arguments) in ARGUMENTS.items():
+        plain = measure(plain_class(model), arguments, args.instances)
+        slots = measure(model, arguments, args.instances)
+
+        objects = [model(*arguments(n)) for n in range(args.instances)]
+        started = time.perf_counter()
+        for item in objects:
+            item.to_dict()
+        to_dict = (time.perf_counter() - started) / args.instances * 1e6
+
+        print(
+            f"{model.__name__:<10}{plain / 2**20:>12.1f}{slots / 2**20:>10.1f}"
+            f"{plain / args.instances:>8.0f}{slots / args.instances:>9.0f}"
+            f"{to_dict:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""Checks that ?_expand= and ?_embed= cost a fixed number of queries
+
+Runs GET requests through routes.get on a copy of kennel.sqlite3, traces
+the SQL the connection executes and compares the number of SELECTs with
+what each request should cost: one for the rows, plus one IN query per
+relation, however many rows the page has. Exits with 1 on a mismatch.
+
+    python benchmarks/query_count.py --animals 2000
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+from routes import get, parse_url  # noqa: E402
+
+# (path, SELECT statements expected)
+CHECKS = [
+    ("/animals", 1),
+    ("/animals?_expand=location", 2),
+    ("/animals?_expand=location,customer", 3),
+    ("/animals?status=Kennel&_expand=location,customer&limit=100", 3),
+    ("/animals?fields=name&_expand=customer&_sortBy=name&limit=50", 2),
+    ("/animals/1?_expand=location,customer", 3),
+    ("/employees?_expand=location", 2),
+    ("/employees?location_id=1&_expand=location", 2),
+    ("/locations?_embed=animals", 2),
+    ("/locations/1?_embed=animals", 2),
+    ("/customers?_embed=animals", 2),
+    ("/customers?fields=name&_embed=animals", 2),
+]
+
+
+def add_animals(path, animals):
+    """Adds animals spread over the existing locations and customers"""
+    conn = sqlite3.connect(path)
+    locations = [row[0] for row in conn.execute("SELECT id FROM Location")]
+    customers = [row[0] for row in conn.execute("SELECT id FROM Customer")]
+    conn.executemany(
+        "INSERT INTO Animal (name, status, breed, customer_id, location_id) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                f"Animal {n}",
+                "Kennel",
+                "Mutt",
+                customers[n % len(customers)],
+                locations[n % len(locations)],
+            )
+            for n in range(animals)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def count_selects(path):
+    (resource, id, query) = parse_url(path)
+    with db.trace_statements() as statements:
+        response = get(resource, id, query)
+    if response.status != 200:
+        raise RuntimeError(f"GET {path} answered {response.status}")
+    return sum(1 for sql in statements if sql.lstrip().upper().startswith("SELECT"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--animals", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "kennel.sqlite3")
+        shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+        migrations.migrate(path)
+        add_animals(path, args.animals)
+        db.configure(path=path)
+
+        failures = 0
+        print(f"{'path':<64}{'expected':>10}{'ran':>6}")
+        for (path, expected) in CHECKS:
+            ran = count_selects(path)
+            print(f"{path:<64}{expected:>10}{ran:>6}")
+            if ran != expected:
+                failures += 1
+        db.close_all()
+
+    if failures:
+        print(f"{failures} of {len(CHECKS)} requests ran an unexpected number of queries")
+        sys.exit(1)
+    print(f"All {len(CHECKS)} requests ran the expected number of queries")
+
+
+if __name__ == "__main__":
+    main()
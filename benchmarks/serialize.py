@@ -0,0 +1,111 @@
+"""Time to turn rows into a JSON response body, through the models and
+through RowEncoder
+
+For each row count, fills a copy of kennel.sqlite3 with that many animals,
+fetches ANIMAL_SQL and ALL_ANIMALS_SQL once and encodes the rows both ways:
+sqlite3.Row -> Animal -> to_dict -> json.dumps -> bytes, the path of
+responses with relations, and RowEncoder.encode. Also checks that both write
+the same bytes.
+
+    python benchmarks/serialize.py --rows 10000,100000,1000000
+"""
+import argparse
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from views.animal_requests import (  # noqa: E402
+    ALL_ANIMALS_SQL,
+    ANIMAL_ENCODER,
+    ANIMAL_SQL,
+    ANIMAL_WITH_RELATIONS_ENCODER,
+)
+
+QUERIES = {
+    "flat": (ANIMAL_SQL, ANIMAL_ENCODER),
+    "joined": (ALL_ANIMALS_SQL, ANIMAL_WITH_RELATIONS_ENCODER),
+}
+
+
+def build_database(path, animals):
+    """Copies kennel.sqlite3 and replaces its animals with the given number
+    of them, spread over the existing locations and customers"""
+    shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+    conn = sqlite3.connect(path)
+    locations = [row[0] for row in conn.execute("SELECT id FROM Location")]
+    customers = [row[0] for row in conn.execute("SELECT id FROM Customer")]
+    conn.execute("DELETE FROM Animal")
+    conn.executemany(
+        "INSERT INTO Animal (name, status, breed, customer_id, location_id) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                f"Animal {n}",
+                "Kennel",
+                "Mutt",
+                customers[n % len(customers)],
+                locations[n % len(locations)],
+            )
+            for n in range(animals)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def best_of(repeat, function):
+    """Returns the fastest of some runs, and what the function returned"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = function()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return (best, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", default="10000,100000,1000000")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(
+        f"{'rows':>9} {'query':<8}{'fetch s':>9}{'models s':>10}"
+        f"{'encoder s':>11}{'speedup':>9}"
+    )
+    for rows in (int(value) for value in args.rows.split(",")):
+        with tempfile.TemporaryDirectory() as workdir:
+            path = os.path.join(workdir, "kennel.sqlite3")
+            build_database(path, rows)
+            conn = sqlite3.connect(path)
+            conn.row_factory = sqlite3.Row
+
+            for (name, (sql, encoder)) in QUERIES.items():
+                (fetch, dataset) = best_of(
+                    args.repeat, lambda: conn.execute(sql).fetchall()
+                )
+                (models, expected) = best_of(
+                    args.repeat,
+                    lambda: json.dumps([encoder.to_dict(row) for row in dataset]).encode(),
+                )
+                (direct, body) = best_of(args.repeat, lambda: encoder.encode(dataset))
+                if body != expected:
+                    raise RuntimeError(f"{name}: RowEncoder wrote different JSON")
+                print(
+                    f"{rows:>9} {name:<8}{fetch:>9.3f}{models:>10.3f}"
+                    f"{direct:>11.3f}{models / direct:>8.1f}x"
+                )
+                del dataset, expected, body
+            conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Identical GETs arriving together, answered one by one and coalesced by
+the single-flight layer of routes.cached_get
+
+--clients threads each GET /animals and /employees at the same moment,
+--rounds times, on a migrated copy of kennel.sqlite3 with --rows animals
+added. The response cache is off, so every round misses it as it would
+right after a write. The run with dispatch(cached=False) is the path
+without coalescing.
+
+    python benchmarks/single_flight.py --clients 1,16,64 --rows 10000
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cache  # noqa: E402
+import db  # noqa: E402
+import migrations  # noqa: E402
+import routes  # noqa: E402
+from views import create_animals  # noqa: E402
+
+PATHS = ("/animals", "/employees")
+
+
+def animal(n):
+    return {
+        "name": f"Animal {n}",
+        "breed": "Mutt",
+        "status": "Kennel",
+        "location_id": n % 2 + 1,
+        "customer_id": n % 4 + 1,
+    }
+
+
+def requests_per_second(clients, rounds, cached):
+    """Returns the GETs per second answered when clients send them at once"""
+    start = threading.Barrier(clients)
+
+    def client():
+        for _ in range(rounds):
+            start.wait()
+            for path in PATHS:
+                response = routes.dispatch("GET", path, cached=cached)
+                assert response.status == 200, response.status
+
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return clients * rounds * len(PATHS) / (time.perf_counter() - started)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--clients", default="1,16,64")
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--rows", type=int, default=10000)
+    args = parser.parse_args()
+    client_counts = [int(value) for value in args.clients.split(",")]
+
+    workdir = tempfile.mkdtemp()
+    try:
+        path = os.path.join(workdir, "kennel.sqlite3")
+        shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+        migrations.migrate(path)
+        db.configure(path=path)
+        create_animals([animal(n) for n in range(args.rows)])
+        cache.configure(ttl=0)
+        # Both runs read the rows' JSON from a warm fragment cache
+        for target in PATHS:
+            routes.dispatch("GET", target)
+
+        print(f"GETs/s, {args.rows} animals added, {args.rounds} rounds")
+        print(f"{'':<12}" + "".join(f"{n:>9} c" for n in client_counts))
+        for (label, cached) in (("one by one", False), ("coalesced", True)):
+            rates = [
+                requests_per_second(clients, args.rounds, cached)
+                for clients in client_counts
+            ]
+            print(f"{label:<12}" + "".join(f"{rate:>11.0f}" for rate in rates))
+        print(cache.single_flight.stats())
+        db.close_all()
+    finally:
+        shutil.rmtree(workdir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""The same workload run through storage.backend on every storage backend
+
+Adds --rows animals with create_many, then times retrieve, update and
+delete of random ids, create, and all() filtered by customer (1 in 100
+rows), the calls server.py and the routes make. The sqlite backend runs on
+a migrated copy of kennel.sqlite3.
+
+    python benchmarks/storage_backends.py --rows 100000 --ops 2000
+
+Whole servers are compared with the load test, one backend at a time:
+
+    python benchmarks/load_test.py --modes pool --server-args '--storage memory'
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import db  # noqa: E402
+import migrations  # noqa: E402
+import storage  # noqa: E402
+
+
+def animal(n):
+    return {
+        "name": f"Animal {n}",
+        "breed": "Mutt",
+        "status": "Kennel",
+        "location_id": n % 2 + 1,
+        "customer_id": n % 4 + 1,
+    }
+
+
+def per_second(function, arguments):
+    """Returns how many calls of the function run in a second"""
+    started = time.perf_counter()
+    for args in arguments:
+        function(*args)
+    return len(arguments) / (time.perf_counter() - started)
+
+
+def run(backend, rows, ops):
+    """Times each operation on a backend holding the seed rows"""
+    started = time.perf_counter()
+    ids = backend.create_many("animals", [animal(n) for n in range(rows)])
+    loaded = rows / (time.perf_counter() - started)
+
+    random.seed(1)
+    picked = random.sample(ids, ops)
+    return {
+        "create_many": loaded,
+        "retrieve": per_second(backend.retrieve, [(id, "animals") for id in picked]),
+        "update": per_second(
+            backend.update, [(id, animal(id), "animals") for id in picked]
+        ),
+        "all filtered": per_second(
+            backend.all,
+            [("animals", {"customer_id": [str(n % 4 + 1)]}) for n in range(10)],
+        ),
+        "create": per_second(backend.create, [("animals", animal(n)) for n in range(ops)]),
+        "delete": per_second(backend.delete, [(id, "animals") for id in picked]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--ops", type=int, default=2000)
+    parser.add_argument("--backends", default=",".join(sorted(storage.BACKENDS)))
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "kennel.sqlite3")
+        shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+        migrations.migrate(path)
+        db.configure(path=path)
+        for name in args.backends.split(","):
+            results[name] = run(storage.configure(name), args.rows, args.ops)
+        db.close_all()
+
+    names = list(results)
+    print(f"{args.rows} animals, {args.ops} calls each, calls per second")
+    print(f"{'operation':<14}" + "".join(f"{name:>12}" for name in names))
+    for operation in results[names[0]]:
+        print(
+            f"{operation:<14}"
+            + "".join(f"{results[name][operation]:>12.0f}" for name in names)
+        )
+
+
+if __name__ == "__main__":
+    main()
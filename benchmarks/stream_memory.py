@@ -0,0 +1,145 @@
+"""Peak memory of the server answering GET /animals, buffered and streamed
+
+Fills a copy of kennel.sqlite3 with a million animals, starts
+request_handler.py on it once per mode, downloads the whole collection and
+prints the server's peak resident memory (VmHWM, so Linux only). The NDJSON
+export, GET /export/animals, is measured as a third mode.
+
+    python benchmarks/stream_memory.py --animals 1000000
+"""
+import argparse
+import http.client
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "buffered": "/animals",
+    "streamed": "/animals?_stream=true",
+    "export": "/export/animals",
+}
+
+
+def build_database(path, animals):
+    """Copies kennel.sqlite3 and replaces its animals with the given number
+    of them, spread over the existing locations and customers"""
+    shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+    conn = sqlite3.connect(path)
+    locations = [row[0] for row in conn.execute("SELECT id FROM Location")]
+    customers = [row[0] for row in conn.execute("SELECT id FROM Customer")]
+    conn.execute("DELETE FROM Animal")
+    conn.executemany(
+        "INSERT INTO Animal (name, status, breed, customer_id, location_id) "
+        "VALUES (?, ?, ?, ?, ?)",
+        (
+            (
+                f"Animal {n}",
+                "Kennel",
+                "Mutt",
+                customers[n % len(customers)],
+                locations[n % len(locations)],
+            )
+            for n in range(animals)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def peak_rss_kb(pid):
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmHWM:"):
+                return int(line.split()[1])
+    return 0
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            conn.getresponse().read()
+            conn.close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not start on port {port}")
+
+
+def run(mode, path, port, engine):
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(ROOT, "request_handler.py"),
+            "--db", path,
+            "--port", str(port),
+            "--workers", "2",
+            "--engine", engine,
+            "--cache-ttl", "0",
+        ],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        wait_for_port(port)
+        idle = peak_rss_kb(server.pid)
+
+        started = time.perf_counter()
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=600)
+        conn.request("GET", MODES[mode])
+        response = conn.getresponse()
+        received = 0
+        first_byte = None
+        while True:
+            data = response.read(65536)
+            if first_byte is None:
+                first_byte = time.perf_counter() - started
+            if not data:
+                break
+            received += len(data)
+        elapsed = time.perf_counter() - started
+        conn.close()
+
+        peak = peak_rss_kb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(
+        f"{mode:<10}{engine:<10}{received / 2**20:>10.1f}{idle / 1024:>10.1f}"
+        f"{peak / 1024:>10.1f}{first_byte * 1000:>12.0f}{elapsed:>10.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--animals", type=int, default=1000000)
+    parser.add_argument("--modes", default="buffered,streamed")
+    parser.add_argument("--engines", default="threaded,asyncio")
+    parser.add_argument("--port", type=int, default=8095)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        path = os.path.join(workdir, "kennel.sqlite3")
+        build_database(path, args.animals)
+
+        print(f"{args.animals} animals")
+        print(
+            f"{'mode':<10}{'engine':<10}{'body MB':>10}{'idle MB':>10}"
+            f"{'peak MB':>10}{'1st byte ms':>12}{'total s':>10}"
+        )
+        for engine in args.engines.split(","):
+            for mode in args.modes.split(","):
+                run(mode, path, args.port, engine)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Write throughput of the memory backend under each fsync policy, and the
+time it takes to recover from the log and from a snapshot
+
+Writers update random animals through MemoryStorage for --seconds, with no
+data directory (nothing is logged) and with a log under every policy.
+Then --rows animals are created into an empty data directory, a thousand
+per create_many, and the backend is started on it twice: replaying the
+whole log, and after a snapshot. Last, --single-writes updates are logged
+one by one, the most a log holds with the default --snapshot-every, and
+replayed on top of the snapshot.
+
+    python benchmarks/wal.py --writers 1,16 --seconds 3 --rows 1000000
+
+The data directory is made in --tmp, which should be on the disk to
+measure; tmpfs ignores fsync.
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from storage import FSYNC_POLICIES, MemoryStorage  # noqa: E402
+
+
+def animal(n):
+    return {
+        "name": f"Animal {n}",
+        "breed": "Mutt",
+        "status": "Kennel",
+        "location_id": n % 2 + 1,
+        "customer_id": n % 4 + 1,
+    }
+
+
+def throughput(backend, writers, seconds):
+    """Returns the updates per second the writers get through together"""
+    ids = list(backend.database["animals"].rows)
+    deadline = time.perf_counter() + seconds
+    counts = [0] * writers
+
+    def write(number):
+        pick = random.Random(number).choice
+        while time.perf_counter() < deadline:
+            backend.update(pick(ids), animal(number), "animals")
+            counts[number] += 1
+
+    threads = [threading.Thread(target=write, args=(n,)) for n in range(writers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+def timed(function):
+    started = time.perf_counter()
+    result = function()
+    return (time.perf_counter() - started, result)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--writers", default="1,16")
+    parser.add_argument("--seconds", type=float, default=3)
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--single-writes", type=int, default=100000)
+    parser.add_argument("--fsync-batch", type=int, default=100)
+    parser.add_argument("--fsync-interval", type=float, default=1.0)
+    parser.add_argument("--tmp", default=None, help="where to make data directories")
+    args = parser.parse_args()
+    writer_counts = [int(value) for value in args.writers.split(",")]
+
+    print(f"updates/s over {args.seconds:g} s")
+    print(
+        f"{'fsync':<10}" + "".join(f"{n:>9} w" for n in writer_counts)
+        + f"{'fsyncs':>9}"
+    )
+    for policy in (None,) + FSYNC_POLICIES:
+        rates = []
+        fsyncs = 0
+        for writers in writer_counts:
+            workdir = tempfile.mkdtemp(dir=args.tmp)
+            backend = MemoryStorage(
+                data_dir=None if policy is None else workdir,
+                fsync=policy or "always",
+                fsync_batch=args.fsync_batch,
+                fsync_interval=args.fsync_interval,
+                snapshot_every=0,
+            )
+            rates.append(throughput(backend, writers, args.seconds))
+            if backend.wal is not None:
+                fsyncs = backend.wal.fsyncs
+                backend.wal.close()
+            shutil.rmtree(workdir)
+        print(
+            f"{policy or 'no log':<10}" + "".join(f"{rate:>11.0f}" for rate in rates)
+            + f"{fsyncs:>9}"
+        )
+
+    workdir = tempfile.mkdtemp(dir=args.tmp)
+    try:
+        backend = MemoryStorage(data_dir=workdir, fsync="batched", snapshot_every=0)
+        for start in range(0, args.rows, 1000):
+            stop = min(start + 1000, args.rows)
+            backend.create_many("animals", [animal(n) for n in range(start, stop)])
+        backend.wal.close()
+        log_bytes = os.path.getsize(backend.wal.path)
+
+        (replay, recovered) = timed(
+            lambda: MemoryStorage(data_dir=workdir, snapshot_every=0)
+        )
+        (snapshot, _) = timed(recovered.snapshot)
+        recovered.wal.close()
+        (load, loaded) = timed(lambda: MemoryStorage(data_dir=workdir))
+        loaded.wal.close()
+
+        backend = MemoryStorage(data_dir=workdir, fsync="interval", snapshot_every=0)
+        for n in range(args.single_writes):
+            backend.update(n % args.rows + 1, animal(n), "animals")
+        backend.wal.close()
+        (replay_single, _) = timed(lambda: MemoryStorage(data_dir=workdir))
+    finally:
+        shutil.rmtree(workdir)
+
+    print(f"\nrecovery of {args.rows} animals")
+    print(f"replaying the log ({log_bytes / 2**20:.0f} MB){replay:>14.2f} s")
+    print(f"writing a snapshot{snapshot:>23.2f} s")
+    print(f"loading the snapshot{load:>21.2f} s")
+    print(f"the snapshot + {args.single_writes} updates{replay_single:>10.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,306 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Collections whose responses embed rows of another resource. A write to a
+# location has to drop cached /animals and /employees responses as well,
+# because each animal and employee carries its location.
+EMBEDDED_IN = {
+    "locations": ("animals", "employees"),
+    "customers": ("animals",),
+}
+
+
+def cache_key(resource, id, query):
+    """Builds the key of a GET: the resource, the id and the query parameters
+    in a fixed order, so ?a=1&b=2 and ?b=2&a=1 share an entry"""
+    return (
+        resource,
+        id,
+        tuple(sorted((name, tuple(values)) for (name, values) in query.items())),
+    )
+
+
+class ResponseCache:
+    """An in-process LRU cache with a time to live for GET responses
+
+    Args:
+        max_entries (number): responses kept before the least recently used
+            one is evicted. 0 turns the cache off
+        ttl (number): seconds a response may be served from the cache
+    """
+
+    def __init__(self, max_entries=512, ttl=5.0, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> (expires at, version, value)
+        self._keys_by_resource = {}  # resource -> set of keys
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.stale = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key, version=None):
+        """Returns the cached value, or None on a miss
+
+        Args:
+            key (tuple): built by cache_key()
+            version (any): the data version the caller is reading. An entry
+                stored under another version is stale and counts as a miss,
+                which catches writes made by other processes
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            (expires, stored_version, value) = entry
+            if expires <= self._clock():
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            if stored_version != version:
+                self._remove(key)
+                self.stale += 1
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value, version=None):
+        """Stores a value under a key built by cache_key() and the data
+        version it was read at"""
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (self._clock() + self.ttl, version, value)
+            self._keys_by_resource.setdefault(key[0], set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def invalidate(self, resource):
+        """Drops the entries of a resource and of every collection embedding it"""
+        with self._lock:
+            for name in (resource,) + EMBEDDED_IN.get(resource, ()):
+                for key in self._keys_by_resource.pop(name, ()):
+                    del self._entries[key]
+                    self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_by_resource.clear()
+
+    def stats(self):
+        """Returns the counters, e.g. for GET /stats"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "stale": self.stale,
+                "invalidations": self.invalidations,
+            }
+
+    def _remove(self, key):
+        del self._entries[key]
+        keys = self._keys_by_resource.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_resource[key[0]]
+
+
+# Bytes counted for a fragment besides its text: the key tuple, the string
+# header and the OrderedDict link
+FRAGMENT_OVERHEAD = 200
+
+
+class FragmentCache:
+    """An in-process LRU cache of the JSON text of single rows, so a
+    collection response only encodes the rows that changed since the last
+    one. The key holds the row's id and version, read with the row, so a
+    changed row misses and its old text simply ages out; nothing has to be
+    invalidated, and writes by other processes are picked up too.
+
+    Args:
+        max_bytes (number): text kept before the least recently used
+            fragments are evicted, with FRAGMENT_OVERHEAD per fragment.
+            0 turns the cache off
+    """
+
+    def __init__(self, max_bytes=64 * 2**20):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> JSON text
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get_many(self, keys):
+        """Returns the fragment of every key, None for the ones not cached
+
+        Args:
+            keys (list): tuples that start with the shape of the JSON and
+                hold the row's id and versions
+        """
+        get = self._entries.get
+        touch = self._entries.move_to_end
+        with self._lock:
+            found = [get(key) for key in keys]
+            for (key, fragment) in zip(keys, found):
+                if fragment is not None:
+                    touch(key)
+            misses = found.count(None)
+            self.misses += misses
+            self.hits += len(found) - misses
+        return found
+
+    def put_many(self, items):
+        """Stores (key, fragment) pairs, evicting the least recently used
+        fragments once the cache is over max_bytes"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for (key, fragment) in items:
+                old = self._entries.pop(key, None)
+                if old is not None:
+                    self.size -= len(old) + FRAGMENT_OVERHEAD
+                self._entries[key] = fragment
+                self.size += len(fragment) + FRAGMENT_OVERHEAD
+            while self.size > self.max_bytes and self._entries:
+                (_, fragment) = self._entries.popitem(last=False)
+                self.size -= len(fragment) + FRAGMENT_OVERHEAD
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self):
+        """Returns the counters, e.g. for GET /stats"""
+        with self._lock:
+            return {
+                "fragments": len(self._entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class Flight:
+    """One execution that requests with the same key wait on"""
+
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Runs a function once for every caller that asks for the same key
+    while it is running: the first caller runs it, the others wait and get
+    the same result, or the same exception. Nothing is kept afterwards, a
+    caller that comes once it has finished runs it again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> Flight
+        self.executions = 0
+        self.coalesced = 0
+
+    def do(self, key, function):
+        """Returns function(), run by this caller or by the one already
+        running it for key
+
+        Args:
+            key (tuple): e.g. built by cache_key(), with the data version
+            function (function): called without arguments
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight()
+                self.executions += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = function()
+        except BaseException as ex:
+            flight.error = ex
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+        return flight.result
+
+    def stats(self):
+        """Returns the counters, e.g. for GET /stats"""
+        with self._lock:
+            return {
+                "in_flight": len(self._flights),
+                "executions": self.executions,
+                "coalesced": self.coalesced,
+            }
+
+
+response_cache = ResponseCache()
+fragment_cache = FragmentCache()
+single_flight = SingleFlight()
+
+
+def configure(max_entries=None, ttl=None, fragment_bytes=None):
+    """Replaces the shared caches with ones of another size or ttl"""
+    global response_cache, fragment_cache
+    response_cache = ResponseCache(
+        response_cache.max_entries if max_entries is None else max_entries,
+        response_cache.ttl if ttl is None else ttl,
+    )
+    if fragment_bytes is not None:
+        fragment_cache = FragmentCache(fragment_bytes)
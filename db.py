@@ -0,0 +1,521 @@
+import functools
+import os
+import queue
+import random
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_DB_PATH = "./kennel.sqlite3"
+
+# Pragmas applied to every new connection. "default" leaves sqlite's own
+# settings (rollback journal), which is what kennel.sqlite3 has always used.
+# "concurrent" is meant for the thread pool, asyncio and pre-fork modes: with
+# WAL, readers keep reading the last committed snapshot while a writer commits
+# instead of waiting for its exclusive lock.
+PRAGMA_PROFILES = {
+    "default": {},
+    "concurrent": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",  # WAL stays consistent, fsync only at checkpoints
+        "cache_size": -16000,  # negative means KiB, so 16MB of page cache
+        "mmap_size": 134217728,  # read up to 128MB through the page cache map
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # ms to wait for a lock before "database is locked"
+    },
+}
+
+PRAGMA_NAMES = (
+    "journal_mode",
+    "synchronous",
+    "cache_size",
+    "mmap_size",
+    "temp_store",
+    "busy_timeout",
+    "foreign_keys",
+    "wal_autocheckpoint",
+)
+
+# Bounded retry for writes that still hit a lock after busy_timeout
+RETRY_ATTEMPTS = 5
+RETRY_BASE_DELAY = 0.01
+RETRY_MAX_DELAY = 0.5
+
+
+class ConnectionManager:
+    """Keeps one long-lived sqlite connection per thread, so requests stop
+    paying for opening the file, parsing the schema and compiling the same
+    statements on every call. sqlite's statement cache lives on the
+    connection and is reused across requests served by the same thread.
+
+    Args:
+        path (string): the database file
+        cached_statements (number): compiled statements kept per connection
+        pragmas (dict): pragma name -> value, run on every new connection
+    """
+
+    def __init__(self, path=DEFAULT_DB_PATH, cached_statements=256, pragmas=None):
+        self.path = path
+        self.cached_statements = cached_statements
+        self.pragmas = dict(pragmas or {})
+        for (name, value) in self.pragmas.items():
+            if name not in PRAGMA_NAMES:
+                raise ValueError(f"Unsupported pragma {name}")
+            if not re.fullmatch(r"-?\w+", str(value)):
+                raise ValueError(f"Invalid value for pragma {name}: {value}")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = {}  # thread ident -> connection
+
+    def get(self):
+        """Returns this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Works like `with sqlite3.connect(path) as conn`: commits when the
+        block succeeds, rolls back when it raises, but keeps the connection.
+        Inside transaction() it leaves both to the transaction."""
+        conn = self.get()
+        if getattr(self._local, "in_transaction", False):
+            yield conn
+            return
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+
+    @contextmanager
+    def transaction(self, immediate=True):
+        """Runs a block in one transaction: the connection() blocks of the
+        views it calls share it instead of committing one by one. Commits
+        when the block succeeds, rolls back when it raises. A transaction()
+        inside another one joins it.
+
+        Args:
+            immediate (bool): take the write lock up front, so a write in
+                the middle of the block cannot fail on a lock held by
+                another connection
+        """
+        conn = self.get()
+        if getattr(self._local, "in_transaction", False):
+            yield conn
+            return
+        conn.execute("BEGIN IMMEDIATE" if immediate else "BEGIN")
+        self._local.in_transaction = True
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            self._local.in_transaction = False
+
+    @contextmanager
+    def savepoint(self, name):
+        """Runs part of a transaction() that is undone on its own when the
+        block raises, leaving the rest of the transaction as it was"""
+        conn = self.get()
+        conn.execute(f"SAVEPOINT {name}")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute(f"ROLLBACK TO {name}")
+            raise
+        finally:
+            conn.execute(f"RELEASE {name}")
+
+    def in_transaction(self):
+        """Tells whether this thread is inside a transaction() block"""
+        return getattr(self._local, "in_transaction", False)
+
+    def health_check(self):
+        """Returns True when this thread's connection can run a query"""
+        try:
+            return self.get().execute("SELECT 1").fetchone()[0] == 1
+        except sqlite3.Error:
+            self._discard()
+            return False
+
+    def close_all(self):
+        """Closes every connection the manager has handed out"""
+        with self._lock:
+            connections = list(self._connections.values())
+            self._connections.clear()
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def open_detached(self):
+        """Opens a connection of no thread's own, e.g. for a stream that is
+        read a piece at a time by whichever thread is free. The caller
+        closes it."""
+        return self._connect()
+
+    @contextmanager
+    def using(self, conn):
+        """Makes connection() and transaction() of this thread use conn
+        inside the block, e.g. one from open_detached()"""
+        previous = getattr(self._local, "conn", None)
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = previous
+
+    def _connect(self):
+        # check_same_thread is off so close_all() can close connections from
+        # the thread that shuts the server down, and a detached connection
+        # can move between threads. A connection is still used by one thread
+        # at a time.
+        conn = sqlite3.connect(
+            self.path,
+            cached_statements=self.cached_statements,
+            check_same_thread=False,
+        )
+        conn.row_factory = sqlite3.Row
+        for (name, value) in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _open(self):
+        conn = self._connect()
+        with self._lock:
+            self._close_orphans()
+            self._connections[threading.get_ident()] = conn
+        return conn
+
+    def _discard(self):
+        """Drops this thread's connection so the next call opens a new one"""
+        conn = getattr(self._local, "conn", None)
+        self._local.conn = None
+        with self._lock:
+            self._connections.pop(threading.get_ident(), None)
+        if conn is not None:
+            conn.close()
+
+    def _close_orphans(self):
+        """Closes connections left behind by threads that have exited"""
+        alive = {thread.ident for thread in threading.enumerate()}
+        for ident in [ident for ident in self._connections if ident not in alive]:
+            self._connections.pop(ident).close()
+
+
+_manager = ConnectionManager(
+    os.environ.get("KENNEL_DB", DEFAULT_DB_PATH),
+    pragmas=PRAGMA_PROFILES[os.environ.get("KENNEL_PRAGMA_PROFILE", "default")],
+)
+
+
+def configure(path=None, cached_statements=None, pragmas=None):
+    """Points the shared manager at another database file, statement cache
+    size or pragma set. Connections that are already open are closed."""
+    global _manager
+    _manager.close_all()
+    _manager = ConnectionManager(
+        path or _manager.path,
+        cached_statements or _manager.cached_statements,
+        _manager.pragmas if pragmas is None else pragmas,
+    )
+
+
+def pragma_profile(name, overrides=None):
+    """Returns the pragmas of a profile in PRAGMA_PROFILES with overrides applied
+
+    Args:
+        name (string): a key of PRAGMA_PROFILES
+        overrides (list): "name=value" strings, e.g. ["busy_timeout=10000"]
+    """
+    pragmas = dict(PRAGMA_PROFILES[name])
+    for override in overrides or ():
+        (key, _, value) = override.partition("=")
+        pragmas[key.strip()] = value.strip()
+    return pragmas
+
+
+def is_lock_error(ex):
+    """Tells lock contention apart from other OperationalErrors"""
+    message = str(ex).lower()
+    return "locked" in message or "busy" in message
+
+
+def retry_on_locked(function):
+    """Decorator for view functions that write. A write that still finds the
+    database locked after busy_timeout is rolled back by connection() and
+    tried again after an exponential, jittered backoff, RETRY_ATTEMPTS times
+    at most."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        for attempt in range(RETRY_ATTEMPTS):
+            try:
+                return function(*args, **kwargs)
+            except sqlite3.OperationalError as ex:
+                if not is_lock_error(ex) or attempt == RETRY_ATTEMPTS - 1:
+                    raise
+                backoff(attempt)
+
+    return wrapper
+
+
+def backoff(attempt):
+    """Sleeps before the next try of a write that found the database locked"""
+    delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+    time.sleep(delay * random.uniform(0.5, 1))
+
+
+class PendingWrite:
+    """A write waiting in a WriteQueue, and then its outcome"""
+
+    __slots__ = ("function", "args", "kwargs", "result", "error", "done")
+
+    def __init__(self, function, args, kwargs):
+        self.function = function
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+    def run(self):
+        """Runs the write in a savepoint of the batch's transaction, keeping
+        what it returned or raised for its caller"""
+        try:
+            with savepoint("queued_write"):
+                self.result = self.function(*self.args, **self.kwargs)
+            self.error = None
+        except Exception as ex:
+            self.error = ex
+
+
+class WriteQueue:
+    """Hands the writes of every thread to one writer thread, which commits
+    them in batches. With the default pragmas each commit waits for an
+    fsync, so a batch of writes costs about what one write did. Each write
+    runs in a savepoint, so one that raises is undone alone and only its
+    caller gets the error.
+
+    Args:
+        window (number): seconds the writer waits for more writes after the
+            first one of a batch; 0 commits whatever is queued at once
+        max_batch (number): writes committed in one transaction at most
+    """
+
+    def __init__(self, window=0.002, max_batch=256):
+        self.window = window
+        self.max_batch = max_batch
+        self._lock = threading.Lock()
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self.batches = 0
+        self.writes = 0
+
+    def submit(self, function, *args, **kwargs):
+        """Calls function(*args, **kwargs) on the writer thread and returns
+        what it returned, or raises what it raised, once its batch is
+        committed"""
+        write = PendingWrite(function, args, kwargs)
+        self._start().put(write)
+        write.done.wait()
+        if write.error is not None:
+            raise write.error
+        return write.result
+
+    def close(self):
+        """Commits the writes already queued and stops the writer thread"""
+        with self._lock:
+            (thread, self._thread) = (self._thread, None)
+            if thread is None or self._pid != os.getpid():
+                return
+            self._queue.put(None)
+        thread.join()
+
+    def _start(self):
+        """Returns the queue, starting the writer on first use. A process
+        forked from this one starts a writer of its own."""
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.SimpleQueue()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run,
+                    args=(self._queue,),
+                    name="db-writer",
+                    daemon=True,
+                )
+                self._thread.start()
+            return self._queue
+
+    def _run(self, pending):
+        while True:
+            write = pending.get()
+            if write is None:
+                return
+            batch = [write]
+            deadline = time.monotonic() + self.window
+            while write is not None and len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                try:
+                    write = pending.get(timeout=max(timeout, 0))
+                except queue.Empty:
+                    break
+                if write is not None:
+                    batch.append(write)
+            self._commit(batch)
+            if write is None:
+                return
+
+    def _commit(self, batch):
+        """Runs a batch in one transaction, again from the start when taking
+        the write lock or committing finds the database locked"""
+        for attempt in range(RETRY_ATTEMPTS):
+            try:
+                with transaction():
+                    for write in batch:
+                        write.run()
+                break
+            except Exception as ex:
+                # A failed COMMIT leaves the transaction open
+                conn = _manager.get()
+                if conn.in_transaction:
+                    conn.rollback()
+                retry = isinstance(ex, sqlite3.OperationalError) and is_lock_error(ex)
+                if not retry or attempt == RETRY_ATTEMPTS - 1:
+                    for write in batch:
+                        write.error = ex
+                    break
+                backoff(attempt)
+        self.batches += 1
+        self.writes += len(batch)
+        for write in batch:
+            write.done.set()
+
+
+# The queue queued_write() hands writes to, None to commit each on its own
+_writes = None
+
+
+def configure_writes(window=None, max_batch=256):
+    """Turns on group commit of the views' single row writes, or off with
+    window=None. The writer of the queue it replaces finishes first.
+
+    Args:
+        window (number): seconds to wait for a batch to fill, see WriteQueue
+        max_batch (number): writes committed in one transaction at most
+    """
+    global _writes
+    if _writes is not None:
+        _writes.close()
+    _writes = None if window is None else WriteQueue(window, max_batch)
+    return _writes
+
+
+def queued_write(function):
+    """Decorator for view functions that write one row. While configure_writes()
+    has a queue, the call runs on its writer thread and commits with the
+    writes of other threads. Inside a transaction() it runs right there, as
+    part of that transaction."""
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        writes = _writes
+        if writes is None or _manager.in_transaction():
+            return function(*args, **kwargs)
+        return writes.submit(function, *args, **kwargs)
+
+    return wrapper
+
+
+def database_path():
+    """Returns the database file the shared manager connects to"""
+    return _manager.path
+
+
+def iter_batches(cursor, batch_size=1000):
+    """Yields the rows of an executed cursor in lists of up to batch_size,
+    so only one batch is held in memory"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def iter_rows(cursor, batch_size=1000):
+    """Yields the rows of an executed cursor one by one, fetching batch_size
+    at a time"""
+    for rows in iter_batches(cursor, batch_size):
+        yield from rows
+
+
+@contextmanager
+def trace_statements():
+    """Collects the SQL this thread's connection runs inside the block, e.g.
+    to check that a request costs a fixed number of queries
+
+        with db.trace_statements() as statements:
+            get_all_animals()
+    """
+    statements = []
+    conn = _manager.get()
+    conn.set_trace_callback(statements.append)
+    try:
+        yield statements
+    finally:
+        conn.set_trace_callback(None)
+
+
+def connection():
+    """Context manager for the current thread's connection, used by views/*"""
+    return _manager.connection()
+
+
+def transaction(immediate=True):
+    """One transaction around several views, see ConnectionManager.transaction"""
+    return _manager.transaction(immediate)
+
+
+def savepoint(name):
+    """A part of a transaction() that can fail on its own"""
+    return _manager.savepoint(name)
+
+
+def open_detached():
+    """A connection of no thread's own, see ConnectionManager.open_detached"""
+    return _manager.open_detached()
+
+
+def using(conn):
+    """Runs a block on another connection, see ConnectionManager.using"""
+    return _manager.using(conn)
+
+
+def in_transaction():
+    """Whether this thread is inside a transaction() block, whose reads may
+    see rows that are later rolled back"""
+    return _manager.in_transaction()
+
+
+def health_check():
+    """Returns True when the database answers a query"""
+    return _manager.health_check()
+
+
+def close_all():
+    """Stops the writer of configure_writes() and closes every open
+    connection, called when the server shuts down"""
+    if _writes is not None:
+        _writes.close()
+    _manager.close_all()
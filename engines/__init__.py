@@ -0,0 +1,9 @@
+from .thread_pool import ThreadPoolHTTPServer
+from .prefork import PreforkSupervisor
+from .asyncio_engine import (
+    AsyncHTTPServer,
+    BODYLESS_STATUSES,
+    LAST_CHUNK,
+    close_chunks,
+    encode_chunk,
+)
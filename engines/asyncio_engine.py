@@ -0,0 +1,243 @@
+import asyncio
+import http.client
+import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import formatdate
+from http import HTTPStatus
+
+import db
+
+# Statuses that must not carry a body or a Content-Length
+BODYLESS_STATUSES = (204, 304)
+
+# Ends a response sent with Transfer-Encoding: chunked
+LAST_CHUNK = b"0\r\n\r\n"
+
+
+def encode_chunk(data):
+    """Frames bytes as one chunk of Transfer-Encoding: chunked"""
+    return b"%x\r\n%s\r\n" % (len(data), data)
+
+
+def close_chunks(chunks):
+    """Closes the generator of a streamed body, running the cleanup of the
+    view behind it"""
+    close = getattr(chunks, "close", None)
+    if close is not None:
+        close()
+
+
+class AsyncHTTPServer:
+    """Serves HTTP/1.1 on an asyncio event loop. Connections cost a coroutine
+    instead of a thread, so thousands of idle keep-alive clients are cheap.
+    Requests are answered by the same dispatch function HandleRequests uses,
+    run on a thread pool because the views block on sqlite.
+
+    Args:
+        sock (socket): a bound, listening socket
+        dispatch (function): dispatch(method, path, headers, body) -> Response
+        workers (number): threads available to run dispatch
+        idle_timeout (number): seconds an idle keep-alive connection is kept
+        max_requests_per_connection (number): requests served on one
+            connection before it is closed
+        max_header_bytes (number): largest request line plus headers accepted
+    """
+
+    def __init__(self, sock, dispatch, workers=16, idle_timeout=75,
+                 max_requests_per_connection=1000, max_header_bytes=65536):
+        self.socket = sock
+        self.server_address = sock.getsockname()
+        self.dispatch = dispatch
+        self.idle_timeout = idle_timeout
+        self.max_requests_per_connection = max_requests_per_connection
+        self.max_header_bytes = max_header_bytes
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="kennel-worker"
+        )
+        self._loop = None
+        self._stop = None
+        self._stopped = threading.Event()
+        self._shutdown_requested = False
+        self._connections = {}  # writer -> task serving the connection
+        self._busy = set()
+
+    def serve_forever(self):
+        """Runs the event loop until shutdown() is called"""
+        self._stopped.clear()
+        try:
+            asyncio.run(self._serve())
+        finally:
+            self._stopped.set()
+
+    def shutdown(self):
+        """Stops serve_forever() and waits for it to return. Like
+        socketserver's shutdown() it has to be called from another thread"""
+        self._shutdown_requested = True
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+            self._stopped.wait()
+
+    def server_close(self):
+        """Closes the listening socket and the dispatch threads"""
+        self.socket.close()
+        self._executor.shutdown(wait=True)
+
+    async def _serve(self):
+        self._loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        if self._shutdown_requested:
+            return
+
+        server = await asyncio.start_server(
+            self._handle_connection, sock=self.socket, limit=self.max_header_bytes
+        )
+        async with server:
+            await self._stop.wait()
+
+        # Idle connections are parked in readuntil(); close them. The ones in
+        # the middle of a request finish it and close after the response.
+        for writer in list(self._connections):
+            if writer not in self._busy:
+                writer.close()
+        if self._connections:
+            await asyncio.wait(list(self._connections.values()), timeout=30)
+
+    async def _handle_connection(self, reader, writer):
+        self._connections[writer] = asyncio.current_task()
+        try:
+            served = 0
+            while not self._stop.is_set():
+                served += 1
+                last = served >= self.max_requests_per_connection
+                if not await self._handle_request(reader, writer, last):
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self._connections.pop(writer, None)
+            writer.close()
+
+    async def _handle_request(self, reader, writer, last=False):
+        """Answers one request, returns whether the connection stays open"""
+        try:
+            head = await asyncio.wait_for(
+                reader.readuntil(b"\r\n\r\n"), self.idle_timeout
+            )
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError):
+            return False
+        except asyncio.LimitOverrunError:
+            await self._write_status(writer, 431)
+            return False
+
+        request_line, _, header_block = head.partition(b"\r\n")
+        try:
+            (method, path, version) = request_line.decode("latin-1").split()
+            headers = http.client.parse_headers(io.BytesIO(header_block))
+            content_len = int(headers.get("content-length", 0))
+        except (ValueError, http.client.HTTPException):
+            await self._write_status(writer, 400)
+            return False
+
+        self._busy.add(writer)
+        try:
+            body = await reader.readexactly(content_len) if content_len else b""
+            response = await self._loop.run_in_executor(
+                self._executor, self.dispatch, method, path, headers, body
+            )
+        except Exception:
+            await self._write_status(writer, 500)
+            return False
+        finally:
+            self._busy.discard(writer)
+
+        keep_alive = (
+            self._wants_keep_alive(version, headers)
+            and not last
+            and not self._stop.is_set()
+        )
+
+        if response.chunks is not None:
+            return await self._write_stream(writer, response, version, keep_alive)
+
+        head = self._encode_head(response.status, response.headers,
+                                 len(response.body), keep_alive)
+        # One write for head and body, so they leave in the same segment
+        # instead of the body waiting on the client's delayed ACK
+        if response.status in BODYLESS_STATUSES:
+            writer.write(head)
+        else:
+            writer.write(head + response.body)
+        await writer.drain()
+        return keep_alive
+
+    async def _write_stream(self, writer, response, version, keep_alive):
+        """Sends a response whose body is produced piece by piece. Each chunk
+        is read on an executor thread and written from the event loop, so a
+        slow client holds its connection but no thread while it reads, and
+        one chunk at a time is in memory. The view behind the chunks reads
+        from a sqlite connection of its own, which the thread reading the
+        next chunk uses for that call. Returns whether the connection stays
+        open"""
+        # HTTP/1.0 clients get the raw body, ended by closing the connection
+        chunked = version == "HTTP/1.1"
+        keep_alive = keep_alive and chunked
+        headers = response.headers
+        if chunked:
+            headers = headers + [("Transfer-Encoding", "chunked")]
+        writer.write(self._encode_head(response.status, headers, None, keep_alive))
+
+        conn = db.open_detached()
+
+        def read_chunk():
+            with db.using(conn):
+                return next(response.chunks, None)
+
+        def finish():
+            try:
+                with db.using(conn):
+                    close_chunks(response.chunks)
+            finally:
+                conn.close()
+
+        self._busy.add(writer)
+        try:
+            while True:
+                # Raises what the view raised, before the last chunk is sent
+                data = await self._loop.run_in_executor(self._executor, read_chunk)
+                if data is None:
+                    break
+                writer.write(encode_chunk(data) if chunked else data)
+                await writer.drain()
+            if chunked:
+                writer.write(LAST_CHUNK)
+            await writer.drain()
+        except Exception:
+            # The status line is already out. Closing without the last chunk
+            # tells the client the body is incomplete.
+            return False
+        finally:
+            await self._loop.run_in_executor(self._executor, finish)
+            self._busy.discard(writer)
+        return keep_alive
+
+    def _wants_keep_alive(self, version, headers):
+        connection = (headers.get("connection") or "").lower()
+        if version == "HTTP/1.1":
+            return connection != "close"
+        return connection == "keep-alive"
+
+    def _encode_head(self, status, headers, content_len, keep_alive):
+        lines = [
+            f"HTTP/1.1 {status} {HTTPStatus(status).phrase}",
+            f"Date: {formatdate(usegmt=True)}",
+        ]
+        lines.extend(f"{name}: {value}" for (name, value) in headers)
+        if status not in BODYLESS_STATUSES and content_len is not None:
+            lines.append(f"Content-Length: {content_len}")
+        lines.append("Connection: keep-alive" if keep_alive else "Connection: close")
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _write_status(self, writer, status):
+        writer.write(self._encode_head(status, (), 0, False))
+        await writer.drain()
@@ -0,0 +1,141 @@
+import os
+import signal
+import threading
+import time
+import traceback
+
+# Workers that die sooner than this after starting are restarted with a
+# delay, so a worker that crashes on boot does not turn into a fork loop.
+MIN_WORKER_LIFETIME = 1.0
+RESTART_DELAY = 1.0
+
+
+class PreforkSupervisor:
+    """Starts worker processes that each run their own server on a shared
+    SO_REUSEPORT port, restarts the ones that die and stops them all on
+    SIGTERM or SIGINT
+
+    Args:
+        server_factory (function): called in each worker to build the server.
+            It has to bind with SO_REUSEPORT so every worker can listen on
+            the same port
+        processes (number): how many worker processes to keep running
+        shutdown_timeout (number): seconds to wait for workers to finish
+            their in-flight requests before they are killed
+        cleanup (function): called in each worker after its server closed,
+            e.g. to close database connections
+    """
+
+    def __init__(self, server_factory, processes, shutdown_timeout=30,
+                 cleanup=None):
+        if processes < 1:
+            raise ValueError("processes must be at least 1")
+        if not hasattr(os, "fork"):
+            raise RuntimeError("pre-fork mode needs os.fork()")
+
+        self.server_factory = server_factory
+        self.processes = processes
+        self.shutdown_timeout = shutdown_timeout
+        self.cleanup = cleanup
+        self.workers = {}  # pid -> start time
+        self._stopping = False
+
+    def run(self):
+        """Runs the supervisor loop until it is told to stop"""
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+
+        for _ in range(self.processes):
+            self._spawn()
+
+        while not self._stopping:
+            pid, status = self._reap()
+            if pid is None:
+                time.sleep(0.2)
+                continue
+
+            started = self.workers.pop(pid, time.monotonic())
+            print(f"worker {pid} exited with status {status}, restarting")
+            if time.monotonic() - started < MIN_WORKER_LIFETIME:
+                time.sleep(RESTART_DELAY)
+            if not self._stopping:
+                self._spawn()
+
+        self._stop_workers()
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            # The child must never return into the supervisor's loop, or it
+            # would carry on as a second supervisor
+            code = 1
+            try:
+                code = self._run_worker()
+            except BaseException:
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+
+    def _run_worker(self):
+        """Serves requests in the child process, returns its exit code"""
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        try:
+            server = self.server_factory()
+        except Exception as ex:
+            print(f"worker {os.getpid()} failed to start: {ex}")
+            return 1
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever() to return, so it has to
+            # run on another thread than the one serving
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+
+        try:
+            server.serve_forever()
+        finally:
+            server.server_close()
+            if self.cleanup is not None:
+                self.cleanup()
+        return 0
+
+    def _request_stop(self, signum, frame):
+        self._stopping = True
+
+    def _reap(self):
+        """Collects one exited worker without blocking"""
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            return (None, None)
+        if pid == 0:
+            return (None, None)
+        return (pid, status)
+
+    def _stop_workers(self):
+        """Asks every worker to finish its requests, kills stragglers"""
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.workers and time.monotonic() < deadline:
+            pid, _ = self._reap()
+            if pid is None:
+                time.sleep(0.1)
+            else:
+                self.workers.pop(pid, None)
+
+        for pid in self.workers:
+            try:
+                os.kill(pid, signal.SIGKILL)
+                os.waitpid(pid, 0)
+            except (ProcessLookupError, ChildProcessError):
+                pass
+        self.workers.clear()
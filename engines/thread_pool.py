@@ -0,0 +1,65 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import HTTPServer
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """An HTTPServer that hands every accepted connection to a bounded pool of
+    worker threads instead of serving it on the accept loop
+
+    Args:
+        server_address (tuple): the (host, port) to listen on
+        handler_class (class): the request handler, e.g. HandleRequests
+        workers (number): how many connections are served at the same time
+        backlog (number): how many connections the kernel queues while every
+            worker is busy
+    """
+
+    def __init__(self, server_address, handler_class, workers=16, backlog=128,
+                 bind_and_activate=True):
+        if workers < 1:
+            raise ValueError("workers must be at least 1")
+
+        # listen() reads this when the server is activated
+        self.request_queue_size = backlog
+        self.workers = workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="kennel-worker"
+        )
+        # A connection is only accepted once a worker is free to take it.
+        # Everything else waits in the listen backlog rather than in an
+        # unbounded executor queue.
+        self._free_workers = threading.BoundedSemaphore(workers)
+        super().__init__(server_address, handler_class, bind_and_activate)
+
+    def get_request(self):
+        """Waits for a free worker, then accepts the next connection"""
+        self._free_workers.acquire()
+        try:
+            return super().get_request()
+        except BaseException:
+            self._free_workers.release()
+            raise
+
+    def process_request(self, request, client_address):
+        """Serves the connection on one of the pool's threads"""
+        try:
+            self._executor.submit(self._serve_connection, request, client_address)
+        except RuntimeError:
+            # The pool has been shut down, drop the connection
+            self._free_workers.release()
+            self.shutdown_request(request)
+
+    def _serve_connection(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            self._free_workers.release()
+
+    def server_close(self):
+        """Stops listening and waits for in-flight requests to finish"""
+        super().server_close()
+        self._executor.shutdown(wait=True)
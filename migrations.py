@@ -0,0 +1,307 @@
+"""Schema migrations for kennel.sqlite3
+
+Each migration is a version number, a description and the statements that
+bring the schema from the previous version to this one. The applied version
+is kept in the database's PRAGMA user_version, so the runner only applies
+what is missing. It runs when the server starts, or by hand:
+
+    python migrations.py --db ./kennel.sqlite3 --check
+"""
+import argparse
+import sqlite3
+import sys
+
+import db
+
+TABLES = ("Animal", "Customer", "Employee", "Location")
+
+
+def change_version_triggers(table):
+    """Statements for triggers that bump a table's row in ChangeVersion on
+    every insert, update and delete"""
+    return tuple(
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {table.lower()}_{event.lower()}_change_version
+        AFTER {event} ON {table}
+        BEGIN
+            UPDATE ChangeVersion SET version = version + 1
+            WHERE table_name = '{table}';
+        END
+        """
+        for event in ("INSERT", "UPDATE", "DELETE")
+    )
+
+
+# The clock of updated_at: UTC with milliseconds, e.g. 2024-05-01T12:00:00.000Z,
+# so timestamps sort as text
+NOW = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+
+def updated_at_statements(table):
+    """Statements that add an updated_at column to a table, fill it in for
+    the rows it has and keep it current with triggers. A column added by
+    ALTER TABLE cannot default to the time, so the insert trigger sets it
+    when the INSERT did not."""
+    name = table.lower()
+    return (
+        f"ALTER TABLE {table} ADD COLUMN updated_at TEXT",
+        f"UPDATE {table} SET updated_at = {NOW}",
+        f"CREATE INDEX IF NOT EXISTS {name}_updated_at ON {table} (updated_at)",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_insert_updated_at
+        AFTER INSERT ON {table}
+        WHEN NEW.updated_at IS NULL
+        BEGIN
+            UPDATE {table} SET updated_at = {NOW} WHERE id = NEW.id;
+        END
+        """,
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_update_updated_at
+        AFTER UPDATE ON {table}
+        WHEN NEW.updated_at IS OLD.updated_at
+        BEGIN
+            UPDATE {table} SET updated_at = {NOW} WHERE id = NEW.id;
+        END
+        """,
+    )
+
+
+def row_version_statements(table):
+    """Statements that add a version column to a table, counting the updates
+    of each row. The update trigger of updated_at bumps it as well, so
+    neither costs a second UPDATE."""
+    name = table.lower()
+    return (
+        f"ALTER TABLE {table} ADD COLUMN version INTEGER NOT NULL DEFAULT 0",
+        f"DROP TRIGGER IF EXISTS {name}_update_updated_at",
+        f"""
+        CREATE TRIGGER IF NOT EXISTS {name}_update_row_version
+        AFTER UPDATE ON {table}
+        WHEN NEW.version IS OLD.version
+        BEGIN
+            UPDATE {table} SET version = OLD.version + 1, updated_at = {NOW}
+            WHERE id = NEW.id;
+        END
+        """,
+    )
+
+
+MIGRATIONS = [
+    (
+        1,
+        "Index the columns the list filters and joins search on",
+        (
+            "CREATE INDEX IF NOT EXISTS animal_location_id ON Animal (location_id)",
+            "CREATE INDEX IF NOT EXISTS animal_status ON Animal (status)",
+            "CREATE INDEX IF NOT EXISTS animal_customer_id ON Animal (customer_id)",
+            "CREATE INDEX IF NOT EXISTS employee_location_id ON Employee (location_id)",
+        ),
+    ),
+    (
+        2,
+        "Customer emails are unique, and looked up by GET /customers?email=",
+        ("CREATE UNIQUE INDEX IF NOT EXISTS customer_email ON Customer (email)",),
+    ),
+    (
+        3,
+        "Count changes per table, the ETags of GET responses are built from it",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS ChangeVersion (
+                table_name TEXT NOT NULL PRIMARY KEY,
+                version INTEGER NOT NULL DEFAULT 0
+            )
+            """,
+            "INSERT OR IGNORE INTO ChangeVersion (table_name) VALUES "
+            + ", ".join(f"('{table}')" for table in TABLES),
+        )
+        + sum((change_version_triggers(table) for table in TABLES), ()),
+    ),
+    (
+        4,
+        "Index the columns collections are sorted and prefix matched on",
+        (
+            "CREATE INDEX IF NOT EXISTS animal_breed ON Animal (breed)",
+            "CREATE INDEX IF NOT EXISTS animal_name ON Animal (name)",
+            "CREATE INDEX IF NOT EXISTS customer_name ON Customer (name)",
+            "CREATE INDEX IF NOT EXISTS employee_name ON Employee (name)",
+            "CREATE INDEX IF NOT EXISTS location_name ON Location (name)",
+        ),
+    ),
+    (
+        5,
+        "Record when each row last changed, GET /export?updated_since= reads it",
+        sum((updated_at_statements(table) for table in TABLES), ()),
+    ),
+    (
+        6,
+        "Version every row, the per-row JSON cache is keyed by it",
+        sum((row_version_statements(table) for table in TABLES), ()),
+    ),
+]
+
+# The filter queries of views/*, with the index each one has to search with
+# instead of scanning the table. Keyset pages must also come out of the index
+# in id order, without a temp b-tree sort.
+INDEX_CHECKS = [
+    (
+        "SELECT a.id FROM Animal a WHERE a.location_id = ?",
+        (1,),
+        "animal_location_id",
+    ),
+    ("SELECT a.id FROM Animal a WHERE a.status = ?", ("Kennel",), "animal_status"),
+    (
+        "SELECT a.id FROM Animal a WHERE a.customer_id = ?",
+        (1,),
+        "animal_customer_id",
+    ),
+    (
+        "SELECT e.id FROM Employee e WHERE e.location_id = ?",
+        (1,),
+        "employee_location_id",
+    ),
+    (
+        "SELECT c.id FROM Customer c WHERE c.email = ?",
+        ("mo@silvera.com",),
+        "customer_email",
+    ),
+    (
+        "SELECT a.id FROM Animal a WHERE a.status = ? AND a.id > ? ORDER BY a.id LIMIT ?",
+        ("Kennel", 1, 10),
+        "animal_status",
+    ),
+    (
+        "SELECT e.id FROM Employee e WHERE e.location_id = ? AND e.id > ? "
+        "ORDER BY e.id LIMIT ?",
+        (1, 1, 10),
+        "employee_location_id",
+    ),
+    (
+        "SELECT a.id FROM Animal a WHERE a.breed >= ? AND a.breed < ?",
+        ("Poo", "Poo\U0010ffff"),
+        "animal_breed",
+    ),
+    (
+        "SELECT a.id FROM Animal a WHERE (a.name, a.id) > (?, ?) "
+        "ORDER BY a.name, a.id LIMIT ?",
+        ("Jax", 2, 10),
+        "animal_name",
+    ),
+    (
+        "SELECT a.id FROM Animal a WHERE (a.breed, a.id) < (?, ?) "
+        "ORDER BY a.breed DESC, a.id DESC LIMIT ?",
+        ("Poodle", 4, 10),
+        "animal_breed",
+    ),
+    (
+        "SELECT c.id FROM Customer c ORDER BY c.name, c.id LIMIT ?",
+        (10,),
+        "customer_name",
+    ),
+    (
+        "SELECT a.id FROM Animal a WHERE a.updated_at >= ?",
+        ("2024-01-01T00:00:00.000Z",),
+        "animal_updated_at",
+    ),
+]
+
+
+def current_version(conn):
+    """Returns the last migration applied to the database"""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(path, target=None):
+    """Applies every migration newer than the database's version, each one in
+    its own transaction together with the version bump
+
+    Args:
+        path (string): the database file
+        target (number): stop at this version, defaults to the latest
+
+    Returns:
+        list: the versions that were applied
+    """
+    target = MIGRATIONS[-1][0] if target is None else target
+    applied = []
+
+    conn = sqlite3.connect(path, isolation_level=None)
+    try:
+        for (version, description, statements) in MIGRATIONS:
+            if version > target:
+                break
+
+            # BEGIN IMMEDIATE takes the write lock before reading the version,
+            # so two processes starting at once cannot both apply a migration
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if current_version(conn) >= version:
+                    conn.execute("ROLLBACK")
+                    continue
+                for statement in statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {int(version)}")
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            applied.append(version)
+            print(f"Applied migration {version}: {description}")
+    finally:
+        conn.close()
+
+    return applied
+
+
+def query_plan(conn, sql, params=()):
+    """Returns the detail lines of EXPLAIN QUERY PLAN for a statement"""
+    return [row[-1] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+
+def check_indexes(path):
+    """Runs EXPLAIN QUERY PLAN on every query in INDEX_CHECKS
+
+    Returns:
+        list: (sql, plan) for the queries that do not use their index
+    """
+    conn = sqlite3.connect(path)
+    try:
+        failures = []
+        for (sql, params, index) in INDEX_CHECKS:
+            plan = query_plan(conn, sql, params)
+            uses_index = any(f"INDEX {index}" in detail for detail in plan)
+            sorts = any("TEMP B-TREE" in detail for detail in plan)
+            if not uses_index or sorts:
+                failures.append((sql, plan))
+        return failures
+    finally:
+        conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply kennel schema migrations")
+    parser.add_argument("--db", default=db.database_path())
+    parser.add_argument("--target", type=int, default=None)
+    parser.add_argument(
+        "--check",
+        action="store_true",
+        help="verify with EXPLAIN QUERY PLAN that the filters use their indexes",
+    )
+    args = parser.parse_args(argv)
+
+    migrate(args.db, args.target)
+    conn = sqlite3.connect(args.db)
+    print(f"{args.db} is at version {current_version(conn)}")
+    conn.close()
+
+    if args.check:
+        failures = check_indexes(args.db)
+        for (sql, plan) in failures:
+            print(f"Not served by its index: {sql}\n    {'; '.join(plan)}")
+        if failures:
+            sys.exit(1)
+        print(f"All {len(INDEX_CHECKS)} filter queries use an index")
+
+
+if __name__ == "__main__":
+    main()
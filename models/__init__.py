@@ -2,3 +2,4 @@ from .animal import Animal
 from .location import Location
 from .customer import Customer
 from .employee import Employee
+from .record import Record
@@ -1,4 +1,21 @@
-class Animal():
+from .record import Record
+
+
+class Animal(Record):
+
+    # One slot per attribute instead of a __dict__ per animal. location and
+    # customer hold a Location and a Customer when they are loaded.
+    __slots__ = (
+        "id",
+        "name",
+        "breed",
+        "status",
+        "location_id",
+        "customer_id",
+        "location",
+        "customer",
+    )
+    _records = ("location", "customer")
 
     # Class initializer. It has 5 custom parameters, with the
     # special `self` parameter that every method on a class
@@ -12,6 +29,3 @@ class Animal():
         self.customer_id = customer_id
         self.location = None
         self.customer = None
-
-
-new_animal = Animal(1, "Snickers", "Dog", "Recreation", 1, 4)
\ No newline at end of file
@@ -1,8 +1,13 @@
-class Customer():
+from .record import Record
+
+
+class Customer(Record):
+
+    __slots__ = ("id", "name", "address", "email", "password")
 
     def __init__(self, id, name, address, email = "", password = ""):
         self.id = id
         self.name = name
         self.address = address
         self.email = email
-        self.password = password
\ No newline at end of file
+        self.password = password
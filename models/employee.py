@@ -1,4 +1,11 @@
-class Employee:
+from .record import Record
+
+
+class Employee(Record):
+
+    __slots__ = ("id", "name", "address", "location_id", "location")
+    _records = ("location",)
+
     def __init__(self, id, name, address, location_id):
         self.id = id
         self.name = name
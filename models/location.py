@@ -1,6 +1,11 @@
-class Location():
+from .record import Record
+
+
+class Location(Record):
+
+    __slots__ = ("id", "name", "address")
 
     def __init__(self, id, name, address):
         self.id = id
         self.name = name
-        self.address = address
\ No newline at end of file
+        self.address = address
@@ -0,0 +1,61 @@
+import inspect
+from json import dumps
+
+
+class Record:
+    """Base of the models. A model lists its attributes in __slots__, so an
+    instance holds them in fixed slots instead of a __dict__ of its own, and
+    gets to_dict, to_json and from_row written for exactly those attributes
+    when the class is defined.
+
+    A model names the attributes that hold another model, e.g. the location
+    of an animal, in _records. to_dict turns them into dictionaries too.
+    """
+
+    __slots__ = ()
+    _records = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.to_dict = make_to_dict(cls)
+        cls.from_row = classmethod(make_from_row(cls))
+
+    def to_json(self):
+        """Returns the JSON text of to_dict()"""
+        return dumps(self.to_dict())
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({fields})"
+
+
+def make_to_dict(cls):
+    """Writes to_dict for a model as a dictionary display of its slots, in
+    their order, the way dataclasses writes __init__"""
+    items = []
+    for name in cls.__slots__:
+        if name in cls._records:
+            value = f"None if self.{name} is None else self.{name}.to_dict()"
+        else:
+            value = f"self.{name}"
+        items.append(f"{name!r}: {value}")
+    source = "def to_dict(self):\n    return {" + ", ".join(items) + "}\n"
+    return compile_function(source, "to_dict", cls)
+
+
+def make_from_row(cls):
+    """Writes from_row for a model: the constructor called with the columns
+    named like its parameters"""
+    parameters = list(inspect.signature(cls.__init__).parameters)[1:]
+    arguments = ", ".join(f"row[{name!r}]" for name in parameters)
+    source = f"def from_row(cls, row):\n    return cls({arguments})\n"
+    return compile_function(source, "from_row", cls)
+
+
+def compile_function(source, name, cls):
+    namespace = {}
+    exec(source, {}, namespace)
+    function = namespace[name]
+    function.__qualname__ = f"{cls.__name__}.{name}"
+    function.__doc__ = f"Generated by Record for the slots of {cls.__name__}"
+    return function
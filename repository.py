@@ -1,97 +1,443 @@
-DATABASE = {
+import threading
+
+# The rows of kennel.sql, in the columns of the models, so both storage
+# backends start out the same
+SEED = {
     "animals": [
         {
             "id": 1,
             "name": "Snickers",
-            "species": "Dog",
-            "locationId": 1,
-            "customerId": 4,
-            "status": "Admitted",
+            "breed": "Dalmation",
+            "status": "Recreation",
+            "location_id": 1,
+            "customer_id": 4,
         },
         {
             "id": 2,
-            "name": "Roman",
-            "species": "Dog",
-            "locationId": 1,
-            "customerId": 2,
-            "status": "Admitted",
+            "name": "Jax",
+            "breed": "Beagle",
+            "status": "Treatment",
+            "location_id": 1,
+            "customer_id": 1,
         },
         {
             "id": 3,
-            "name": "Blue",
-            "species": "Cat",
-            "locationId": 2,
-            "customerId": 1,
-            "status": "Admitted",
+            "name": "Falafel",
+            "breed": "Siamese",
+            "status": "Treatment",
+            "location_id": 2,
+            "customer_id": 4,
+        },
+        {
+            "id": 4,
+            "name": "Doodles",
+            "breed": "Poodle",
+            "status": "Kennel",
+            "location_id": 1,
+            "customer_id": 3,
+        },
+        {
+            "id": 5,
+            "name": "Daps",
+            "breed": "Boxer",
+            "status": "Kennel",
+            "location_id": 2,
+            "customer_id": 2,
+        },
+        {
+            "id": 6,
+            "name": "Cleo",
+            "breed": "Poodle",
+            "status": "Kennel",
+            "location_id": 2,
+            "customer_id": 2,
+        },
+        {
+            "id": 7,
+            "name": "Popcorn",
+            "breed": "Beagle",
+            "status": "Kennel",
+            "location_id": 2,
+            "customer_id": 3,
+        },
+        {
+            "id": 8,
+            "name": "Curly",
+            "breed": "Poodle",
+            "status": "Treatment",
+            "location_id": 2,
+            "customer_id": 4,
+        },
+        {
+            "id": 9,
+            "name": "Daps",
+            "breed": "Boxer",
+            "status": "Kennel",
+            "location_id": 2,
+            "customer_id": 2,
         },
     ],
     "locations": [
-        {"id": 1, "name": "Nashville North", "address": "8422 Johnson Pike"},
-        {"id": 2, "name": "Nashville South", "address": "209 Emory Drive"},
+        {"id": 1, "name": "Nashville North", "address": "64 Washington Heights"},
+        {"id": 2, "name": "Nashville South", "address": "101 Penn Ave"},
+    ],
+    "customers": [
+        {
+            "id": 1,
+            "name": "Mo Silvera",
+            "address": "201 Created St",
+            "email": "mo@silvera.com",
+            "password": "password",
+        },
+        {
+            "id": 2,
+            "name": "Bryan Nilsen",
+            "address": "500 Internal Error Blvd",
+            "email": "bryan@nilsen.com",
+            "password": "password",
+        },
+        {
+            "id": 3,
+            "name": "Jenna Solis",
+            "address": "301 Redirect Ave",
+            "email": "jenna@solis.com",
+            "password": "password",
+        },
+        {
+            "id": 4,
+            "name": "Emily Lemmon",
+            "address": "454 Mulberry Way",
+            "email": "emily@lemmon.com",
+            "password": "password",
+        },
+    ],
+    "employees": [
+        {
+            "id": 1,
+            "name": "Madi Peper",
+            "address": "35498 Madison Ave",
+            "location_id": 1,
+        },
+        {"id": 2, "name": "Kristen Norris", "address": "100 Main St", "location_id": 1},
+        {
+            "id": 3,
+            "name": "Meg Ducharme",
+            "address": "404 Unknown Ct",
+            "location_id": 2,
+        },
+        {"id": 4, "name": "Hannah Hall", "address": "204 Empty Ave", "location_id": 1},
     ],
-    "customers": [{"id": 1, "fullName": "Ryan Tanay", "email": "Tanay@gmail.com"}],
-    "employees": [{"id": 1, "name": "Jenna Solis"}],
 }
 
 
-def all(resource):
-    """For GET requests to collection"""
-    return DATABASE[resource]
+# Fields of each resource with a secondary index, value -> ids. They are the
+# fields GET filters on, e.g. ?status=Kennel
+INDEXES = {
+    "animals": ("status", "location_id", "customer_id"),
+    "customers": ("email",),
+    "employees": ("location_id",),
+}
 
+# Fields no two rows of a resource may share, like the unique index on
+# Customer.email. Each one is also in INDEXES, which finds the other row
+UNIQUE = {
+    "customers": ("email",),
+}
 
-def retrieve(id, resource):
-    """For GET requests to a single resource"""
-    requested_data = None
+# Rows of other resources embedded in a retrieved row: the field holding the
+# foreign key, the key it is returned under and the resource it points at
+JOINS = {
+    "animals": (
+        ("location_id", "location", "locations"),
+        ("customer_id", "customer", "customers"),
+    ),
+    "employees": (("location_id", "location", "locations"),),
+}
 
-    for data in DATABASE[resource]:
-        if data["id"] == id:
-            requested_data = data
 
-            if resource == "animals":
+class UniqueError(Exception):
+    """Raised by a write that would give two rows the same value of a unique
+    field. Nothing is changed.
 
-                matching_location = retrieve(requested_data["locationId"], "locations")
-                requested_data["location"] = matching_location
+    Args:
+        field (string): the unique field, e.g. "email"
+        value: the value that is taken
+    """
 
-                matching_customer = retrieve(requested_data["customerId"], "customers")
-                requested_data["customer"] = matching_customer
+    def __init__(self, field, value):
+        super().__init__(f"{field} {value!r} is taken")
+        self.field = field
+        self.value = value
 
-                del requested_data["locationId"]
-                del requested_data["customerId"]
 
-    return requested_data
+class Table:
+    """The rows of one resource in a dict by id, which keeps them in the
+    order they were created, with secondary indexes on some of their fields
 
+    Rows are stored as given and handed out as they are stored, so callers
+    must not change them; replace() swaps a row for a new one instead.
 
-def create(resource, newdata):
-    """For POST requests to a collection"""
+    Args:
+        rows (list): dictionaries with an "id" to start with
+        indexed (tuple): fields to index, e.g. ("status",)
+        next_id (number): the id the next insert gets, by default one more
+            than the largest id of rows
+        version (number): the change version to go on from
+        unique (tuple): indexed fields no two rows may share. insert(),
+            insert_many() and replace() raise UniqueError rather than
+            store a value that is taken; a log being replayed is trusted
+    """
 
-    max_id = DATABASE[resource][-1]["id"]
+    def __init__(self, rows=(), indexed=(), next_id=None, version=0, unique=()):
+        self.indexes = {field: {} for field in indexed}
+        self.unique = unique
+        # Goes up with every write, e.g. for ETags
+        self.version = version
+        self._lock = threading.Lock()
+        self.rows = {row["id"]: row for row in rows}
+        for (field, index) in self.indexes.items():
+            for (id, row) in self.rows.items():
+                index.setdefault(row.get(field), {})[id] = None
+        # Ids are never handed out twice, not even after a delete
+        self.next_id = max(self.rows, default=0) + 1 if next_id is None else next_id
 
-    new_id = max_id + 1
+    def __len__(self):
+        return len(self.rows)
 
-    newdata["id"] = new_id
+    def get(self, id):
+        return self.rows.get(id)
 
-    DATABASE[resource].append(newdata)
+    def all(self):
+        """Returns every row, in id order"""
+        with self._lock:
+            return list(self.rows.values())
 
-    return newdata
+    def find(self, field, value):
+        """Returns the rows whose field holds the value, in id order when the
+        field is indexed"""
+        # Reads hold the lock too, so no write changes the dicts they iterate
+        with self._lock:
+            index = self.indexes.get(field)
+            if index is None:
+                return [row for row in self.rows.values() if row.get(field) == value]
+            return [self.rows[id] for id in index.get(value, ())]
+
+    def where(self, filters):
+        """Returns the rows that hold one of the values of every filter
+
+        Args:
+            filters (dict): field -> list of values, e.g.
+                {"status": ["Kennel", "Treatment"], "location_id": [1]}
+        """
+        rows = None
+        # The indexed fields narrow the rows down, the others are checked
+        fields = sorted(filters, key=lambda field: field not in self.indexes)
+        with self._lock:
+            for field in fields:
+                values = filters[field]
+                if rows is None and field in self.indexes:
+                    index = self.indexes[field]
+                    ids = sorted(
+                        {id for value in values for id in index.get(value, ())}
+                    )
+                    rows = [self.rows[id] for id in ids]
+                else:
+                    wanted = set(values)
+                    rows = [
+                        row for row in (self.rows.values() if rows is None else rows)
+                        if row.get(field) in wanted
+                    ]
+            return list(self.rows.values()) if rows is None else rows
+
+    def insert(self, row):
+        """Stores the row under the next id, which it is given"""
+        with self._lock:
+            self._check_unique([row])
+            row["id"] = self.next_id
+            self.next_id += 1
+            self._add(row)
+            self.version += 1
+        return row
+
+    def insert_many(self, rows):
+        """Stores the rows under the next ids, holding the lock once
+
+        Returns:
+            list: the ids given to the rows, in order
+        """
+        with self._lock:
+            self._check_unique(rows)
+            for row in rows:
+                row["id"] = self.next_id
+                self.next_id += 1
+                self._add(row)
+            self.version += 1
+        return [row["id"] for row in rows]
+
+    def replace(self, id, row):
+        """Stores the row in place of the one with the id
+
+        Returns:
+            bool: whether there was a row with the id
+        """
+        with self._lock:
+            if id not in self.rows:
+                return False
+            self._check_unique([row], id)
+            row["id"] = id
+            self._unindex(self.rows[id])
+            self._add(row)
+            self.version += 1
+        return True
+
+    def restore(self, row):
+        """Stores a row under the id it already has, in place of any row
+        with that id, e.g. when replaying a log"""
+        with self._lock:
+            old = self.rows.get(row["id"])
+            if old is not None:
+                self._unindex(old)
+            self._add(row)
+            self.next_id = max(self.next_id, row["id"] + 1)
+            self.version += 1
+
+    def restore_many(self, rows):
+        """Stores the rows of one insert_many() again, as one change"""
+        with self._lock:
+            for row in rows:
+                old = self.rows.get(row["id"])
+                if old is not None:
+                    self._unindex(old)
+                self._add(row)
+                self.next_id = max(self.next_id, row["id"] + 1)
+            self.version += 1
+
+    def remove(self, id):
+        """Deletes the row with the id
+
+        Returns:
+            bool: whether there was a row with the id
+        """
+        with self._lock:
+            row = self.rows.pop(id, None)
+            if row is None:
+                return False
+            self._unindex(row)
+            self.version += 1
+        return True
+
+    def _check_unique(self, rows, replacing=None):
+        """Raises UniqueError when a row would share a unique field with a
+        stored row other than the one with the id replacing, or with
+        another of the rows"""
+        for field in self.unique:
+            index = self.indexes[field]
+            seen = set()
+            for row in rows:
+                value = row.get(field)
+                if value in seen or any(id != replacing for id in index.get(value, ())):
+                    raise UniqueError(field, value)
+                seen.add(value)
+
+    def _add(self, row):
+        id = row["id"]
+        self.rows[id] = row
+        for (field, index) in self.indexes.items():
+            # A dict of ids rather than a set, so find() keeps id order
+            index.setdefault(row.get(field), {})[id] = None
+
+    def _unindex(self, row):
+        id = row["id"]
+        for (field, index) in self.indexes.items():
+            ids = index.get(row.get(field))
+            if ids is not None:
+                ids.pop(id, None)
+                if not ids:
+                    del index[row.get(field)]
+
+
+class Database:
+    """A Table per resource, and the reads that join them
+
+    Args:
+        seed (dict): resource -> list of rows to start with, which are kept
+            as they are. A copy of SEED when None
+        next_ids (dict): resource -> the id its next insert gets, when it is
+            not one more than the largest id, e.g. after the last row was
+            deleted
+        versions (dict): resource -> the change version its table goes on
+            from, e.g. the one saved with a snapshot
+    """
+
+    def __init__(self, seed=None, next_ids=None, versions=None):
+        if seed is None:
+            seed = {
+                resource: [dict(row) for row in rows]
+                for (resource, rows) in SEED.items()
+            }
+        next_ids = next_ids or {}
+        versions = versions or {}
+        self.tables = {
+            resource: Table(
+                rows,
+                INDEXES.get(resource, ()),
+                next_ids.get(resource),
+                versions.get(resource, 0),
+                UNIQUE.get(resource, ()),
+            )
+            for (resource, rows) in seed.items()
+        }
+
+    def __getitem__(self, resource):
+        return self.tables[resource]
+
+    def retrieve(self, id, resource):
+        """Returns the row with the id, joined, or None"""
+        row = self.tables[resource].get(id)
+        return None if row is None else self.join(resource, row)
+
+    def join(self, resource, row):
+        """Returns a copy of the row with the rows it points at embedded,
+        e.g. the location of an animal. The stored row is left as it is."""
+        joins = JOINS.get(resource)
+        if joins is None:
+            return row
+
+        joined = dict(row)
+        for (field, key, other) in joins:
+            joined[key] = self.tables[other].get(row.get(field))
+        return joined
+
+
+DATABASE = Database()
+
+
+def all(resource):
+    """For GET requests to collection"""
+    return DATABASE[resource].all()
+
+
+def find(resource, field, value):
+    """For GET requests to a collection filtered by one field, e.g.
+    ?status=Kennel"""
+    return DATABASE[resource].find(field, value)
+
+
+def retrieve(id, resource):
+    """For GET requests to a single resource"""
+    return DATABASE.retrieve(id, resource)
+
+
+def create(resource, newdata):
+    """For POST requests to a collection"""
+    return DATABASE[resource].insert(newdata)
 
 
 def update(id, updated_data, resource):
     """For PUT requests to a single resource"""
-    for index, data in enumerate(DATABASE[resource]):
-        if data["id"] == id:
-            # Found the animal. Update the value.
-            DATABASE[resource][index] = updated_data
-            break
+    return DATABASE[resource].replace(id, updated_data)
 
 
 def delete(id, resource):
     """For DELETE requests to a single resource"""
-    data_index = -1
-
-    for index, data in enumerate(DATABASE[resource]):
-        if data["id"] == id:
-            # Found the animal. Store the current index.
-            data_index = index
-
-    if data_index >= 0:
-        DATABASE[resource].pop(data_index)
+    return DATABASE[resource].remove(id)
@@ -1,44 +1,25 @@
-import json
+import argparse
+import os
+import socket
 from http.server import BaseHTTPRequestHandler, HTTPServer
-from urllib.parse import urlparse, parse_qs
-
-# ? These methods are first created in their respective views. They are then imported to init.py and then they are imported to request_handler.py.
-
-from views import (
-    get_all_animals,
-    get_single_animal,
-    get_all_locations,
-    get_single_location,
-    get_all_employees,
-    get_single_employee,
-    get_all_customers,
-    get_single_customer,
-    create_animal,
-    create_location,
-    create_employee,
-    create_customer,
-    delete_animal,
-    delete_location,
-    delete_employee,
-    delete_customer,
-    update_animal,
-    update_customer,
-    update_employee,
-    update_location,
-    get_customer_by_email,
-    get_animal_by_location,
-    get_employee_by_location,
-    get_animal_by_status,
+
+from engines import (
+    AsyncHTTPServer,
+    BODYLESS_STATUSES,
+    LAST_CHUNK,
+    PreforkSupervisor,
+    ThreadPoolHTTPServer,
+    close_chunks,
+    encode_chunk,
 )
-from views.animal_requests import get_animal_by_location
+
+import cache
+import db
+import migrations
+import storage
+from routes import dispatch
 
 
-method_mapper = {
-    "animals": {"single": get_single_animal, "all": get_all_animals},
-    "locations": {"single": get_single_location, "all": get_all_locations},
-    "customers": {"single": get_single_customer, "all": get_all_customers},
-    "employees": {"single": get_single_employee, "all": get_all_employees},
-}
 # Here's a class. It inherits from another class.
 # For now, think of a class as a container for functions that
 # work together for a common purpose. In this case, that
@@ -49,378 +30,374 @@ class HandleRequests(BaseHTTPRequestHandler):
     # ? This is a Docstring it should be at the beginning of all classes and functions
     # ? It gives a description of the class or function
 
-    # replace the parse_url function in the class
-    def parse_url(self, path):
-        """Parse the url into the resource and id"""
-        parsed_url = urlparse(path)
-        path_params = parsed_url.path.split("/")  # ['', 'animals', 1]
-        resource = path_params[1]
-
-        if parsed_url.query:
-            query = parse_qs(parsed_url.query)
-            return (resource, query)
-
-        pk = None
-        try:
-            pk = int(path_params[2])
-        except (IndexError, ValueError):
-            pass
-        return (resource, pk)
-
-    def get_all_or_single(self, resource, id):
-        if id is not None:
-            response = method_mapper[resource]["single"](id)
-
-            if response is not None:
-                self._set_headers(200)
-            else:
-                self._set_headers(404)
-                response = ""
-        else:
-            self._set_headers(200)
-            response = method_mapper[resource]["all"]()
-
-        return response
-
-    # ? Here's a method on the class that overrides the parent's method.
-    # ? It handles any GET request.
+    # ? HTTP/1.1 keeps the connection open between requests, which saves a TCP
+    # ? handshake per request. That only works because every response sends
+    # ? a Content-Length, so the client knows where the body ends.
+    protocol_version = "HTTP/1.1"
+
+    # ? Seconds an idle keep-alive connection may wait for its next request, and
+    # ? how many requests one connection may make before it is closed. make_server
+    # ? copies the server's settings over these.
+    timeout = 5
+    max_requests_per_connection = 100
+
+    # ? The headers and the body go out in separate writes. With Nagle's
+    # ? algorithm on, the body would wait for the client's delayed ACK of the
+    # ? headers (~40ms) on every request of a kept-alive connection.
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        self.timeout = getattr(self.server, "idle_timeout", self.timeout)
+        self.max_requests_per_connection = getattr(
+            self.server, "max_requests_per_connection", self.max_requests_per_connection
+        )
+        self.requests_served = 0
+        super().setup()
 
+    # ? Every verb is answered by routes.dispatch(), which is shared with the
+    # ? asyncio engine. This class only reads the request and writes the response.
     def do_GET(self):
-        self._set_headers(200)
-
-        response = {}
-
-        # Parse URL and store entire tuple in a variable
-        parsed = self.parse_url(self.path)
-
-        # If the path does not include a query parameter, continue with the original if block
-        if "?" not in self.path:
-            (resource, id) = parsed
-
-            if resource == "animals":
-                if id is not None:
-                    response = f"{get_single_animal(id)}"
-                else:
-                    response = f"{get_all_animals()}"
-            elif resource == "customers":
-                if id is not None:
-                    response = f"{get_single_customer(id)}"
-                else:
-                    response = f"{get_all_customers()}"
-            elif resource == "employees":
-                if id is not None:
-                    response = f"{get_single_employee(id)}"
-                else:
-                    response = f"{get_all_employees()}"
-            elif resource == "locations":
-                if id is not None:
-                    response = f"{get_single_location(id)}"
-                else:
-                    response = f"{get_all_locations()}"
-
-        else:  # There is a ? in the path, run the query param functions
-            (resource, query) = parsed
-
-            # see if the query dictionary has an email key
-            if query.get("email") and resource == "customers":
-                response = get_customer_by_email(query["email"][0])
-
-            if query.get("location_id") and resource == "animals":
-                response = get_animal_by_location(query["location_id"][0])
-
-            if query.get("status") and resource == "animals":
-                response = get_animal_by_status(query["status"][0])
-
-            if query.get("location_id") and resource == "employees":
-                response = get_employee_by_location(query["location_id"][0])
-
-        self.wfile.write(response.encode())
-        # response = None
-        # (resource, id) = self.parse_url(self.path)
-        # response = self.get_all_or_single(resource, id)
-        # self.wfile.write(json.dumps(response).encode())
-
-    # def do_GET(self):
-    #     """Handles GET requests to the server"""
-    #     self._set_headers(200)
-    #     response = {}  # Default response
-
-    #     #! Parse the URL and capture the tuple that is returned
-    #     (resource, id) = self.parse_url(self.path)
-
-    #     # ? If the resource is "animals", and
-    #     # ? if id is not None/Null, the response will be get_single_animal(id)
-    #     # ? if the response is not None/Null, the request header will be set to 200.
-    #     # ? if the response is None/Null, the request header will be set to 404. and the response will be a message.
-    #     # ? else, the response will be the return value of the get_all_animals method.
-    #     if resource == "animals":
-    #         if id is not None:
-    #             response = get_single_animal(id)
-
-    #             if response is not None:
-    #                 self._set_headers(200)
-
-    #             if response is None:
-    #                 self._set_headers(404)
-    #                 response = {"message": f"Animal {id} is out playing right now"}
-
-    #         else:
-    #             response = get_all_animals()
-
-    #     # ? If the resource is "locations", and
-    #     # ? if id is not None/Null, the response will be get_single_location(id)
-    #     # ? if the response is not None/Null, the request header will be set to 200.
-    #     # ? if the response is None/Null, the request header will be set to 404. and the response will be a message.
-    #     # ? else, the response will be the return value of the get_all_locations method.
-    #     if resource == "locations":
-    #         if id is not None:
-    #             response = get_single_location(id)
-
-    #             if response is not None:
-    #                 self._set_headers(200)
-
-    #             if response is None:
-    #                 self._set_headers(404)
-    #                 response = {"message": f"Location-{id} doesn't exist"}
-
-    #         else:
-    #             response = get_all_locations()
-
-    #     # ? If the resource is "employees", and
-    #     # ? if id is not None/Null, the response will be get_single_employee(id)
-    #     # ? if the response is not None/Null, the request header will be set to 200.
-    #     # ? if the response is None/Null, the request header will be set to 404. and the response will be a message.
-    #     # ? else, the response will be the return value of the get_all_employees method.
-    #     if resource == "employees":
-    #         if id is not None:
-    #             response = get_single_employee(id)
-
-    #             if response is not None:
-    #                 self._set_headers(200)
-
-    #             if response is None:
-    #                 self._set_headers(404)
-    #                 response = {"message": f"Employee-{id} does not exist"}
-
-    #         else:
-    #             response = get_all_employees()
-
-    #     # ? If the resource is "animals", and
-    #     # ? if id is not None/Null, the response will be get_single_animal(id)
-    #     # ? if the response is not None/Null, the request header will be set to 200.
-    #     # ? if the response is None/Null, the request header will be set to 404. and the response will be a message.
-    #     # ? else, the response will be the return value of the get_all_animals method.
-    #     if resource == "customers":
-    #         if id is not None:
-    #             response = get_single_customer(id)
-
-    #             if response is not None:
-    #                 self._set_headers(200)
-
-    #             if response is None:
-    #                 self._set_headers(404)
-    #                 response = {"message": f"Customer-{id} does not exist"}
-
-    #         else:
-    #             response = get_all_customers()
-
-    #     self.wfile.write(json.dumps(response).encode())
-
-    #! Here's a method on the class that overrides the parent's method.
-    # ? It handles any POST request.
-    def do_POST(self):
-        content_len = int(self.headers.get("content-length", 0))
-        post_body = self.rfile.read(content_len)
-
-        # ? Convert JSON string to a Python dictionary
-        post_body = json.loads(post_body)
-
-        #! Parse the URL
-        (resource, id) = self.parse_url(self.path)
-
-        # ? Initialize new animal
-        new_animal = None
-        # ? Initialize new employee
-        new_employee = None
-        # ? Initialize new location
-        new_location = None
-        # ? Initialize new customer
-        new_customer = None
-
-        # Add a new animal to the list. Don't worry about
-        # the orange squiggle, you'll define the create_animal
-        # function next.
-        # ? Below is the logic for how new resources will be created and added to the API.
-        if resource == "animals":
-            if (
-                "name" in post_body
-                and "breed" in post_body
-                and "location_id" in post_body
-                and "customer_id" in post_body
-                and "status" in post_body
-            ):
-                self._set_headers(201)
-                new_animal = create_animal(post_body)
-
-            else:
-                self._set_headers(400)
-                new_animal = {
-                    "message": f'{"name key is required. Check your data and try again." if "name" not in post_body else ""} {"breed key is required. Check your data and try again. " if "breed" not in post_body else ""} {"location_id key is required. Check your data and try again." if "location_id" not in post_body else ""} {"customer_id key is required. Check your data and try again. " if "customer_id" not in post_body else ""} {"status key is required. Check your data and try again. " if "status" not in post_body else ""}'
-                }
-
-            #! Encode the new animal and send in response
-            self.wfile.write(json.dumps(new_animal).encode())
-
-        # ? If the resource == "locations", and if the "name" key and  "address" key are present in the post_body dictionary, than the request will have a header of 201, and a new location will be created.
-        # ? Else/Otherwise, the request header will be set to 400, and a message will be stored inside of the new location variable. Message is a ternary statement in python. If the "name" key is not in post_body dictionary, then the message will be "name is required", else an empty string will be returned. If the "address" key is not in post_body dictionary, then the message will be "address is required", else an empty string will be returned.
-        if resource == "locations":
-            if "name" in post_body and "address" in post_body:
-                self._set_headers(201)
-                new_location = create_location(post_body)
-
-            else:
-                self._set_headers(400)
-                new_location = {
-                    "message": f'{"name key is required. Check your data and try again." if "name" not in post_body else ""} {"address is required. Check your data and try again." if "address" not in post_body else ""}'
-                }
-
-            #! Encode the new animal and send in response
-            self.wfile.write(json.dumps(new_location).encode())
-
-        # ? If the resource == "employees", and if the "name" key is present in the post_body dictionary, than the request will have a header of 201, and a new employee will be created.
-        # ? Else/Otherwise, the request header will be set to 400, and a message will be stored inside of the new employee variable. Message is a ternary statement in python. If the "name" key is not in post_body dictionary, then the message will be "name is required", else an empty string will be returned.
-        if resource == "employees":
-            if "name" in post_body:
-                self._set_headers(201)
-                new_employee = create_employee(post_body)
-
-            else:
-                self._set_headers(400)
-                new_employee = {
-                    "message": f'{"name key is required. Check your data and try again." if "name" not in post_body else ""}'
-                }
-
-            self.wfile.write(json.dumps(new_employee).encode())
-
-        # ? If the resource == "locations", and if the "name" key and  "address" key are present in the post_body dictionary, than the request will have a header of 201, and a new location will be created.
-        # ? Else/Otherwise, the request header will be set to 400, and a message will be stored inside of the new location variable. Message is a ternary statement in python. If the "name" key is not in post_body dictionary, then the message will be "name is required", else an empty string will be returned. If the "address" key is not in post_body dictionary, then the message will be "address is required", else an empty string will be returned.
-        if resource == "customers":
-            if "fullName" in post_body and "email" in post_body:
-                self._set_headers(201)
-                new_customer = create_customer(post_body)
-
-            else:
-                self._set_headers(400)
-                new_customer = {
-                    "post_request_failed": f'{"fullName key is required. Check your data and try again." if "fullName" not in post_body else ""} {"email key is required. Check your data and try again." if "email" not in post_body else ""}'
-                }
-
-            self.wfile.write(json.dumps(new_customer).encode())
-
-    def do_DELETE(self):
-        # Set a 204 response code
-        delete_response = ""
-
-        # Parse the URL
-        (resource, id) = self.parse_url(self.path)
+        """Handles GET requests to the server"""
+        self._respond("GET")
 
-        # Delete a single animal from the list
-        if resource == "animals":
-            self._set_headers(204)
-            delete_animal(id)
-
-        # Encode the new animal and send in response
-
-        # Delete a single animal from the list
-        elif resource == "locations":
-            self._set_headers(204)
-            delete_location(id)
-
-        # Encode the new animal and send in response
-
-        # Delete a single animal from the list
-        if resource == "employees":
-            self._set_headers(204)
-            delete_employee(id)
-
-        # Encode the new animal and send in response
-
-        # Delete a single animal from the list
-        if resource == "customers":
-            self._set_headers(405)
-            delete_response = {"message": "You cannot delete any customer."}
-            # delete_customer(id)
-
-        # Encode the new anitmal and send in response
-
-        self.wfile.write(json.dumps(delete_response).encode())
-        # self.wfile.write(delete_response.encode())
+    def do_POST(self):
+        """Handles POST requests to the server"""
+        self._respond("POST")
 
     def do_PUT(self):
-        content_len = int(self.headers.get("content-length", 0))
-        post_body = self.rfile.read(content_len)
-        post_body = json.loads(post_body)
-
-        # Parse the URL
-        (resource, id) = self.parse_url(self.path)
-
-        success = False
-
-        if resource == "animals":
-            success = update_animal(id, post_body)
+        """Handles PUT requests to the server"""
+        self._respond("PUT")
 
-        elif resource == "locations":
-            update_location(id, post_body)
-        # rest of the elif's
-        elif resource == "employees":
-            update_employee(id, post_body)
+    def do_DELETE(self):
+        """Handles DELETE requests to the server"""
+        self._respond("DELETE")
 
-        elif resource == "customers":
-            update_customer(id, post_body)
+    # Another method! This supports requests with the OPTIONS verb.
+    def do_OPTIONS(self):
+        """Sets the options headers"""
+        self._respond("OPTIONS")
 
-        if success:
-            self._set_headers(204)
+    def _respond(self, method):
+        """Reads the request body, dispatches the request and writes the response"""
+        content_len = int(self.headers.get("content-length", 0))
+        body = self.rfile.read(content_len) if content_len else b""
+
+        response = dispatch(method, self.path, self.headers, body)
+        if response.chunks is not None:
+            self._stream(response)
+            return
+
+        self._set_headers(response.status, response.headers, len(response.body))
+        if response.status not in BODYLESS_STATUSES:
+            self.wfile.write(response.body)
+
+    def _stream(self, response):
+        """Writes a response whose body is produced piece by piece, with
+        Transfer-Encoding: chunked so the connection can be kept alive"""
+        # ? HTTP/1.0 clients do not understand chunks. They get the raw body,
+        # ? and closing the connection tells them where it ends.
+        chunked = self.request_version == "HTTP/1.1"
+        headers = response.headers
+        if chunked:
+            headers = headers + [("Transfer-Encoding", "chunked")]
         else:
-            self._set_headers(404)
-
-        self.wfile.write("".encode())
-
-    # A method that handles any PUT request.
+            self.close_connection = True
 
-    def _set_headers(self, status):
+        self._set_headers(response.status, headers, None)
+        try:
+            for data in response.chunks:
+                self.wfile.write(encode_chunk(data) if chunked else data)
+            if chunked:
+                self.wfile.write(LAST_CHUNK)
+        except BaseException:
+            # ? The status line is already sent. Dropping the connection
+            # ? without the last chunk tells the client the body is incomplete.
+            self.close_connection = True
+            raise
+        finally:
+            close_chunks(response.chunks)
+
+    def _set_headers(self, status, headers, content_length):
         # Notice this Docstring also includes information about the arguments passed to the function
-        """Sets the status code, Content-Type and Access-Control-Allow-Origin
-        headers on the response
+        """Sets the status code, headers and Content-Length on the response
 
         Args:
             status (number): the status code to return to the front end
+            headers (list): (name, value) pairs, e.g. Content-Type and
+                Access-Control-Allow-Origin
+            content_length (number): size of the encoded body in bytes, None
+                for a streamed body
         """
         self.send_response(status)
-        self.send_header("Content-type", "application/json")
-        self.send_header("Access-Control-Allow-Origin", "*")
-        self.end_headers()
-
-    # Another method! This supports requests with the OPTIONS verb.
-    def do_OPTIONS(self):
-        """Sets the options headers"""
-        self.send_response(200)
-        # is your domain on the list to access API.
-        self.send_header("Access-Control-Allow-Origin", "*")
-        # is user allowed to perform this action on the API.
-        self.send_header("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE")
-        self.send_header(
-            "Access-Control-Allow-Headers", "X-Requested-With, Content-Type, Accept"
-        )
+        for (name, value) in headers:
+            self.send_header(name, value)
+        if status not in BODYLESS_STATUSES and content_length is not None:
+            self.send_header("Content-Length", str(content_length))
+
+        self.requests_served += 1
+        if self.requests_served >= self.max_requests_per_connection:
+            # send_header() also marks the connection to be closed
+            self.send_header("Connection", "close")
         self.end_headers()
 
 
 # This function is not inside the class. It is the starting
 # point of this application.
-def main():
+def make_server(host="", port=8088, workers=0, backlog=128, reuse_port=False,
+                engine="threaded", idle_timeout=5, max_requests_per_connection=100):
+    """Builds the server that answers requests with the HandleRequests class
+
+    Args:
+        host (string): the interface to listen on, "" for all of them
+        port (number): the port to listen on
+        workers (number): size of the worker thread pool. 0 keeps the original
+            server that answers one request at a time
+        backlog (number): connections the kernel queues while workers are busy
+        reuse_port (bool): bind with SO_REUSEPORT so several processes can
+            listen on the same port
+        engine (string): "threaded" for HandleRequests on http.server, or
+            "asyncio" for the event loop engine. Both answer requests with
+            routes.dispatch
+        idle_timeout (number): seconds a keep-alive connection may sit idle
+        max_requests_per_connection (number): requests served on one
+            connection before it is closed
+    """
+    if engine == "asyncio":
+        sock = socket.create_server(
+            (host, port), backlog=backlog, reuse_port=reuse_port
+        )
+        return AsyncHTTPServer(
+            sock,
+            dispatch,
+            workers=workers or 16,
+            idle_timeout=idle_timeout,
+            max_requests_per_connection=max_requests_per_connection,
+        )
+
+    if workers > 0:
+        server = ThreadPoolHTTPServer(
+            (host, port),
+            HandleRequests,
+            workers=workers,
+            backlog=backlog,
+            bind_and_activate=False,
+        )
+    else:
+        server = HTTPServer((host, port), HandleRequests, bind_and_activate=False)
+        # A kept-alive connection would hold the only thread and stall every
+        # other client, so the serial server closes after each response
+        max_requests_per_connection = 1
+
+    server.idle_timeout = idle_timeout
+    server.max_requests_per_connection = max_requests_per_connection
+
+    try:
+        if reuse_port:
+            server.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server.server_bind()
+        server.server_activate()
+    except BaseException:
+        server.server_close()
+        raise
+
+    return server
+
+
+def main(argv=None):
     """Starts the server on port 8088 using the HandleRequests class"""
-    host = ""
-    port = 8088
-    HTTPServer((host, port), HandleRequests).serve_forever()
+    parser = argparse.ArgumentParser(description="Kennel API server")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="sqlite database file (default: $KENNEL_DB or ./kennel.sqlite3)",
+    )
+    parser.add_argument(
+        "--storage",
+        choices=sorted(storage.BACKENDS),
+        default="sqlite",
+        help="where the resources are kept; 'memory' answers plain reads and "
+        "?column=value filters only, and is lost on restart without --data-dir",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="directory of the write-ahead log and snapshots of --storage memory",
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=storage.FSYNC_POLICIES,
+        default="always",
+        help="when the log of --data-dir is forced to disk: before every write "
+        "returns (shared by concurrent writes), every --fsync-batch writes, or "
+        "every --fsync-interval seconds",
+    )
+    parser.add_argument("--fsync-batch", type=int, default=100)
+    parser.add_argument("--fsync-interval", type=float, default=1.0)
+    parser.add_argument(
+        "--snapshot-every",
+        type=int,
+        default=100000,
+        help="log records after which the memory backend writes a snapshot",
+    )
+    parser.add_argument(
+        "--pragma-profile",
+        choices=sorted(db.PRAGMA_PROFILES),
+        default=None,
+        help="sqlite pragmas for every connection; 'concurrent' turns on WAL "
+        "(default: $KENNEL_PRAGMA_PROFILE or 'default')",
+    )
+    parser.add_argument(
+        "--pragma",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="override one pragma of the profile, e.g. busy_timeout=10000",
+    )
+    parser.add_argument(
+        "--write-window-ms",
+        type=float,
+        default=None,
+        help="commit sqlite writes in batches on one writer thread, waiting up "
+        "to this long for a batch to fill (default: each write commits alone)",
+    )
+    parser.add_argument(
+        "--write-batch-size",
+        type=int,
+        default=256,
+        help="writes committed together at most with --write-window-ms",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="serve requests on a pool of this many threads (0 = one at a time)",
+    )
+    parser.add_argument(
+        "--backlog",
+        type=int,
+        default=128,
+        help="connections to queue while every worker is busy",
+    )
+    parser.add_argument(
+        "--cache-ttl",
+        type=float,
+        default=5,
+        help="seconds a GET response may be served from the cache (0 = off)",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=512,
+        help="GET responses kept in the cache",
+    )
+    parser.add_argument(
+        "--fragment-cache-mb",
+        type=float,
+        default=64,
+        help="MB of per-row JSON kept to build collections from (0 = off)",
+    )
+    parser.add_argument(
+        "--skip-migrations",
+        action="store_true",
+        help="start without bringing the database schema up to date",
+    )
+    parser.add_argument(
+        "--engine",
+        choices=("threaded", "asyncio"),
+        default="threaded",
+        help="http.server with HandleRequests, or the asyncio engine",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=5,
+        help="seconds a keep-alive connection may wait for its next request",
+    )
+    parser.add_argument(
+        "--max-requests-per-connection",
+        type=int,
+        default=100,
+        help="requests served on one keep-alive connection before closing it",
+    )
+    parser.add_argument(
+        "--processes",
+        default="0",
+        help="pre-fork this many worker processes sharing the port, "
+        "'auto' for one per core (0 = single process)",
+    )
+    args = parser.parse_args(argv)
+
+    processes = os.cpu_count() if args.processes == "auto" else int(args.processes)
+    if args.storage == "memory" and processes > 0:
+        # Every process would keep rows of its own
+        parser.error("--storage memory serves from one process, drop --processes")
+    if args.storage == "memory":
+        storage.configure(
+            "memory",
+            data_dir=args.data_dir,
+            fsync=args.fsync,
+            fsync_batch=args.fsync_batch,
+            fsync_interval=args.fsync_interval,
+            snapshot_every=args.snapshot_every,
+        )
+    else:
+        storage.configure(args.storage)
+
+    if args.db or args.pragma_profile or args.pragma:
+        profile = args.pragma_profile or os.environ.get(
+            "KENNEL_PRAGMA_PROFILE", "default"
+        )
+        db.configure(path=args.db, pragmas=db.pragma_profile(profile, args.pragma))
+
+    if args.write_window_ms is not None:
+        db.configure_writes(args.write_window_ms / 1000, args.write_batch_size)
+
+    cache.configure(
+        max_entries=args.cache_size,
+        ttl=args.cache_ttl,
+        fragment_bytes=int(args.fragment_cache_mb * 2**20),
+    )
+
+    # Runs on its own connection before any worker is forked, so no sqlite
+    # connection is shared across processes
+    if args.storage == "sqlite" and not args.skip_migrations:
+        migrations.migrate(db.database_path())
+
+    if processes > 0:
+        PreforkSupervisor(
+            lambda: make_server(
+                args.host,
+                args.port,
+                args.workers,
+                args.backlog,
+                reuse_port=True,
+                engine=args.engine,
+                idle_timeout=args.idle_timeout,
+                max_requests_per_connection=args.max_requests_per_connection,
+            ),
+            processes,
+            cleanup=db.close_all,
+        ).run()
+        return
+
+    server = make_server(
+        args.host,
+        args.port,
+        args.workers,
+        args.backlog,
+        engine=args.engine,
+        idle_timeout=args.idle_timeout,
+        max_requests_per_connection=args.max_requests_per_connection,
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        storage.backend.close()
 
 
 if __name__ == "__main__":
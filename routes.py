@@ -0,0 +1,845 @@
+import json
+import sqlite3
+import traceback
+from datetime import datetime, timezone
+from urllib.parse import urlencode, urlparse, parse_qs
+
+import cache
+import db
+import storage
+import streaming
+
+# ? These methods are first created in their respective views. They are then imported to init.py and then they are imported here.
+from views import (
+    get_all_animals,
+    get_single_animal,
+    get_all_locations,
+    get_single_location,
+    get_all_employees,
+    get_single_employee,
+    get_all_customers,
+    get_single_customer,
+    iter_all_animals,
+    iter_all_locations,
+    iter_all_employees,
+    iter_all_customers,
+    ANIMAL_QUERY,
+    LOCATION_QUERY,
+    EMPLOYEE_QUERY,
+    CUSTOMER_QUERY,
+    LOCATION_RELATION,
+    CUSTOMER_RELATION,
+    ANIMALS_BY_LOCATION,
+    ANIMALS_BY_CUSTOMER,
+    Page,
+)
+
+# The routing table. Every server engine (the threaded HandleRequests and the
+# asyncio engine) answers requests by calling dispatch(), which looks up the
+# resource here.
+#   single/all: GET /resource/1 and GET /resource
+#   stream: yields every item for GET /resource?_stream=true and the export
+#   query: the QueryBuilder with the filters, fields and sorts GET accepts
+#   expand/embed: the relations ?_expand= and ?_embed= may load, by name
+#   required: keys a POST body must have
+#   deletable: whether DELETE is allowed
+# Writes, and GETs on a backend without queries, go through storage.backend.
+ROUTES = {
+    "animals": {
+        "single": get_single_animal,
+        "all": get_all_animals,
+        "stream": iter_all_animals,
+        "query": ANIMAL_QUERY,
+        "expand": {"location": LOCATION_RELATION, "customer": CUSTOMER_RELATION},
+        "embed": {},
+        "required": ("name", "breed", "location_id", "customer_id", "status"),
+        "deletable": True,
+    },
+    "locations": {
+        "single": get_single_location,
+        "all": get_all_locations,
+        "stream": iter_all_locations,
+        "query": LOCATION_QUERY,
+        "expand": {},
+        "embed": {"animals": ANIMALS_BY_LOCATION},
+        "required": ("name", "address"),
+        "deletable": True,
+    },
+    "customers": {
+        "single": get_single_customer,
+        "all": get_all_customers,
+        "stream": iter_all_customers,
+        "query": CUSTOMER_QUERY,
+        "expand": {},
+        "embed": {"animals": ANIMALS_BY_CUSTOMER},
+        "required": ("fullName", "email"),
+        "deletable": False,
+    },
+    "employees": {
+        "single": get_single_employee,
+        "all": get_all_employees,
+        "stream": iter_all_employees,
+        "query": EMPLOYEE_QUERY,
+        "expand": {"location": LOCATION_RELATION},
+        "embed": {},
+        "required": ("name", "address", "location_id"),
+        "deletable": True,
+    },
+}
+
+# The tables each resource's responses are read from. Their change versions
+# make up the resource's ETag.
+RESOURCE_TABLES = {
+    "animals": ("Animal", "Location", "Customer"),
+    "locations": ("Location",),
+    "customers": ("Customer",),
+    "employees": ("Employee", "Location"),
+}
+
+# The table behind each relation of ?_expand= and ?_embed=. A response that
+# loads one also changes with that table.
+RELATION_TABLES = {
+    "location": "Location",
+    "customer": "Customer",
+    "animals": "Animal",
+}
+
+DEFAULT_HEADERS = (
+    ("Content-type", "application/json"),
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Expose-Headers", "ETag, Link"),
+)
+
+# Requests one POST /batch may hold
+MAX_BATCH_REQUESTS = 100
+
+# Invalid rows reported back for a bulk POST before the check stops
+MAX_BULK_ERRORS = 100
+
+# Content-Types of a bulk POST sent as one JSON item per line
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson")
+
+# Query parameters of a GET besides the filters of its resource
+GET_PARAMS = (
+    "fields", "_expand", "_embed", "_sortBy", "_order", "limit", "after", "_stream"
+)
+
+# Content-Types GET /export/<resource> can answer with, picked by Accept
+EXPORT_TYPES = ("application/x-ndjson", "text/csv")
+
+OPTIONS_HEADERS = (
+    ("Access-Control-Allow-Origin", "*"),
+    ("Access-Control-Allow-Methods", "GET, POST, PUT, DELETE"),
+    ("Access-Control-Allow-Headers", "X-Requested-With, Content-Type, Accept"),
+)
+
+
+class Response:
+    """What a route hands back to the server engine that is answering the request
+
+    Args:
+        status (number): the status code to return to the front end
+        body (bytes): the encoded response body
+        headers (list): (name, value) pairs to send with the response
+        chunks (iterator): bytes to send one after the other instead of body,
+            with Transfer-Encoding: chunked. None for a buffered response
+    """
+
+    def __init__(self, status, body=b"", headers=DEFAULT_HEADERS, chunks=None):
+        self.status = status
+        self.body = body
+        self.headers = list(headers)
+        self.chunks = chunks
+
+
+def json_response(status, data):
+    """Builds a Response from JSON bytes or a string, which the views return,
+    or any value json.dumps accepts"""
+    if isinstance(data, bytes):
+        return Response(status, data)
+    if not isinstance(data, str):
+        data = json.dumps(data)
+    return Response(status, data.encode())
+
+
+def parse_url(path):
+    """Parse the url into the resource, id and query parameters"""
+    parsed_url = urlparse(path)
+    path_params = parsed_url.path.split("/")  # ['', 'animals', 1]
+    resource = path_params[1] if len(path_params) > 1 else ""
+
+    query = parse_qs(parsed_url.query)
+
+    pk = None
+    try:
+        pk = int(path_params[2])
+    except (IndexError, ValueError):
+        pass
+    return (resource, pk, query)
+
+
+def dispatch(method, path, headers=None, body=b"", cached=True):
+    """Answers one request
+
+    Args:
+        method (string): GET, POST, PUT, DELETE or OPTIONS
+        path (string): the request target, e.g. /animals?status=Kennel
+        headers (Message): the request headers, anything with a .get()
+        body (bytes): the raw request body
+        cached (bool): whether a GET may use the response cache and ETags
+
+    Returns:
+        Response: the status, headers and body to send back. An error no
+            route handles is printed to stderr and answered with a JSON 500,
+            the same on every server engine
+    """
+    try:
+        return route(method, path, headers, body, cached)
+    except Exception:
+        traceback.print_exc()
+        return json_response(500, {"message": "Internal server error."})
+
+
+def route(method, path, headers=None, body=b"", cached=True):
+    """Answers one request like dispatch(), letting errors through"""
+    if method == "OPTIONS":
+        return Response(200, headers=OPTIONS_HEADERS)
+
+    (resource, id, query) = parse_url(path)
+    if resource == "health" and method == "GET":
+        return health()
+    if resource == "stats" and method == "GET":
+        return json_response(
+            200,
+            {
+                "cache": cache.response_cache.stats(),
+                "fragments": cache.fragment_cache.stats(),
+                "single_flight": cache.single_flight.stats(),
+            },
+        )
+    if resource in ("batch", "export") and not storage.backend.queries:
+        return json_response(
+            501, {"message": f"/{resource} needs the sqlite storage backend."}
+        )
+    if resource == "batch" and method == "POST":
+        return batch(body, query)
+    if resource == "export" and method == "GET":
+        return export(path, query, headers)
+
+    if resource not in ROUTES:
+        return json_response(404, {"message": f"Unknown resource {resource}"})
+
+    if method == "GET":
+        # A backend without queries answers plain reads, cached and versioned
+        # the same way
+        answer = get if storage.backend.queries else plain_get
+        if not cached:
+            return answer(resource, id, query)
+        return cached_get(resource, id, query, headers, answer)
+
+    if method in ("POST", "PUT"):
+        try:
+            if method == "POST" and is_ndjson(headers):
+                data = parse_ndjson(body)
+            else:
+                data = parse_json(body)
+        except ValueError as ex:
+            return json_response(400, {"message": str(ex)})
+
+        if method == "POST" and isinstance(data, list):
+            response = bulk_post(resource, data)
+        elif method == "POST":
+            response = post(resource, data)
+        else:
+            response = put(resource, id, data)
+    elif method == "DELETE":
+        response = delete(resource, id)
+    else:
+        return json_response(405, {"message": f"{method} is not supported."})
+
+    if response.status < 400:
+        cache.response_cache.invalidate(resource)
+    return response
+
+
+def cached_get(resource, id, query, headers=None, answer=None):
+    """Answers a GET with a 304 when the client's ETag is still current, from
+    the response cache when it holds this version, or with answer(resource,
+    id, query), get() by default. Identical GETs that miss at the same time
+    share one call of answer and its Response."""
+    version = resource_version(resource, query)
+    etag = None if version is None else f'"{resource}-{version}"'
+
+    if etag is not None and headers is not None:
+        if etag_matches(headers.get("If-None-Match"), etag):
+            # Only what a 200 would have been gets a 304, found without
+            # running the view: the query parses and the item exists
+            message = query_error(resource, id, query)
+            if message:
+                return json_response(400, {"message": message})
+            if id is not None and not storage.backend.exists(id, resource):
+                return json_response(404, "")
+            return Response(304, headers=DEFAULT_HEADERS + (("ETag", etag),))
+
+    return versioned_get(resource, id, query, version, etag, answer)
+
+
+def versioned_get(resource, id, query, version, etag, answer=None):
+    """Answers a GET at a version of its tables for cached_get()"""
+    key = cache.cache_key(resource, id, query)
+    response = cache.response_cache.get(key, version)
+    if response is not None:
+        return response
+
+    def load():
+        response = (answer or get)(resource, id, query)
+        if response.status == 200:
+            if etag is not None:
+                response.headers.append(("ETag", etag))
+            # A stream can only be sent once, and caching it would buffer it
+            if response.chunks is None:
+                cache.response_cache.put(key, response, version)
+        return response
+
+    # A stream cannot be shared either. The key holds the version, so a GET
+    # made after a write does not get the answer of a read started before.
+    if wants_stream(query):
+        return load()
+    return cache.single_flight.do((key, version), load)
+
+
+def resource_version(resource, query=None):
+    """Returns the change versions of the tables behind a resource as one
+    string, e.g. "12.3.7", or None when the storage backend does not count
+    them, e.g. before the ChangeVersion migration.
+    Tables of relations the query loads are included."""
+    versions = storage.backend.versions()
+    if versions is None:
+        return None
+    tables = RESOURCE_TABLES[resource] + tuple(
+        RELATION_TABLES[name]
+        for name in requested_relations(query or {})
+        if name in RELATION_TABLES
+    )
+    return ".".join(str(versions.get(table, 0)) for table in tables)
+
+
+def etag_matches(if_none_match, etag):
+    """Compares an If-None-Match header with an ETag the way RFC 7232 asks
+    for GET: "*" matches anything and W/ prefixes are ignored"""
+    if not if_none_match:
+        return False
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate in ("*", etag):
+            return True
+    return False
+
+
+class BatchItemFailed(Exception):
+    """Rolls back the savepoint of a batch item that answered an error"""
+
+    def __init__(self, response):
+        super().__init__(response.status)
+        self.response = response
+
+
+class BatchAborted(Exception):
+    """Rolls back the transaction of an atomic batch after a failed item"""
+
+    def __init__(self, results):
+        super().__init__(results[-1]["status"])
+        self.results = results
+
+
+def batch(body, query):
+    """Handles POST /batch: runs an array of {method, path, body} requests
+    through dispatch() in one transaction and answers with the status and
+    body of each one. Every request runs in its own savepoint, so one that
+    fails is undone and the others are kept. With atomic, the first failure
+    rolls back the whole batch and the rest are not run.
+
+    The body is the array, or {"atomic": true, "requests": [...]}.
+    ?atomic=true works as well.
+    """
+    try:
+        data = json.loads(body or b"[]")
+    except ValueError:
+        return json_response(400, {"message": "The request body is not valid JSON."})
+
+    atomic = (query.get("atomic") or ["false"])[0].lower() in ("1", "true", "yes")
+    if isinstance(data, dict):
+        atomic = bool(data.get("atomic", atomic))
+        data = data.get("requests")
+    if not isinstance(data, list) or not all(isinstance(item, dict) for item in data):
+        return json_response(
+            400, {"message": "Send an array of {method, path, body} requests."}
+        )
+    if len(data) > MAX_BATCH_REQUESTS:
+        return json_response(
+            400, {"message": f"A batch holds at most {MAX_BATCH_REQUESTS} requests."}
+        )
+
+    # A batch of reads does not need the write lock
+    writes = any(str(item.get("method", "GET")).upper() != "GET" for item in data)
+    try:
+        results = run_batch(data, atomic, writes)
+    except BatchAborted as ex:
+        skipped = {"status": 424, "body": {"message": "Not run, an earlier request failed."}}
+        return json_response(409, ex.results + [skipped] * (len(data) - len(ex.results)))
+    return json_response(200, results)
+
+
+@db.retry_on_locked
+def run_batch(items, atomic, writes):
+    """Runs the items of a batch in one transaction, see batch()"""
+    results = []
+    with db.transaction(immediate=writes):
+        for item in items:
+            try:
+                with db.savepoint("batch_item"):
+                    response = run_batch_item(item)
+                    if response.status >= 400:
+                        raise BatchItemFailed(response)
+            except BatchItemFailed as ex:
+                response = ex.response
+            results.append(
+                {"status": response.status, "body": decode_body(response)}
+            )
+            if atomic and response.status >= 400:
+                raise BatchAborted(results)
+    return results
+
+
+def run_batch_item(item):
+    """Answers one request of a batch, turning errors into a 500"""
+    method = str(item.get("method", "GET")).upper()
+    path = str(item.get("path", ""))
+    if parse_url(path)[0] == "batch":
+        return json_response(400, {"message": "A batch cannot contain a batch."})
+
+    body = item.get("body")
+    body = b"" if body is None else json.dumps(body).encode()
+    try:
+        return route(method, path, body=body, cached=False)
+    except Exception as ex:
+        return json_response(500, {"message": f"{type(ex).__name__}: {ex}"})
+
+
+def decode_body(response):
+    """Returns the body of a batch item's response as a JSON value"""
+    body = response.body
+    if response.chunks is not None:
+        body = b"".join(response.chunks)
+    if not body:
+        return None
+    try:
+        return json.loads(body)
+    except ValueError:
+        return body.decode(errors="replace")
+
+
+def health():
+    """Handles GET /health, used by load balancers and the supervisor"""
+    if storage.backend.health_check():
+        return json_response(200, {"database": "ok"})
+    return json_response(503, {"database": "unavailable"})
+
+
+def parse_get(resource, id, query):
+    """Reads the query string of a GET into what the views take
+
+    Returns:
+        tuple: the fields, the relations, the Page (None for a single item)
+            and the query with ?updated_since= rewritten
+    Raises:
+        ValueError: with the message for a 400
+    """
+    route = ROUTES[resource]
+    builder = route["query"]
+    message = unknown_params(builder, query)
+    if message:
+        raise ValueError(message)
+    fields = parse_fields(query, builder.projection)
+    relations = parse_relations(query, route)
+    if id is not None:
+        return (fields, relations, None, query)
+    page = parse_page(query, builder.sorts)
+    return (fields, relations, page, parse_updated_since(query))
+
+
+def query_error(resource, id, query):
+    """Returns the message a GET with this query string is answered with a
+    400, or None when get() or plain_get() would take it"""
+    if not storage.backend.queries:
+        return plain_query_error(resource, query)
+    try:
+        parse_get(resource, id, query)
+    except ValueError as ex:
+        return str(ex)
+    return None
+
+
+def get(resource, id, query):
+    """Handles GET requests for a collection, a single item or a filter"""
+    route = ROUTES[resource]
+    try:
+        (fields, relations, page, query) = parse_get(resource, id, query)
+    except ValueError as ex:
+        return json_response(400, {"message": str(ex)})
+
+    if id is not None:
+        response = route["single"](id, fields=fields, relations=relations)
+        if response is None:
+            return json_response(404, "")
+        return json_response(200, response)
+
+    paged = page.limit is not None or page.after is not None
+    if wants_stream(query) and not paged:
+        items = route["stream"](
+            fields=fields, query=query, page=page, relations=relations
+        )
+        return Response(200, chunks=streaming.iter_json_array(items))
+
+    # Every filter in the query string is applied, ANDed together
+    response = json_response(
+        200,
+        route["all"](page=page, fields=fields, query=query, relations=relations),
+    )
+    if page.next_after is not None:
+        next_query = dict(query, after=[page.cursor()])
+        response.headers.append(
+            ("Link", f'</{resource}?{urlencode(next_query, doseq=True)}>; rel="next"')
+        )
+    return response
+
+
+def plain_get(resource, id, query):
+    """Handles GET requests on a storage backend without queries: a single
+    item, or the collection filtered by ?column=value"""
+    message = plain_query_error(resource, query)
+    if message:
+        return json_response(400, {"message": message})
+
+    if id is not None:
+        item = storage.backend.retrieve(id, resource)
+        if item is None:
+            return json_response(404, "")
+        return json_response(200, item)
+    return json_response(200, storage.backend.all(resource, query))
+
+
+def plain_query_error(resource, query):
+    """Returns the message for a query string plain_get() cannot answer"""
+    builder = ROUTES[resource]["query"]
+    message = unknown_params(builder, query)
+    if message:
+        return message
+    for name in query:
+        if name not in builder.filters:
+            return f"?{name}= needs the sqlite storage backend."
+    return None
+
+
+def export(path, query, headers=None):
+    """Handles GET /export/<resource>: every row that matches the filters,
+    as NDJSON or CSV by the Accept header, streamed from the cursor with
+    chunked encoding so the server's memory stays flat however big the
+    table is. ?updated_since= keeps the rows changed at or after a time."""
+    parts = urlparse(path).path.split("/")  # ['', 'export', 'animals']
+    resource = parts[2] if len(parts) > 2 else ""
+    if resource not in ROUTES:
+        return json_response(404, {"message": f"Unknown resource {resource}"})
+
+    content_type = export_type(None if headers is None else headers.get("Accept"))
+    if content_type is None:
+        return json_response(
+            406, {"message": f"Export as {' or '.join(EXPORT_TYPES)}."}
+        )
+    message = unknown_params(ROUTES[resource]["query"], query, extra=())
+    if message:
+        return json_response(400, {"message": message})
+    try:
+        query = parse_updated_since(query)
+    except ValueError as ex:
+        return json_response(400, {"message": str(ex)})
+
+    columns = ROUTES[resource]["query"].projection.columns
+    items = ROUTES[resource]["stream"](fields=columns, query=query)
+    if content_type == "text/csv":
+        chunks = streaming.iter_csv(items, columns)
+    else:
+        chunks = streaming.iter_ndjson(items)
+    headers = [("Content-type", content_type)] + list(DEFAULT_HEADERS[1:])
+    return Response(200, headers=headers, chunks=chunks)
+
+
+def export_type(accept):
+    """Picks one of EXPORT_TYPES for an Accept header, in the order of its
+    q-values. NDJSON when there is no header or any type will do, None when
+    the client takes neither."""
+    if not accept:
+        return EXPORT_TYPES[0]
+    ranges = []
+    for (index, part) in enumerate(accept.split(",")):
+        (media, *params) = [value.strip() for value in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            ranges.append((-quality, index, media.lower()))
+    for (_, _, media) in sorted(ranges):
+        if media in NDJSON_TYPES or media in ("*/*", "application/*"):
+            return EXPORT_TYPES[0]
+        if media in ("text/csv", "text/*"):
+            return "text/csv"
+    return None
+
+
+def parse_updated_since(query):
+    """Rewrites ?updated_since= into the UTC text updated_at is stored as, so
+    the two compare as strings. Takes an ISO 8601 date or time, e.g.
+    2024-05-01 or 2024-05-01T12:00:00+02:00; without an offset it is UTC.
+
+    Raises:
+        ValueError: when the value is not a date or time
+    """
+    values = query.get("updated_since")
+    if not values or not values[0]:
+        return query
+    text = values[0].strip()
+    if text.endswith(("Z", "z")):
+        text = text[:-1] + "+00:00"
+    try:
+        since = datetime.fromisoformat(text)
+    except ValueError:
+        raise ValueError(
+            "updated_since must be an ISO 8601 date or time, "
+            "e.g. 2024-05-01T12:00:00Z."
+        ) from None
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    since = since.astimezone(timezone.utc)
+    stamp = since.strftime("%Y-%m-%dT%H:%M:%S.%f")[:-3] + "Z"
+    return dict(query, updated_since=[stamp])
+
+
+def unknown_params(builder, query, extra=GET_PARAMS):
+    """Returns the message naming the query parameters neither the builder
+    nor extra knows, e.g. a misspelt ?stauts=, or None when there are none.
+    Ignoring them would answer with every row as if there were no filter."""
+    known = set(builder.filters) | set(builder.prefixes) | set(builder.minimums)
+    unknown = [name for name in query if name not in known and name not in extra]
+    if not unknown:
+        return None
+    return " ".join(f"Unknown query parameter ?{name}=." for name in unknown)
+
+
+def wants_stream(query):
+    """Whether ?_stream= asks for the whole collection as a chunked stream,
+    which keeps the server's memory flat however many rows there are"""
+    values = query.get("_stream")
+    return bool(values) and values[0].lower() in ("1", "true", "yes")
+
+
+def parse_fields(query, projection):
+    """Reads ?fields=id,name into the names to select, None when every field
+    is wanted. Only these columns are read, and a related table is joined
+    only when the field embedding it is asked for."""
+    values = query.get("fields")
+    if not values:
+        return None
+    fields = []
+    for value in values:
+        for name in value.split(","):
+            name = name.strip()
+            if name and name not in fields:
+                fields.append(name)
+    if not fields:
+        return None
+    projection.check(fields)
+    return tuple(fields)
+
+
+def requested_relations(query):
+    """Returns the names in ?_expand= and ?_embed=, e.g. ("location",)"""
+    names = []
+    for param in ("_expand", "_embed"):
+        for value in query.get(param, ()):
+            for name in value.split(","):
+                name = name.strip()
+                if name and name not in names:
+                    names.append(name)
+    return tuple(names)
+
+
+def parse_relations(query, route):
+    """Reads ?_expand=location,customer and ?_embed=animals into the
+    (name, Relation) pairs the views load, each one with a single IN query
+    for the whole page instead of a request per row"""
+    available = dict(route["expand"], **route["embed"])
+    relations = []
+    for name in requested_relations(query):
+        if name not in available:
+            choices = ", ".join(available) or "nothing"
+            raise ValueError(f"Cannot load {name} here. Choose from {choices}.")
+        relations.append((name, available[name]))
+    return tuple(relations)
+
+
+def parse_page(query, sorts=("id",)):
+    """Reads ?_sortBy=, ?_order=, ?limit= and ?after= into a keyset Page
+
+    Args:
+        query (dict): the parsed query string
+        sorts (tuple): the columns the resource may be sorted by
+    """
+    sort = (query.get("_sortBy") or ["id"])[0]
+    if sort not in sorts:
+        raise ValueError(f"_sortBy must be one of {', '.join(sorts)}.")
+    order = (query.get("_order") or ["asc"])[0].lower()
+    if order not in ("asc", "desc"):
+        raise ValueError("_order must be asc or desc.")
+
+    limit = None
+    if query.get("limit"):
+        try:
+            limit = int(query["limit"][0])
+        except ValueError:
+            raise ValueError("limit must be a whole number.") from None
+        if limit < 1:
+            raise ValueError("limit must be at least 1.")
+
+    page = Page(limit=limit, sort=sort, descending=order == "desc")
+    if query.get("after"):
+        page.parse_cursor(query["after"][0])
+    return page
+
+
+def missing_keys(resource, post_body):
+    """Returns the message for the required keys a POST body lacks, or None"""
+    missing = [key for key in ROUTES[resource]["required"] if key not in post_body]
+    if not missing:
+        return None
+    return " ".join(
+        f"{key} key is required. Check your data and try again." for key in missing
+    )
+
+
+def invalid_values(resource, row):
+    """Returns a message naming the fields of a row whose value cannot be
+    stored in a column, e.g. a list, or None when every one can"""
+    # Checked for every row of a bulk POST, so the common case is quick
+    if not any(isinstance(value, (dict, list)) for value in row.values()):
+        return None
+    route = ROUTES[resource]
+    fields = set(route["required"]) | set(route["query"].projection.columns)
+    invalid = [
+        field for field in sorted(fields) if isinstance(row.get(field), (dict, list))
+    ]
+    if not invalid:
+        return None
+    return " ".join(f"{field} must be a string or a number." for field in invalid)
+
+
+def row_error(resource, row):
+    """Returns the message a row sent to be stored is refused with, or None
+    when it has every required key and only values a column can hold"""
+    if not isinstance(row, dict):
+        return "Each row must be an object."
+    return missing_keys(resource, row) or invalid_values(resource, row)
+
+
+def post(resource, post_body):
+    """Handles POST requests that create a new item"""
+    message = row_error(resource, post_body)
+    if message:
+        return json_response(400, {"message": message})
+
+    try:
+        item = storage.backend.create(resource, post_body)
+    except sqlite3.IntegrityError as ex:
+        # e.g. a customer email that is already taken
+        return json_response(409, {"message": f"Not added: {ex}."})
+    return json_response(201, item)
+
+
+def bulk_post(resource, rows):
+    """Handles POST requests with an array or NDJSON of new items. Every row
+    is checked first, then all of them are added in one transaction, or none
+    when a row is invalid."""
+    errors = []
+    for (index, row) in enumerate(rows):
+        message = row_error(resource, row)
+        if message:
+            errors.append({"row": index, "message": message})
+            if len(errors) == MAX_BULK_ERRORS:
+                break
+    if errors:
+        return json_response(400, {"message": "No rows were added.", "errors": errors})
+
+    try:
+        ids = storage.backend.create_many(resource, rows)
+    except sqlite3.IntegrityError as ex:
+        return json_response(409, {"message": f"No rows were added: {ex}."})
+    return json_response(201, {"ids": ids})
+
+
+def is_ndjson(headers):
+    """Whether the request body is newline delimited JSON, one item a line"""
+    if headers is None:
+        return False
+    content_type = (headers.get("Content-Type") or "").split(";")[0].strip().lower()
+    return content_type in NDJSON_TYPES
+
+
+def parse_json(body):
+    """Reads a JSON request body, {} when there is none"""
+    try:
+        return json.loads(body or b"{}")
+    except ValueError:
+        raise ValueError("The request body is not valid JSON.") from None
+
+
+def parse_ndjson(body):
+    """Reads one JSON value per line, skipping blank lines"""
+    rows = []
+    for (number, line) in enumerate(body.splitlines(), 1):
+        if line.strip():
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                raise ValueError(f"Line {number} is not valid JSON.") from None
+    return rows
+
+
+def put(resource, id, post_body):
+    """Handles PUT requests that replace an existing item. The body is the
+    whole item, so it is checked like the body of a POST."""
+    message = row_error(resource, post_body)
+    if message:
+        return json_response(400, {"message": message})
+
+    try:
+        success = storage.backend.update(id, post_body, resource)
+    except sqlite3.IntegrityError as ex:
+        return json_response(409, {"message": f"Not updated: {ex}."})
+
+    if success:
+        return json_response(204, "")
+    return json_response(404, "")
+
+
+def delete(resource, id):
+    """Handles DELETE requests for a single item"""
+    if not ROUTES[resource]["deletable"]:
+        return json_response(405, {"message": f"You cannot delete any {resource}."})
+
+    storage.backend.delete(id, resource)
+    return json_response(204, "")
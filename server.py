@@ -1,8 +1,19 @@
+import argparse
 import json
 from http.server import BaseHTTPRequestHandler, HTTPServer
 
-# ? These methods are first created in their respective views. They are then imported to init.py and then they are imported to request_handler.py.
-from repository import all, delete, retrieve, create, update
+import db
+import migrations
+import storage
+
+# ? Rows are read and written through storage.backend, the same interface the
+# ? routes of request_handler.py use, so this server runs on either backend.
+# ? The keys a POST body needs are the ones the routes check as well.
+# ? Note: this also means the API speaks the column names of the models, the
+# ? same as request_handler.py: an animal has breed, location_id and
+# ? customer_id where the old in-memory lists had species, locationId and
+# ? customerId. Clients of server.py need to send and read the new keys.
+from routes import ROUTES, missing_keys
 
 # Here's a class. It inherits from another class.
 # For now, think of a class as a container for functions that
@@ -37,7 +48,7 @@ class HandleRequests(BaseHTTPRequestHandler):
 
     def get_all_or_single(self, resource, id):
         if id is not None:
-            response = retrieve(id, resource)
+            response = storage.backend.retrieve(id, resource)
 
             if response is not None:
                 self._set_headers(200)
@@ -46,7 +57,7 @@ class HandleRequests(BaseHTTPRequestHandler):
                 response = ""
         else:
             self._set_headers(200)
-            response = all(resource)
+            response = storage.backend.all(resource)
 
         return response
 
@@ -71,84 +82,21 @@ class HandleRequests(BaseHTTPRequestHandler):
         #! Parse the URL
         (resource, id) = self.parse_url(self.path)
 
-        # ? Initialize new animal
-        new_animal = None
-        # ? Initialize new employee
-        new_employee = None
-        # ? Initialize new location
-        new_location = None
-        # ? Initialize new customer
-        new_customer = None
-
-        # Add a new animal to the list. Don't worry about
-        # the orange squiggle, you'll define the create_animal
-        # function next.
-        # ? Below is the logic for how new resources will be created and added to the API.
-        if resource == "animals":
-            if (
-                "name" in post_body
-                and "species" in post_body
-                and "locationId" in post_body
-                and "customerId" in post_body
-                and "status" in post_body
-            ):
-                self._set_headers(201)
-                new_animal = create(resource, post_body)
-
-            else:
-                self._set_headers(400)
-                new_animal = {
-                    "message": f'{"name key is required. Check your data and try again." if "name" not in post_body else ""} {"species key is required. Check your data and try again. " if "species" not in post_body else ""} {"locationId key is required. Check your data and try again." if "locationId" not in post_body else ""} {"customerId key is required. Check your data and try again. " if "customerId" not in post_body else ""} {"status key is required. Check your data and try again. " if "status" not in post_body else ""}'
-                }
-
-            #! Encode the new animal and send in response
-            self.wfile.write(json.dumps(new_animal).encode())
-
-        # ? If the resource == "locations", and if the "name" key and  "address" key are present in the post_body dictionary, than the request will have a header of 201, and a new location will be created.
-        # ? Else/Otherwise, the request header will be set to 400, and a message will be stored inside of the new location variable. Message is a ternary statement in python. If the "name" key is not in post_body dictionary, then the message will be "name is required", else an empty string will be returned. If the "address" key is not in post_body dictionary, then the message will be "address is required", else an empty string will be returned.
-        if resource == "locations":
-            if "name" in post_body and "address" in post_body:
-                self._set_headers(201)
-                new_location = create(resource, post_body)
-
-            else:
-                self._set_headers(400)
-                new_location = {
-                    "message": f'{"name key is required. Check your data and try again." if "name" not in post_body else ""} {"address is required. Check your data and try again." if "address" not in post_body else ""}'
-                }
-
-            #! Encode the new animal and send in response
-            self.wfile.write(json.dumps(new_location).encode())
-
-        # ? If the resource == "employees", and if the "name" key is present in the post_body dictionary, than the request will have a header of 201, and a new employee will be created.
-        # ? Else/Otherwise, the request header will be set to 400, and a message will be stored inside of the new employee variable. Message is a ternary statement in python. If the "name" key is not in post_body dictionary, then the message will be "name is required", else an empty string will be returned.
-        if resource == "employees":
-            if "name" in post_body:
-                self._set_headers(201)
-                new_employee = create(resource, post_body)
-
-            else:
-                self._set_headers(400)
-                new_employee = {
-                    "message": f'{"name key is required. Check your data and try again." if "name" not in post_body else ""}'
-                }
-
-            self.wfile.write(json.dumps(new_employee).encode())
-
-        # ? If the resource == "locations", and if the "name" key and  "address" key are present in the post_body dictionary, than the request will have a header of 201, and a new location will be created.
-        # ? Else/Otherwise, the request header will be set to 400, and a message will be stored inside of the new location variable. Message is a ternary statement in python. If the "name" key is not in post_body dictionary, then the message will be "name is required", else an empty string will be returned. If the "address" key is not in post_body dictionary, then the message will be "address is required", else an empty string will be returned.
-        if resource == "customers":
-            if "fullName" in post_body and "email" in post_body:
-                self._set_headers(201)
-                new_customer = create(resource, post_body)
-
-            else:
-                self._set_headers(400)
-                new_customer = {
-                    "post_request_failed": f'{"fullName key is required. Check your data and try again." if "fullName" not in post_body else ""} {"email key is required. Check your data and try again." if "email" not in post_body else ""}'
-                }
+        # ? Every resource is created the same way: a 400 with a message for
+        # ? each missing key, or a 201 with the new item and its id.
+        message = missing_keys(resource, post_body) if resource in ROUTES else None
+        if resource not in ROUTES:
+            self._set_headers(404)
+            response = {"message": f"Unknown resource {resource}"}
+        elif message:
+            self._set_headers(400)
+            response = {"message": message}
+        else:
+            self._set_headers(201)
+            response = storage.backend.create(resource, post_body)
 
-            self.wfile.write(json.dumps(new_customer).encode())
+        #! Encode the new item and send in response
+        self.wfile.write(json.dumps(response).encode())
 
     def do_DELETE(self):
         # Set a 204 response code
@@ -160,21 +108,21 @@ class HandleRequests(BaseHTTPRequestHandler):
         # Delete a single animal from the list
         if resource == "animals":
             self._set_headers(204)
-            delete(id, resource)
+            storage.backend.delete(id, resource)
 
         # Encode the new animal and send in response
 
         # Delete a single animal from the list
         elif resource == "locations":
             self._set_headers(204)
-            delete(id, resource)
+            storage.backend.delete(id, resource)
 
         # Encode the new animal and send in response
 
         # Delete a single animal from the list
         if resource == "employees":
             self._set_headers(204)
-            delete(id, resource)
+            storage.backend.delete(id, resource)
 
         # Encode the new animal and send in response
 
@@ -200,28 +148,28 @@ class HandleRequests(BaseHTTPRequestHandler):
 
         # Delete a single animal from the list
         if resource == "animals":
-            update(id, post_body, resource)
+            storage.backend.update(id, post_body, resource)
 
             # Encode the new animal and send in response
             self.wfile.write("".encode())
 
         # Delete a single animal from the list
         if resource == "locations":
-            update(id, post_body, resource)
+            storage.backend.update(id, post_body, resource)
 
             # Encode the new animal and send in response
             self.wfile.write("".encode())
 
         # Delete a single animal from the list
         if resource == "employees":
-            update(id, post_body, resource)
+            storage.backend.update(id, post_body, resource)
 
             # Encode the new animal and send in response
             self.wfile.write("".encode())
 
         # Delete a single animal from the list
         if resource == "customers":
-            update(id, post_body, resource)
+            storage.backend.update(id, post_body, resource)
 
             # Encode the new animal and send in response
             self.wfile.write("".encode())
@@ -257,11 +205,50 @@ class HandleRequests(BaseHTTPRequestHandler):
 
 # This function is not inside the class. It is the starting
 # point of this application.
-def main():
+def main(argv=None):
     """Starts the server on port 8088 using the HandleRequests class"""
-    host = ""
-    port = 8088
-    HTTPServer((host, port), HandleRequests).serve_forever()
+    parser = argparse.ArgumentParser(description="Kennel API server")
+    parser.add_argument("--host", default="")
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument(
+        "--storage",
+        choices=sorted(storage.BACKENDS),
+        default="memory",
+        help="where the resources are kept; 'memory' is lost on restart "
+        "without --data-dir",
+    )
+    parser.add_argument(
+        "--data-dir",
+        default=None,
+        help="directory of the write-ahead log and snapshots of --storage memory",
+    )
+    parser.add_argument(
+        "--fsync",
+        choices=storage.FSYNC_POLICIES,
+        default="always",
+        help="when the log of --data-dir is forced to disk",
+    )
+    parser.add_argument(
+        "--db",
+        default=None,
+        help="sqlite database file (default: $KENNEL_DB or ./kennel.sqlite3)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.db:
+        db.configure(path=args.db)
+    if args.storage == "sqlite":
+        migrations.migrate(db.database_path())
+    if args.storage == "memory":
+        storage.configure("memory", data_dir=args.data_dir, fsync=args.fsync)
+    else:
+        storage.configure(args.storage)
+    try:
+        HTTPServer((args.host, args.port), HandleRequests).serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        storage.backend.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,25 @@
+from .backend import StorageBackend
+from .memory import MemoryStorage
+from .sqlite import SqliteStorage
+from .wal import FSYNC_POLICIES, WriteAheadLog
+
+# The backends --storage may pick, by name
+BACKENDS = {
+    SqliteStorage.name: SqliteStorage,
+    MemoryStorage.name: MemoryStorage,
+}
+
+# The backend server.py and the routes read and write through
+backend = SqliteStorage()
+
+
+def configure(name, **options):
+    """Switches every entry point to another backend, before serving
+
+    Args:
+        name (string): a key of BACKENDS, e.g. "memory"
+        options (dict): passed on to the backend, e.g. data_dir= for memory
+    """
+    global backend
+    backend = BACKENDS[name](**options)
+    return backend
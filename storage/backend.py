@@ -0,0 +1,67 @@
+class StorageBackend:
+    """Where the resources are kept. server.py and the routes of
+    request_handler.py read and write through storage.backend, so either
+    entry point runs on any backend.
+
+    Rows are dictionaries in the columns of the models, e.g. an animal has
+    location_id and customer_id, and every backend returns them in the
+    shape the sqlite views give them: a collection read without filters
+    embeds the rows they point at under location and customer, other reads
+    set those to None. Values are stored as the types of their sqlite
+    columns, and a write breaking a unique index, e.g. a customer email
+    that is taken, raises sqlite3.IntegrityError on every backend.
+    """
+
+    # The name --storage picks the backend by
+    name = None
+
+    # Whether GET may also ask for ?fields=, ?_expand=, sorting, paging and
+    # streams, and whether /batch and /export work. Without them a backend
+    # answers plain reads and ?column=value filters only.
+    queries = False
+
+    def all(self, resource, query=None):
+        """Returns the rows of a resource, joined when there are no filters
+
+        Args:
+            resource (string): e.g. "animals"
+            query (dict): the parsed query string. Its ?column=value filters
+                are applied, a comma separating values any of which match
+        """
+        raise NotImplementedError
+
+    def retrieve(self, id, resource):
+        """Returns the row with the id, or None"""
+        raise NotImplementedError
+
+    def exists(self, id, resource):
+        """Returns whether there is a row with the id, without reading it"""
+        raise NotImplementedError
+
+    def create(self, resource, data):
+        """Adds a row sent by a client and returns it with its new id"""
+        raise NotImplementedError
+
+    def create_many(self, resource, rows):
+        """Adds many rows at once and returns their ids, in order"""
+        raise NotImplementedError
+
+    def update(self, id, data, resource):
+        """Replaces the row with the id. Returns whether there was one"""
+        raise NotImplementedError
+
+    def delete(self, id, resource):
+        """Deletes the row with the id. Returns whether there was one"""
+        raise NotImplementedError
+
+    def versions(self):
+        """Returns how many times each table has changed, by table name,
+        e.g. {"Animal": 12}, or None when the backend does not count"""
+        raise NotImplementedError
+
+    def health_check(self):
+        """Returns True when the backend can answer"""
+        raise NotImplementedError
+
+    def close(self):
+        """Lets go of what the backend holds, when the server shuts down"""
@@ -0,0 +1,324 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import repository
+from models import Animal, Customer, Employee, Location
+from views.customer_requests import customer_row
+from views.query import split_values
+
+from .backend import StorageBackend
+from .wal import (
+    WriteAheadLog,
+    read_records,
+    read_snapshot,
+    segment_numbers,
+    segment_path,
+    sync_directory,
+    write_snapshot,
+)
+
+# The model whose columns each resource keeps
+MODELS = {
+    "animals": Animal,
+    "locations": Location,
+    "customers": Customer,
+    "employees": Employee,
+}
+
+# Columns declared INTEGER in kennel.sql, besides id. The others are TEXT
+INTEGER_FIELDS = {
+    "animals": ("location_id", "customer_id"),
+    "employees": ("location_id",),
+}
+
+# Fields the sqlite views leave blank in a row embedded in another one, e.g.
+# in the customer of an animal
+EMBEDDED_BLANK = {"customers": ("email", "password")}
+
+# The sqlite table each resource stands for, so versions() counts the same
+# tables the ETags of the sqlite backend are built from
+TABLE_NAMES = {
+    "animals": "Animal",
+    "locations": "Location",
+    "customers": "Customer",
+    "employees": "Employee",
+}
+
+
+class MemoryStorage(StorageBackend):
+    """Keeps the resources in the hash-indexed tables of repository.py, in
+    this process.
+
+    Without a data_dir a restart starts over from repository.SEED. With one,
+    every write is appended to a write-ahead log there before it returns,
+    and a snapshot of all the rows is taken every snapshot_every writes,
+    after which the log before it is deleted. Starting up loads the
+    snapshot and replays the log written since.
+
+    Args:
+        database (Database): the tables to use without a data_dir, a new
+            one from SEED when None
+        data_dir (string): the directory of the snapshot and the log
+        fsync (string): when the log is forced to disk, see FSYNC_POLICIES
+        fsync_batch (number): writes per fsync for "batched"
+        fsync_interval (number): seconds between fsyncs for "interval"
+        snapshot_every (number): log records after which a snapshot is
+            taken in the background, 0 for none but the one on close()
+    """
+
+    name = "memory"
+    queries = False
+
+    def __init__(self, database=None, data_dir=None, fsync="always",
+                 fsync_batch=100, fsync_interval=1.0, snapshot_every=100000):
+        self.data_dir = data_dir
+        self.snapshot_every = snapshot_every
+        self.snapshots = 0
+        self.wal = None
+        # Writes are applied and logged in one order under _lock
+        self._lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        if data_dir is None:
+            self.database = repository.Database() if database is None else database
+            return
+
+        os.makedirs(data_dir, exist_ok=True)
+        (self.database, self.segment) = recover(data_dir)
+        self._log_options = (fsync, fsync_batch, fsync_interval)
+        self.wal = self._open_segment(self.segment)
+
+    def all(self, resource, query=None):
+        table = self.database[resource]
+        filters = {
+            field: [parse_value(value) for value in split_values(values)]
+            for (field, values) in (query or {}).items()
+            if field in table.indexes
+        }
+        # Like the sqlite views, only a collection read without filters
+        # embeds the rows its rows point at
+        embed = not filters
+        return [
+            answer_row(self.database, resource, row, embed)
+            for row in table.where(filters)
+        ]
+
+    def retrieve(self, id, resource):
+        row = self.database[resource].get(id)
+        return None if row is None else answer_row(self.database, resource, row)
+
+    def exists(self, id, resource):
+        return self.database[resource].get(id) is not None
+
+    def create(self, resource, data):
+        row = body_row(resource, data)
+        with self._lock, taken(resource):
+            self.database[resource].insert(row)
+            logged = self._log([["c", resource, row]])
+        self._commit(logged)
+        data["id"] = row["id"]
+        return data
+
+    def create_many(self, resource, rows):
+        rows = [body_row(resource, row) for row in rows]
+        with self._lock, taken(resource):
+            ids = self.database[resource].insert_many(rows)
+            logged = self._log([["m", resource, rows]])
+        self._commit(logged)
+        return ids
+
+    def update(self, id, data, resource):
+        row = body_row(resource, data)
+        with self._lock, taken(resource):
+            found = self.database[resource].replace(id, row)
+            logged = self._log([["u", resource, row]]) if found else None
+        self._commit(logged)
+        return found
+
+    def delete(self, id, resource):
+        with self._lock:
+            found = self.database[resource].remove(id)
+            logged = self._log([["d", resource, id]]) if found else None
+        self._commit(logged)
+        return found
+
+    def snapshot(self):
+        """Writes every row to a new snapshot and deletes the log before it.
+        Writes go on meanwhile, into a new log segment."""
+        with self._snapshot_lock:
+            self._snapshot()
+
+    def close(self):
+        if self.wal is None:
+            return
+        # Restarting from a snapshot is quicker than replaying the log
+        if self.wal.written:
+            self.snapshot()
+        self.wal.close()
+        if not self.wal.written:
+            os.remove(self.wal.path)
+
+    def _log(self, records):
+        """Appends records to the log, called under _lock in the order the
+        writes were applied. Returns what _commit() waits for."""
+        if self.wal is None:
+            return None
+        return (self.wal, self.wal.write(records))
+
+    def _commit(self, logged):
+        """Waits for the fsync policy, outside _lock so that writers waiting
+        together share an fsync, and starts a snapshot when one is due"""
+        if logged is None:
+            return
+        (wal, position) = logged
+        wal.commit(position)
+        if (
+            self.snapshot_every
+            and wal is self.wal
+            and wal.written >= self.snapshot_every
+            and self._snapshot_lock.acquire(blocking=False)
+        ):
+            threading.Thread(
+                target=self._snapshot_in_background, name="snapshot", daemon=True
+            ).start()
+
+    def _snapshot_in_background(self):
+        try:
+            self._snapshot()
+        finally:
+            self._snapshot_lock.release()
+
+    def _snapshot(self):
+        # The rows are never changed in place, so a copy of the lists is a
+        # consistent picture of every table
+        with self._lock:
+            old = self.wal
+            self.segment += 1
+            self.wal = self._open_segment(self.segment)
+            tables = {
+                resource: (table.next_id, table.version, table.all())
+                for (resource, table) in self.database.tables.items()
+            }
+        old.close()
+        write_snapshot(self.data_dir, self.segment, tables)
+        for number in segment_numbers(self.data_dir):
+            if number < self.segment:
+                os.remove(segment_path(self.data_dir, number))
+        sync_directory(self.data_dir)
+        self.snapshots += 1
+
+    def _open_segment(self, number):
+        path = segment_path(self.data_dir, number)
+        wal = WriteAheadLog(path, *self._log_options)
+        sync_directory(self.data_dir)
+        return wal
+
+    def versions(self):
+        return {
+            TABLE_NAMES[resource]: table.version
+            for (resource, table) in self.database.tables.items()
+        }
+
+    def health_check(self):
+        return True
+
+
+def recover(directory):
+    """Loads the snapshot in a directory and replays the log after it
+
+    Returns:
+        tuple: the Database, and the number of the log segment to write next
+    """
+    snapshot = read_snapshot(directory)
+    if snapshot is None:
+        (database, first) = (repository.Database(), 0)
+    else:
+        (header, rows) = snapshot
+        seed = dict({resource: [] for resource in repository.SEED}, **rows)
+        database = repository.Database(
+            seed, header["next_ids"], header.get("versions")
+        )
+        first = header["segment"]
+
+    segments = [number for number in segment_numbers(directory) if number >= first]
+    for number in segments:
+        for record in read_records(segment_path(directory, number)):
+            apply_record(database, record)
+    return (database, max(segments, default=first - 1) + 1)
+
+
+def apply_record(database, record):
+    """Replays one record of the log, see WriteAheadLog"""
+    (operation, resource, value) = record
+    if operation == "d":
+        database[resource].remove(value)
+    elif operation == "m":
+        database[resource].restore_many(value)
+    else:
+        database[resource].restore(value)
+
+
+@contextmanager
+def taken(resource):
+    """Turns the repository.UniqueError of a write to a resource into the
+    sqlite3.IntegrityError the unique index of the sqlite backend raises,
+    which the routes answer with a 409"""
+    try:
+        yield
+    except repository.UniqueError as ex:
+        table = TABLE_NAMES[resource]
+        raise sqlite3.IntegrityError(
+            f"UNIQUE constraint failed: {table}.{ex.field}"
+        ) from None
+
+
+def answer_row(database, resource, row, embed=False):
+    """Returns a copy of a stored row in the shape the sqlite backend gives
+    it: location and customer are set when embed is true and None when not,
+    and embedded customers have no email or password"""
+    answer = dict(row)
+    for (field, key, other) in repository.JOINS.get(resource, ()):
+        joined = database[other].get(row.get(field)) if embed else None
+        if joined is not None:
+            joined = dict(joined)
+            for blank in EMBEDDED_BLANK.get(other, ()):
+                joined[blank] = ""
+        answer[key] = joined
+    return answer
+
+
+def body_row(resource, data):
+    """Reads a row sent by a client into the columns of its model, the same
+    ones the sqlite backend writes, as the types sqlite would store. The id
+    is left for the table to set."""
+    if resource == "customers":
+        data = customer_row(data)
+    model = MODELS[resource]
+    integers = INTEGER_FIELDS.get(resource, ())
+    return {
+        name: None if name == "id" else column_value(data.get(name), name in integers)
+        for name in model.__slots__
+        if name not in model._records
+    }
+
+
+def column_value(value, integer):
+    """Converts a value the way the type affinity of its sqlite column does:
+    text holding a whole number goes in an INTEGER column as a number, and a
+    number goes in a TEXT column as text"""
+    if integer:
+        if isinstance(value, str) and value.isdigit():
+            return int(value)
+        return value
+    if isinstance(value, bool):
+        return str(int(value))
+    if isinstance(value, (int, float)):
+        return str(value)
+    return value
+
+
+def parse_value(value):
+    """Reads a filter value from the query string, where ids are text, into
+    the type it is stored as"""
+    return int(value) if value.isdigit() else value
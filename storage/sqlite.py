@@ -0,0 +1,117 @@
+import json
+
+import db
+from views import (
+    get_single_animal,
+    get_single_location,
+    get_single_employee,
+    get_single_customer,
+    iter_all_animals,
+    iter_all_locations,
+    iter_all_employees,
+    iter_all_customers,
+    create_animal,
+    create_animals,
+    create_location,
+    create_locations,
+    create_employee,
+    create_employees,
+    create_customer,
+    create_customers,
+    update_animal,
+    update_location,
+    update_employee,
+    update_customer,
+    delete_animal,
+    delete_location,
+    delete_employee,
+    delete_customer,
+    get_table_versions,
+)
+
+from .backend import StorageBackend
+
+# The views behind each resource
+#   table: the table its rows are kept in
+#   single/stream: read one row, and every row that matches a query
+RESOURCES = {
+    "animals": {
+        "table": "Animal",
+        "single": get_single_animal,
+        "stream": iter_all_animals,
+        "create": create_animal,
+        "create_many": create_animals,
+        "update": update_animal,
+        "delete": delete_animal,
+    },
+    "locations": {
+        "table": "Location",
+        "single": get_single_location,
+        "stream": iter_all_locations,
+        "create": create_location,
+        "create_many": create_locations,
+        "update": update_location,
+        "delete": delete_location,
+    },
+    "customers": {
+        "table": "Customer",
+        "single": get_single_customer,
+        "stream": iter_all_customers,
+        "create": create_customer,
+        "create_many": create_customers,
+        "update": update_customer,
+        "delete": delete_customer,
+    },
+    "employees": {
+        "table": "Employee",
+        "single": get_single_employee,
+        "stream": iter_all_employees,
+        "create": create_employee,
+        "create_many": create_employees,
+        "update": update_employee,
+        "delete": delete_employee,
+    },
+}
+
+
+class SqliteStorage(StorageBackend):
+    """Keeps the resources in the sqlite database db.py connects to, through
+    the views. The routes also call the views directly for everything a
+    query string can ask for."""
+
+    name = "sqlite"
+    queries = True
+
+    def all(self, resource, query=None):
+        return list(RESOURCES[resource]["stream"](query=query))
+
+    def retrieve(self, id, resource):
+        body = RESOURCES[resource]["single"](id)
+        return None if body is None else json.loads(body)
+
+    def exists(self, id, resource):
+        table = RESOURCES[resource]["table"]
+        with db.connection() as conn:
+            row = conn.execute(f"SELECT 1 FROM {table} WHERE id = ?", (id,))
+            return row.fetchone() is not None
+
+    def create(self, resource, data):
+        return RESOURCES[resource]["create"](data)
+
+    def create_many(self, resource, rows):
+        return RESOURCES[resource]["create_many"](rows)
+
+    def update(self, id, data, resource):
+        return RESOURCES[resource]["update"](id, data)
+
+    def delete(self, id, resource):
+        return RESOURCES[resource]["delete"](id)
+
+    def versions(self):
+        return get_table_versions()
+
+    def health_check(self):
+        return db.health_check()
+
+    def close(self):
+        db.close_all()
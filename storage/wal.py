@@ -0,0 +1,184 @@
+import glob
+import json
+import os
+import threading
+
+# When a write is forced to disk with fsync
+#   always: before the write returns. Writers that wait at the same time
+#       share one fsync (group commit)
+#   batched: once every batch_size writes, so a crash of the machine loses
+#       fewer than that many
+#   interval: every interval seconds, from a thread of the log's own
+# A write always reaches the OS before it returns, so a crash of the server
+# process alone loses nothing.
+FSYNC_POLICIES = ("always", "batched", "interval")
+
+SNAPSHOT_NAME = "snapshot.ndjson"
+
+# Rows per line of a snapshot. One json.loads of many rows is several times
+# quicker than one per row.
+SNAPSHOT_CHUNK_ROWS = 10000
+
+
+def encode_record(record):
+    """One compact JSON line, e.g. ["u","animals",{"id":2,...}]"""
+    return json.dumps(record, separators=(",", ":")) + "\n"
+
+
+def segment_path(directory, number):
+    return os.path.join(directory, f"wal-{number:08d}.ndjson")
+
+
+def segment_numbers(directory):
+    """The numbers of the log segments in a directory, in order"""
+    return sorted(
+        int(os.path.basename(path)[4:-7])
+        for path in glob.glob(os.path.join(directory, "wal-*.ndjson"))
+    )
+
+
+def sync_directory(directory):
+    """Makes the creation, renaming and removal of files in a directory
+    durable, which fsync of the files themselves does not"""
+    fd = os.open(directory, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class WriteAheadLog:
+    """One segment of the append-only log of writes to the memory backend.
+    Every record is a JSON line: ["c", resource, row] for a create, ["m",
+    resource, rows] for the rows of one create_many, ["u", resource, row]
+    for an update and ["d", resource, id] for a delete.
+
+    write() is called in the order the writes are applied, and commit()
+    after that without holding any lock, so writers can share an fsync.
+
+    Args:
+        path (string): the segment file, appended to if it exists
+        fsync (string): one of FSYNC_POLICIES
+        batch_size (number): writes per fsync for "batched"
+        interval (number): seconds between fsyncs for "interval"
+    """
+
+    def __init__(self, path, fsync="always", batch_size=100, interval=1.0):
+        if fsync not in FSYNC_POLICIES:
+            raise ValueError(f"fsync must be one of {', '.join(FSYNC_POLICIES)}.")
+        self.path = path
+        self.fsync = fsync
+        self.batch_size = batch_size
+        self.interval = interval
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        self._sync_lock = threading.Lock()
+        self._closed = threading.Event()
+        # Records written to the file, and how many of them fsync has covered
+        self.written = 0
+        self.synced = 0
+        self.fsyncs = 0
+        if fsync == "interval":
+            threading.Thread(
+                target=self._sync_every_interval, name="wal-fsync", daemon=True
+            ).start()
+
+    def write(self, records):
+        """Appends records to the file with one write
+
+        Returns:
+            number: the count of records written so far, to pass to commit()
+        """
+        data = "".join(map(encode_record, records)).encode()
+        while data:
+            data = data[os.write(self._fd, data):]
+        self.written += len(records)
+        return self.written
+
+    def commit(self, position):
+        """Returns once the records up to position are as durable as the
+        fsync policy asks for"""
+        if self.fsync == "always":
+            self.sync(position)
+        elif self.fsync == "batched" and position - self.synced >= self.batch_size:
+            self.sync(position)
+
+    def sync(self, position=None):
+        """Forces the records written so far to disk, unless an fsync that
+        started after position was written has done it already"""
+        with self._sync_lock:
+            if self._closed.is_set():
+                return
+            if position is not None and self.synced >= position:
+                return
+            written = self.written
+            os.fsync(self._fd)
+            self.synced = written
+            self.fsyncs += 1
+
+    def close(self):
+        """Forces what is left to disk and closes the file, once"""
+        self.sync()
+        with self._sync_lock:
+            if not self._closed.is_set():
+                self._closed.set()
+                os.close(self._fd)
+
+    def _sync_every_interval(self):
+        while not self._closed.wait(self.interval):
+            if self.synced < self.written:
+                self.sync()
+
+
+def read_records(path):
+    """Yields the records of a log segment. A last line that is cut short,
+    by a crash in the middle of a write, is left out."""
+    with open(path, "rb") as log:
+        for line in log:
+            if not line.endswith(b"\n"):
+                return
+            yield json.loads(line)
+
+
+def write_snapshot(directory, segment, tables):
+    """Writes every row to a new snapshot and puts it in place of the old
+    one in a single rename, so there always is one whole snapshot
+
+    Args:
+        segment (number): the first log segment written after the snapshot,
+            where replay starts
+        tables (dict): resource -> (the id its next insert gets, its change
+            version, its rows)
+    """
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    with open(path + ".tmp", "w", encoding="utf-8") as snapshot:
+        header = {
+            "segment": segment,
+            "next_ids": {resource: table[0] for (resource, table) in tables.items()},
+            # The versions go on from here after a restart, so an ETag from
+            # before it never names other rows
+            "versions": {resource: table[1] for (resource, table) in tables.items()},
+        }
+        snapshot.write(encode_record(header))
+        for (resource, (_, _, rows)) in tables.items():
+            for start in range(0, len(rows), SNAPSHOT_CHUNK_ROWS):
+                chunk = rows[start : start + SNAPSHOT_CHUNK_ROWS]
+                snapshot.write(encode_record([resource, chunk]))
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+    os.replace(path + ".tmp", path)
+    sync_directory(directory)
+
+
+def read_snapshot(directory):
+    """Returns the header of the snapshot and its rows by resource, or None
+    when there is no snapshot yet"""
+    path = os.path.join(directory, SNAPSHOT_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "rb") as snapshot:
+        header = json.loads(snapshot.readline())
+        rows = {resource: [] for resource in header["next_ids"]}
+        for line in snapshot:
+            (resource, chunk) = json.loads(line)
+            rows[resource].extend(chunk)
+    return (header, rows)
@@ -0,0 +1,89 @@
+import csv
+import io
+import json
+
+# Bytes gathered before a chunk is handed to the server engine. Big enough
+# that the per-chunk write overhead does not matter, small enough that the
+# memory a streamed response holds stays flat however many rows it has.
+CHUNK_SIZE = 65536
+
+
+def iter_chunks(pieces, chunk_size=CHUNK_SIZE):
+    """Joins the strings of an iterator into bytes of about chunk_size"""
+    gathered = []
+    size = 0
+    for piece in pieces:
+        gathered.append(piece)
+        size += len(piece)
+        if size >= chunk_size:
+            yield "".join(gathered).encode()
+            gathered = []
+            size = 0
+    if gathered:
+        yield "".join(gathered).encode()
+
+
+def iter_json_array(items, chunk_size=CHUNK_SIZE):
+    """Encodes the dictionaries of an iterator as one JSON array, yielding it
+    in pieces of about chunk_size bytes instead of building the whole string
+
+    Args:
+        items (iterator): the values to encode, e.g. iter_all_animals()
+        chunk_size (number): bytes to gather before yielding them
+    """
+
+    def pieces():
+        encode = json.JSONEncoder().encode
+        yield "["
+        for (index, item) in enumerate(items):
+            yield ", " + encode(item) if index else encode(item)
+        yield "]"
+
+    try:
+        yield from iter_chunks(pieces(), chunk_size)
+    finally:
+        close_items(items)
+
+
+def iter_ndjson(items, chunk_size=CHUNK_SIZE):
+    """Encodes the dictionaries of an iterator as NDJSON, one JSON object per
+    line, yielding it in pieces of about chunk_size bytes"""
+    encode = json.JSONEncoder().encode
+    try:
+        yield from iter_chunks((encode(item) + "\n" for item in items), chunk_size)
+    finally:
+        close_items(items)
+
+
+def iter_csv(items, columns, chunk_size=CHUNK_SIZE):
+    """Encodes the dictionaries of an iterator as CSV with a header row,
+    yielding it in pieces of about chunk_size bytes
+
+    Args:
+        items (iterator): the dictionaries to encode
+        columns (tuple): the keys to write, in order, also the header
+        chunk_size (number): bytes to gather before yielding them
+    """
+
+    def lines():
+        line = io.StringIO()
+        writer = csv.writer(line)
+        writer.writerow(columns)
+        for item in items:
+            writer.writerow([item[column] for column in columns])
+            yield line.getvalue()
+            line.seek(0)
+            line.truncate()
+        yield line.getvalue()
+
+    try:
+        yield from iter_chunks(lines(), chunk_size)
+    finally:
+        close_items(items)
+
+
+def close_items(items):
+    """Stops the query of a view generator when the client went away"""
+    close = getattr(items, "close", None)
+    if close is not None:
+        close()
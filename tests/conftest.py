@@ -0,0 +1,27 @@
+import os
+import shutil
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import cache  # noqa: E402
+import db  # noqa: E402
+import migrations  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def database(tmp_path_factory):
+    """A migrated copy of kennel.sqlite3 that db.py connects to, so the
+    checked-in file is never written. The caches start empty, so no module
+    reads what another one cached of its own copy."""
+    path = str(tmp_path_factory.mktemp("db") / "kennel.sqlite3")
+    shutil.copy(os.path.join(ROOT, "kennel.sqlite3"), path)
+    migrations.migrate(path)
+    db.configure(path=path)
+    cache.response_cache.clear()
+    cache.fragment_cache.clear()
+    yield path
+    db.close_all()
@@ -0,0 +1,45 @@
+"""A GET whose ETag the client already has is answered with a 304 from the
+ChangeVersion table alone, and only when a 200 would have been sent"""
+import pytest
+
+import cache
+import db
+import routes
+
+
+@pytest.fixture
+def etag(database):
+    ttl = cache.response_cache.ttl
+    cache.configure(ttl=0)
+    response = routes.dispatch("GET", "/animals")
+    yield dict(response.headers)["ETag"]
+    cache.configure(ttl=ttl)
+
+
+def test_not_modified_skips_the_view(etag):
+    with db.trace_statements() as statements:
+        response = routes.dispatch("GET", "/animals", headers={"If-None-Match": etag})
+
+    assert response.status == 304
+    assert not [sql for sql in statements if "FROM Animal" in sql]
+
+
+def test_not_modified_item_checks_it_exists(database):
+    with db.trace_statements() as statements:
+        found = routes.dispatch("GET", "/animals/1", headers={"If-None-Match": "*"})
+    missing = routes.dispatch("GET", "/animals/99999", headers={"If-None-Match": "*"})
+
+    assert found.status == 304
+    assert [sql for sql in statements if "FROM Animal" in sql] == [
+        "SELECT 1 FROM Animal WHERE id = 1"
+    ]
+    assert missing.status == 404
+
+
+@pytest.mark.parametrize(
+    "path", ["/animals?_sortBy=nope", "/animals?limit=abc", "/animals?fields=nope"]
+)
+def test_bad_query_is_not_modified_400(database, path):
+    response = routes.dispatch("GET", path, headers={"If-None-Match": "*"})
+
+    assert response.status == 400
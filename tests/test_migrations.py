@@ -0,0 +1,29 @@
+"""The migrated schema answers the filter queries from its indexes, and a
+second migrate() finds nothing left to apply"""
+import sqlite3
+
+import migrations
+
+
+def schema(path):
+    conn = sqlite3.connect(path)
+    try:
+        (version,) = conn.execute("PRAGMA user_version").fetchone()
+        objects = conn.execute(
+            "SELECT type, name, sql FROM sqlite_master ORDER BY type, name"
+        ).fetchall()
+        return (version, objects)
+    finally:
+        conn.close()
+
+
+def test_filter_queries_use_their_index(database):
+    assert migrations.check_indexes(database) == []
+
+
+def test_migrate_twice_changes_nothing(database):
+    before = schema(database)
+
+    assert migrations.migrate(database) == []
+    assert schema(database) == before
+    assert before[0] == migrations.MIGRATIONS[-1][0]
@@ -0,0 +1,35 @@
+"""GET /animals takes the filters of its QueryBuilder and answers any other
+query parameter with a 400 rather than every row"""
+import json
+
+import pytest
+
+import routes
+
+
+@pytest.mark.parametrize(
+    "path", ["/animals?stauts=Kennel", "/animals?name=Jax", "/export/animals?limit=1"]
+)
+def test_unknown_parameter_is_named(database, path):
+    response = routes.dispatch("GET", path)
+
+    assert response.status == 400
+    name = path.split("?")[1].split("=")[0]
+    assert f"?{name}=" in json.loads(response.body)["message"]
+
+
+def test_breed_matches_by_prefix(database):
+    routes.dispatch(
+        "POST",
+        "/animals",
+        body=json.dumps({
+            "name": "Jax", "breed": "Poodle mix", "status": "Kennel",
+            "location_id": 1, "customer_id": 1,
+        }).encode(),
+    )
+    response = routes.dispatch("GET", "/animals?breed=Poodle")
+
+    assert response.status == 200
+    breeds = {row["breed"] for row in json.loads(response.body)}
+    assert "Poodle mix" in breeds
+    assert all(breed.startswith("Poodle") for breed in breeds)
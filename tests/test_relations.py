@@ -0,0 +1,52 @@
+"""?_expand= and ?_embed= cost one SELECT for the rows plus one per
+relation, however many rows there are"""
+import pytest
+
+import db
+from routes import get, parse_url
+from views import create_animals
+
+# (path, SELECT statements expected)
+CHECKS = [
+    ("/animals", 1),
+    ("/animals?_expand=location", 2),
+    ("/animals?_expand=location,customer", 3),
+    ("/animals?status=Kennel&_expand=location,customer&limit=100", 3),
+    ("/animals?fields=name&_expand=customer&_sortBy=name&limit=50", 2),
+    ("/animals/1?_expand=location,customer", 3),
+    ("/employees?_expand=location", 2),
+    ("/employees?location_id=1&_expand=location", 2),
+    ("/locations?_embed=animals", 2),
+    ("/locations/1?_embed=animals", 2),
+    ("/customers?_embed=animals", 2),
+    ("/customers?fields=name&_embed=animals", 2),
+]
+
+
+@pytest.fixture(scope="module")
+def animals(database):
+    """Enough animals over the seeded locations and customers that a query
+    per row would show"""
+    create_animals(
+        [
+            {
+                "name": f"Animal {n}",
+                "breed": "Mutt",
+                "status": "Kennel",
+                "location_id": n % 2 + 1,
+                "customer_id": n % 4 + 1,
+            }
+            for n in range(500)
+        ]
+    )
+
+
+@pytest.mark.parametrize(("path", "expected"), CHECKS)
+def test_relations_cost_one_select_each(animals, path, expected):
+    (resource, id, query) = parse_url(path)
+    with db.trace_statements() as statements:
+        response = get(resource, id, query)
+
+    assert response.status == 200
+    selects = [sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == expected, selects
@@ -0,0 +1,84 @@
+"""POST and PUT bodies are checked before they reach the storage backend, and
+a bad one is answered with a 400 rather than a 500 or a half-written row"""
+import json
+
+import pytest
+
+import routes
+import storage
+
+
+def send(method, path, body):
+    return routes.dispatch(method, path, body=json.dumps(body).encode())
+
+
+@pytest.mark.parametrize(
+    "body",
+    [
+        {"name": "Jax"},
+        {
+            "name": "Jax", "breed": ["Mutt"], "status": "Kennel",
+            "location_id": 1, "customer_id": 1,
+        },
+        5,
+        "x",
+    ],
+)
+def test_put_checks_the_body(database, body):
+    response = send("PUT", "/animals/1", body)
+
+    assert response.status == 400
+    assert json.loads(response.body)["message"]
+
+
+@pytest.mark.parametrize("body", [5, "x", None, True])
+def test_post_needs_an_object(database, body):
+    response = send("POST", "/animals", body)
+
+    assert response.status == 400
+    assert json.loads(response.body)["message"] == "Each row must be an object."
+
+
+@pytest.fixture(params=["sqlite", "memory"])
+def backend(database, monkeypatch, request):
+    if request.param == "memory":
+        monkeypatch.setattr(storage, "backend", storage.MemoryStorage())
+    return request.param
+
+
+def test_customer_email_is_unique(backend):
+    first = send("POST", "/customers", {"fullName": "Ann", "email": f"ann@{backend}"})
+    again = send("POST", "/customers", {"fullName": "Bo", "email": f"ann@{backend}"})
+    both = send(
+        "POST",
+        "/customers",
+        [{"fullName": "Cy", "email": f"cy@{backend}"}] * 2,
+    )
+    kept = send(
+        "PUT",
+        f"/customers/{json.loads(first.body)['id']}",
+        {"fullName": "Ann B", "email": f"ann@{backend}"},
+    )
+
+    assert first.status == 201
+    assert again.status == 409
+    assert both.status == 409
+    assert kept.status == 204
+    assert "UNIQUE constraint failed: Customer.email" in json.loads(again.body)["message"]
+
+
+def test_ids_sent_as_text_are_stored_as_numbers(backend):
+    created = send(
+        "POST",
+        "/animals",
+        {
+            "name": "Jax", "breed": "Mutt", "status": "Kennel",
+            "location_id": "2", "customer_id": "1",
+        },
+    )
+    id = json.loads(created.body)["id"]
+    animal = json.loads(routes.dispatch("GET", f"/animals/{id}").body)
+    found = json.loads(routes.dispatch("GET", "/animals?location_id=2").body)
+
+    assert (animal["location_id"], animal["customer_id"]) == (2, 1)
+    assert id in [row["id"] for row in found]
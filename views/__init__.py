@@ -1,32 +1,57 @@
 from .animal_requests import (
     get_all_animals,
     create_animal,
+    create_animals,
     get_single_animal,
     delete_animal,
     update_animal,
     get_animal_by_location,
-    get_animal_by_status
+    get_animal_by_status,
+    iter_all_animals,
+    ANIMAL_FIELDS,
+    ANIMAL_QUERY,
+    ANIMALS_BY_LOCATION,
+    ANIMALS_BY_CUSTOMER,
 )
 from .location_requests import (
     get_all_locations,
     get_single_location,
     create_location,
+    create_locations,
     delete_location,
     update_location,
+    iter_all_locations,
+    LOCATION_FIELDS,
+    LOCATION_QUERY,
+    LOCATION_RELATION,
 )
 from .employee_requests import (
     get_all_employees,
     get_single_employee,
     create_employee,
+    create_employees,
     delete_employee,
     update_employee,
-    get_employee_by_location
+    get_employee_by_location,
+    iter_all_employees,
+    EMPLOYEE_FIELDS,
+    EMPLOYEE_QUERY,
 )
 from .customer_requests import (
     get_all_customers,
     get_single_customer,
     create_customer,
+    create_customers,
     delete_customer,
     update_customer,
     get_customer_by_email,
+    iter_all_customers,
+    CUSTOMER_FIELDS,
+    CUSTOMER_QUERY,
+    CUSTOMER_RELATION,
 )
+from .version_requests import get_table_versions
+from .paging import Page
+from .query import QueryBuilder
+from .relations import Relation
+from .encoder import RowEncoder, Value
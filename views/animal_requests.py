@@ -1,9 +1,15 @@
-import sqlite3
 import json
 
+from db import connection, iter_batches, queued_write, retry_on_locked
 from models import Animal
 from models import Location
 from models import Customer
+from .bulk import insert_many
+from .encoder import RowEncoder, Value
+from .paging import Page
+from .projection import Projection
+from .query import QueryBuilder
+from .relations import Relation, load_relations, relation_keys
 from .location_requests import get_single_location
 from .customer_requests import get_single_customer
 
@@ -35,17 +41,7 @@ from .customer_requests import get_single_customer
 # ]
 
 
-def get_all_animals():
-    # Open a connection to the database
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-
-        # Just use these. It's a Black Box.
-        conn.row_factory = sqlite3.Row
-        db_cursor = conn.cursor()
-
-        # Write the SQL query to get the information you want
-        db_cursor.execute(
-            """
+ALL_ANIMALS_SQL = """
      SELECT
     a.id,
     a.name,
@@ -53,177 +49,241 @@ def get_all_animals():
     a.status,
     a.location_id,
     a.customer_id,
+    a.version,
     l.name location_name,
     l.address location_address,
+    l.version location_version,
 	c.name customer_name,
-	c.address customer_address
+	c.address customer_address,
+	c.version customer_version
 FROM Animal a
 JOIN Location l
     ON l.id = a.location_id
 JOIN Customer c
 	ON c.id = a.customer_id
         """
-        )
 
-        # Initialize an empty list to hold all animal representations
-        animals = []
+# The query of the single animal and the filters, without the joins
+ANIMAL_SQL = """
+        SELECT
+            a.id,
+            a.name,
+            a.breed,
+            a.status,
+            a.location_id,
+            a.customer_id,
+            a.version
+        FROM animal a
+        """
 
-        # Convert rows of data into a Python list
-        dataset = db_cursor.fetchall()
+# What ?fields= may ask for. location and customer join their tables, the
+# other fields are columns of Animal.
+ANIMAL_FIELDS = Projection(
+    "Animal",
+    "a",
+    ("id", "name", "breed", "status", "location_id", "customer_id", "updated_at"),
+    {
+        "location": ("Location", "l", "location_id", ("id", "name", "address")),
+        "customer": ("Customer", "c", "customer_id", ("id", "name", "address")),
+    },
+)
+
+
+def animal_from_row(row):
+    """Builds the dictionary of an animal from a row of ANIMAL_SQL"""
+    return Animal.from_row(row).to_dict()
+
+
+def animal_with_relations(row):
+    """Builds the dictionary of an animal with its location and customer from
+    a row of ALL_ANIMALS_SQL"""
+
+    # Create an animal instance from the current row
+    animal = Animal.from_row(row)
+
+    # Create a Location instance from the current row
+    location = Location(
+        row["location_id"], row["location_name"], row["location_address"]
+    )
+
+    customer = Customer(
+        row["customer_id"], row["customer_name"], row["customer_address"]
+    )
+
+    # Add the location and customer to the animal, to_dict() turns them into
+    # dictionaries too
+    animal.location = location
+    animal.customer = customer
+
+    return animal.to_dict()
+
+
+# The JSON of the rows of ANIMAL_SQL and ALL_ANIMALS_SQL, the same as that of
+# animal_from_row and animal_with_relations. It is cached per row, until the
+# animal or a joined location or customer changes version.
+ANIMAL_LAYOUT = (
+    ("id", "id"),
+    ("name", "name"),
+    ("breed", "breed"),
+    ("status", "status"),
+    ("location_id", "location_id"),
+    ("customer_id", "customer_id"),
+)
+ANIMAL_ENCODER = RowEncoder(
+    ANIMAL_LAYOUT + (("location", Value(None)), ("customer", Value(None))),
+    animal_from_row,
+    versions=("version",),
+)
+ANIMAL_WITH_RELATIONS_ENCODER = RowEncoder(
+    ANIMAL_LAYOUT
+    + (
+        (
+            "location",
+            (
+                ("id", "location_id"),
+                ("name", "location_name"),
+                ("address", "location_address"),
+            ),
+        ),
+        (
+            "customer",
+            (
+                ("id", "customer_id"),
+                ("name", "customer_name"),
+                ("address", "customer_address"),
+                ("email", Value("")),
+                ("password", Value("")),
+            ),
+        ),
+    ),
+    animal_with_relations,
+    versions=("version", "location_version", "customer_version"),
+)
+
+
+# The animals of a location or customer, for ?_embed=animals
+ANIMALS_BY_LOCATION = Relation(
+    "id", ANIMAL_SQL, "a.location_id", animal_from_row, many=True
+)
+ANIMALS_BY_CUSTOMER = Relation(
+    "id", ANIMAL_SQL, "a.customer_id", animal_from_row, many=True
+)
+
+
+# The filters, prefix match and sort orders of GET /animals, e.g.
+# ?status=Kennel,Treatment&location_id=2&breed=Poo&_sortBy=name. ?breed=
+# matches by prefix, breed_prefix= is the older name for it
+ANIMAL_QUERY = QueryBuilder(
+    ANIMAL_FIELDS,
+    filters=("status", "location_id", "customer_id"),
+    prefixes={"breed": "breed", "breed_prefix": "breed"},
+    minimums={"updated_since": "updated_at"},
+    sorts=("id", "name", "breed", "status"),
+    full=(ALL_ANIMALS_SQL, ANIMAL_WITH_RELATIONS_ENCODER),
+    flat=(ANIMAL_SQL, ANIMAL_ENCODER),
+)
+
+
+def get_all_animals(page=None, fields=None, query=None, relations=()):
+    """Returns the animals that match the filters of a query string as JSON.
+    Without filters or fields every animal comes with its location and
+    customer.
+
+    Args:
+        page (Page): the sort and keyset page, all animals when None
+        fields (tuple): the fields to read, every one of them when None
+        query (dict): the parsed query string, see ANIMAL_QUERY
+    """
+    page = page or Page()
+    (sql, params, encoder) = ANIMAL_QUERY.build(
+        query, page, fields, relation_keys(relations)
+    )
 
-        # Iterate list of data returned from database
-        for row in dataset:
+    # Open a connection to the database
+    with connection() as conn:
 
-            # Create an animal instance from the current row
-            animal = Animal(
-                row["id"],
-                row["name"],
-                row["breed"],
-                row["status"],
-                row["location_id"],
-                row["customer_id"],
-            )
+        # Just use these. It's a Black Box.
+        db_cursor = conn.cursor()
 
-            # Create a Location instance from the current row
-            location = Location(
-                row["id"], row["location_name"], row["location_address"]
-            )
+        # Write the SQL query to get the information you want
+        db_cursor.execute(sql, params)
 
-            customer = Customer(
-                row["id"], row["customer_name"], row["customer_address"]
-            )
+        # Convert rows of data into a Python list
+        dataset = page.trim(db_cursor.fetchall())
 
-            # Add the dictionary representation of the location to the animal
-            animal.location = location.__dict__
-            animal.customer = customer.__dict__
+        # Add the dictionary representation of every animal to the list
+        # Without relations the rows go straight to JSON, with no model
+        # or dictionary built per row
+        if not relations:
+            return encoder.encode(dataset)
 
-            # Add the dictionary representation of the animal to the list
-            animals.append(animal.__dict__)
+        animals = [encoder.to_dict(row) for row in dataset]
+        load_relations(conn, relations, dataset, animals)
 
         return json.dumps(animals)
 
 
+def iter_all_animals(fields=None, query=None, page=None, relations=()):
+    """Yields the animals that match a query string as dictionaries while
+    reading the cursor in batches, so a streamed response never holds the
+    whole table"""
+    (sql, params, encoder) = ANIMAL_QUERY.build(
+        query, page, fields, relation_keys(relations)
+    )
+    with connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(sql, params)
+
+        # Relations are loaded for each batch, one query per batch
+        for rows in iter_batches(db_cursor):
+            items = [encoder.to_dict(row) for row in rows]
+            load_relations(conn, relations, rows, items)
+            yield from items
+
+
 # Function with a single parameter
 
 
-def get_single_animal(id):
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-        conn.row_factory = sqlite3.Row
+def get_single_animal(id, fields=None, relations=()):
+    (sql, encoder) = (
+        ANIMAL_FIELDS.select(fields, relation_keys(relations)) if fields
+        else (ANIMAL_SQL, ANIMAL_ENCODER)
+    )
+
+    with connection() as conn:
         db_cursor = conn.cursor()
 
         # Use a ? parameter to inject a variable's value
         # into the SQL statement.
-        db_cursor.execute(
-            """
-        SELECT
-            a.id,
-            a.name,
-            a.breed,
-            a.status,
-            a.location_id,
-            a.customer_id
-        FROM animal a
-        WHERE a.id = ?
-        """,
-            (id,),
-        )
+        db_cursor.execute(sql + " WHERE a.id = ?", (id,))
 
         # Load the single result into memory
         data = db_cursor.fetchone()
+        if data is None:
+            return None
 
-        # Create an animal instance from the current row
-        animal = Animal(
-            data["id"],
-            data["name"],
-            data["breed"],
-            data["status"],
-            data["location_id"],
-            data["customer_id"],
-        )
+        if not relations:
+            return encoder.encode_one(data)
 
-        return json.dumps(animal.__dict__)
+        item = encoder.to_dict(data)
+        load_relations(conn, relations, [data], [item])
 
+        return json.dumps(item)
 
-def get_animal_by_location(location_id):
 
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-        conn.row_factory = sqlite3.Row
-        db_cursor = conn.cursor()
+def get_animal_by_location(location_id, page=None, fields=None):
+    return get_all_animals(page, fields, {"location_id": [str(location_id)]})
 
-        # Write the SQL query to get the information you want
-        db_cursor.execute(
-            """
-        select
-            a.id,
-            a.name,
-            a.breed,
-            a.status,
-            a.location_id,
-            a.customer_id
-        FROM animal a
-        WHERE a.location_id = ?
-        """,
-            (location_id,),
-        )
-
-        animals = []
-        dataset = db_cursor.fetchall()
 
-        for row in dataset:
-            animal = Animal(
-                row["id"],
-                row["name"],
-                row["breed"],
-                row["status"],
-                row["location_id"],
-                row["customer_id"],
-            )
-            animals.append(animal.__dict__)
-
-    return json.dumps(animals)
-
-
-def get_animal_by_status(status):
+def get_animal_by_status(status, page=None, fields=None):
     """This function allows client get animals that meet the given status"""
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-        conn.row_factory = sqlite3.Row
-        db_cursor = conn.cursor()
-
-        # Write the SQL query to get the information you want
-        db_cursor.execute(
-            """
-        select
-            a.id,
-            a.name,
-            a.breed,
-            a.status,
-            a.location_id,
-            a.customer_id
-        FROM animal a
-        WHERE a.status = ?
-        """,
-            (status,),
-        )
-
-        animals = []
-        dataset = db_cursor.fetchall()
-
-        for row in dataset:
-            animal = Animal(
-                row["id"],
-                row["name"],
-                row["breed"],
-                row["status"],
-                row["location_id"],
-                row["customer_id"],
-            )
-            animals.append(animal.__dict__)
-
-    return json.dumps(animals)
+    return get_all_animals(page, fields, {"status": [status]})
 
 
+@queued_write
+@retry_on_locked
 def create_animal(new_animal):
-    with sqlite3.connect("./kennel.sqlite3") as conn:
+    with connection() as conn:
         db_cursor = conn.cursor()
 
         db_cursor.execute("""
@@ -245,12 +305,28 @@ def create_animal(new_animal):
         # primary key in the response.
         new_animal['id'] = id
 
-
     return new_animal
 
 
+@retry_on_locked
+def create_animals(new_animals):
+    """Adds many animals with one executemany in one transaction
+
+    Args:
+        new_animals (list): dictionaries with the keys create_animal needs
+
+    Returns:
+        list: the ids given to the animals, in order
+    """
+    return insert_many(
+        "Animal", ("name", "breed", "status", "location_id", "customer_id"), new_animals
+    )
+
+
+@queued_write
+@retry_on_locked
 def delete_animal(id):
-    with sqlite3.connect("./kennel.sqlite3") as conn:
+    with connection() as conn:
         db_cursor = conn.cursor()
 
         db_cursor.execute(
@@ -261,9 +337,13 @@ def delete_animal(id):
             (id,),
         )
 
+        return db_cursor.rowcount > 0
+
 
+@queued_write
+@retry_on_locked
 def update_animal(id, new_animal):
-    with sqlite3.connect("./kennel.sqlite3") as conn:
+    with connection() as conn:
         db_cursor = conn.cursor()
 
         db_cursor.execute(
@@ -1,154 +1,228 @@
-import sqlite3
 import json
-from models import Customer
 
+from db import connection, iter_batches, queued_write, retry_on_locked
+from models import Customer
+from .bulk import insert_many
+from .encoder import RowEncoder
+from .paging import Page
+from .projection import Projection
+from .query import QueryBuilder
+from .relations import Relation, load_relations, relation_keys
 
-def get_all_customers():
-    """function to get all customers"""
-    with sqlite3.connect("./kennel.sqlite3") as conn:
 
-        # Just use these. It's a Black Box.
-        conn.row_factory = sqlite3.Row
-        db_cursor = conn.cursor()
-
-        # Write the SQL query to get the information you want
-        db_cursor.execute(
-            """
+ALL_CUSTOMERS_SQL = """
         SELECT
             c.id,
             c.name,
             c.address,
             c.email,
-            c.password
+            c.password,
+            c.version
         FROM customer c
         """
-        )
 
-        # Initialize an empty list to hold all animal representations
-        customers = []
+# What ?fields= may ask for, all of them columns of Customer
+CUSTOMER_FIELDS = Projection(
+    "Customer", "c", ("id", "name", "address", "email", "password", "updated_at")
+)
+
+
+def customer_from_row(row):
+    """Builds the dictionary of a customer from a row of ALL_CUSTOMERS_SQL"""
+    return Customer.from_row(row).to_dict()
+
+
+# The JSON of a row of ALL_CUSTOMERS_SQL, the same as that of customer_from_row,
+# cached per row version
+CUSTOMER_ENCODER = RowEncoder(
+    (
+        ("id", "id"),
+        ("name", "name"),
+        ("address", "address"),
+        ("email", "email"),
+        ("password", "password"),
+    ),
+    customer_from_row,
+    versions=("version",),
+)
+
+
+# The customer of an animal, for ?_expand=customer
+CUSTOMER_RELATION = Relation(
+    "customer_id", ALL_CUSTOMERS_SQL, "c.id", customer_from_row
+)
+
+
+# The filters and sort orders of GET /customers, e.g.
+# ?email=mo@silvera.com or ?_sortBy=name&_order=desc
+CUSTOMER_QUERY = QueryBuilder(
+    CUSTOMER_FIELDS,
+    filters=("email",),
+    minimums={"updated_since": "updated_at"},
+    sorts=("id", "name", "email"),
+    full=(ALL_CUSTOMERS_SQL, CUSTOMER_ENCODER),
+)
+
+
+def get_all_customers(page=None, fields=None, query=None, relations=()):
+    """function to get all customers"""
+    page = page or Page()
+    (sql, params, encoder) = CUSTOMER_QUERY.build(
+        query, page, fields, relation_keys(relations)
+    )
+
+    with connection() as conn:
+
+        # Just use these. It's a Black Box.
+        db_cursor = conn.cursor()
+
+        # Write the SQL query to get the information you want
+        db_cursor.execute(sql, params)
 
         # Convert rows of data into a Python list
-        dataset = db_cursor.fetchall()
+        dataset = page.trim(db_cursor.fetchall())
+
+        # Without relations the rows go straight to JSON, with no model
+        # or dictionary built per row
+        if not relations:
+            return encoder.encode(dataset)
 
         # Iterate list of data returned from database
-        for row in dataset:
+        customers = [encoder.to_dict(row) for row in dataset]
+        load_relations(conn, relations, dataset, customers)
 
-            # Create an animal instance from the current row.
-            # Note that the database fields are specified in
-            # exact order of the parameters defined in the
-            # Animal class above.
-            customer = Customer(
-                row["id"], row["name"], row["address"], row["email"], row["password"]
-            )
+    return json.dumps(customers)
 
-            customers.append(customer.__dict__)
 
-    return json.dumps(customers)
+def iter_all_customers(fields=None, query=None, page=None, relations=()):
+    """Yields the customers that match a query string as dictionaries,
+    reading the cursor in batches"""
+    (sql, params, encoder) = CUSTOMER_QUERY.build(
+        query, page, fields, relation_keys(relations)
+    )
+    with connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(sql, params)
+
+        # Relations are loaded for each batch, one query per batch
+        for rows in iter_batches(db_cursor):
+            items = [encoder.to_dict(row) for row in rows]
+            load_relations(conn, relations, rows, items)
+            yield from items
 
 
-def get_single_customer(id):
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-        conn.row_factory = sqlite3.Row
+def get_single_customer(id, fields=None, relations=()):
+    (sql, encoder) = (
+        CUSTOMER_FIELDS.select(fields, relation_keys(relations)) if fields
+        else (ALL_CUSTOMERS_SQL, CUSTOMER_ENCODER)
+    )
+
+    with connection() as conn:
         db_cursor = conn.cursor()
 
         # Use a ? parameter to inject a variable's value
         # into the SQL statement.
-        db_cursor.execute(
-            """
-        SELECT
-            c.id,
-            c.name,
-            c.address,
-            c.email,
-            c.password
-        FROM customer c
-        WHERE c.id = ?
-        """,
-            (id,),
-        )
+        db_cursor.execute(sql + " WHERE c.id = ?", (id,))
 
         # Load the single result into memory
         data = db_cursor.fetchone()
+        if data is None:
+            return None
 
-        # Create an animal instance from the current row
-        customer = Customer(
-            data["id"], data["name"], data["address"], data["email"], data["password"]
-        )
+        if not relations:
+            return encoder.encode_one(data)
 
-        return json.dumps(customer.__dict__)
+        item = encoder.to_dict(data)
+        load_relations(conn, relations, [data], [item])
 
+        return json.dumps(item)
 
-def get_customer_by_email(email):
 
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-        conn.row_factory = sqlite3.Row
+def get_customer_by_email(email, page=None, fields=None):
+    return get_all_customers(page, fields, {"email": [email]})
+
+
+def customer_row(customer):
+    """Reads a customer sent by a client into the columns of Customer. The
+    name is sent as fullName, and the address and password may be left out"""
+    return {
+        "name": customer["fullName"] if "fullName" in customer else customer["name"],
+        "address": customer.get("address", ""),
+        "email": customer["email"],
+        "password": customer.get("password", ""),
+    }
+
+
+@queued_write
+@retry_on_locked
+def create_customer(new_customer):
+    row = customer_row(new_customer)
+    with connection() as conn:
         db_cursor = conn.cursor()
 
-        # Write the SQL query to get the information you want
         db_cursor.execute(
             """
-        select
-            c.id,
-            c.name,
-            c.address,
-            c.email,
-            c.password
-        from Customer c
-        WHERE c.email = ?
+        INSERT INTO Customer
+        ( name, address, email, password )
+        VALUES
+        ( ?, ?, ?, ? );
         """,
-            (email,),
+            (row["name"], row["address"], row["email"], row["password"]),
         )
 
-        customers = []
-        dataset = db_cursor.fetchall()
+        # Send the primary key back to the client with the customer
+        new_customer["id"] = db_cursor.lastrowid
 
-        for row in dataset:
-            customer = Customer(
-                row["id"], row["name"], row["address"], row["email"], row["password"]
-            )
-            customers.append(customer.__dict__)
+    return new_customer
 
-    return json.dumps(customers)
-
-
-def create_customer(customer):
-    # Get the id value of the last animal in the list
-    max_id = CUSTOMERS[-1]["id"]
-
-    # Add 1 to whatever that number is
-    new_id = max_id + 1
-
-    # Add an `id` property to the animal dictionary
-    customer["id"] = new_id
 
-    # Add the animal dictionary to the list
-    CUSTOMERS.append(customer)
+@retry_on_locked
+def create_customers(new_customers):
+    """Adds many customers with one executemany in one transaction
 
-    # Return the dictionary with `id` property added
-    return customer
+    Returns:
+        list: the ids given to the customers, in order
+    """
+    rows = [customer_row(customer) for customer in new_customers]
+    return insert_many("Customer", ("name", "address", "email", "password"), rows)
 
 
+@queued_write
+@retry_on_locked
 def delete_customer(id):
-    # Initial -1 value for animal index, in case one isn't found
-    customer_index = -1
+    with connection() as conn:
+        db_cursor = conn.cursor()
 
-    # Iterate the ANIMALS list, but use enumerate() so that you
-    # can access the index value of each item
-    for index, customer in enumerate(CUSTOMERS):
-        if customer["id"] == id:
-            # Found the animal. Store the current index.
-            customer_index = index
+        db_cursor.execute(
+            """
+        DELETE FROM customer
+        WHERE id = ?
+        """,
+            (id,),
+        )
 
-    # If the animal was found, use pop(int) to remove it from list
-    if customer_index >= 0:
-        CUSTOMERS.pop(customer_index)
+        return db_cursor.rowcount > 0
 
 
+@queued_write
+@retry_on_locked
 def update_customer(id, new_customer):
-    # Iterate the ANIMALS list, but use enumerate() so that
-    # you can access the index value of each item.
-    for index, customer in enumerate(CUSTOMERS):
-        if customer["id"] == id:
-            # Found the animal. Update the value.
-            CUSTOMERS[index] = new_customer
-            break
+    row = customer_row(new_customer)
+    with connection() as conn:
+        db_cursor = conn.cursor()
+
+        db_cursor.execute(
+            """
+        UPDATE Customer
+            SET
+                name = ?,
+                address = ?,
+                email = ?,
+                password = ?
+        WHERE id = ?
+        """,
+            (row["name"], row["address"], row["email"], row["password"], id),
+        )
+
+        # False when there is no customer with the id, a 404
+        return db_cursor.rowcount > 0
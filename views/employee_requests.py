@@ -1,164 +1,261 @@
-import sqlite3
 import json
+
+from db import connection, iter_batches, queued_write, retry_on_locked
 from models import Employee
 from models import Location
+from .bulk import insert_many
+from .encoder import RowEncoder, Value
+from .paging import Page
+from .projection import Projection
+from .query import QueryBuilder
+from .relations import load_relations, relation_keys
 
 
-EMPLOYEES = [{"id": 1, "name": "Jenna Solis"}]
-
-
-def get_all_employees():
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-
-        # Just use these. It's a Black Box.
-        conn.row_factory = sqlite3.Row
-        db_cursor = conn.cursor()
-
-        # Write the SQL query to get the information you want
-        db_cursor.execute(
-            """
+ALL_EMPLOYEES_SQL = """
         SELECT
     e.id,
     e.name,
     e.address,
     e.location_id,
+    e.version,
 	l.name location_name,
-	l.address location_address
+	l.address location_address,
+	l.version location_version
 FROM employee e
 JOIN Location l
 	ON l.id = e.location_id
         """
-        )
 
-        # Initialize an empty list to hold all animal representations
-        employees = []
+# The query of the single employee and the filter, without the join
+EMPLOYEE_SQL = """
+        SELECT
+            e.id,
+            e.name,
+            e.address,
+            e.location_id,
+            e.version
+        FROM employee e
+        """
+
+# What ?fields= may ask for. location joins Location, the other fields are
+# columns of Employee.
+EMPLOYEE_FIELDS = Projection(
+    "Employee",
+    "e",
+    ("id", "name", "address", "location_id", "updated_at"),
+    {"location": ("Location", "l", "location_id", ("id", "name", "address"))},
+)
+
+
+def employee_from_row(row):
+    """Builds the dictionary of an employee from a row of EMPLOYEE_SQL"""
+    return Employee.from_row(row).to_dict()
+
+
+def employee_with_location(row):
+    """Builds the dictionary of an employee with its location from a row of
+    ALL_EMPLOYEES_SQL"""
+    employee = Employee.from_row(row)
+
+    location = Location(
+        row["location_id"], row["location_name"], row["location_address"]
+    )
+
+    employee.location = location
+
+    return employee.to_dict()
+
+
+# The JSON of the rows of EMPLOYEE_SQL and ALL_EMPLOYEES_SQL, the same as that
+# of employee_from_row and employee_with_location, cached per row version
+EMPLOYEE_LAYOUT = (
+    ("id", "id"),
+    ("name", "name"),
+    ("address", "address"),
+    ("location_id", "location_id"),
+)
+EMPLOYEE_ENCODER = RowEncoder(
+    EMPLOYEE_LAYOUT + (("location", Value(None)),),
+    employee_from_row,
+    versions=("version",),
+)
+EMPLOYEE_WITH_LOCATION_ENCODER = RowEncoder(
+    EMPLOYEE_LAYOUT
+    + (
+        (
+            "location",
+            (
+                ("id", "location_id"),
+                ("name", "location_name"),
+                ("address", "location_address"),
+            ),
+        ),
+    ),
+    employee_with_location,
+    versions=("version", "location_version"),
+)
+
+
+# The filters and sort orders of GET /employees, e.g.
+# ?location_id=1,2&_sortBy=name
+EMPLOYEE_QUERY = QueryBuilder(
+    EMPLOYEE_FIELDS,
+    filters=("location_id",),
+    minimums={"updated_since": "updated_at"},
+    sorts=("id", "name"),
+    full=(ALL_EMPLOYEES_SQL, EMPLOYEE_WITH_LOCATION_ENCODER),
+    flat=(EMPLOYEE_SQL, EMPLOYEE_ENCODER),
+)
+
+
+def get_all_employees(page=None, fields=None, query=None, relations=()):
+    page = page or Page()
+    (sql, params, encoder) = EMPLOYEE_QUERY.build(
+        query, page, fields, relation_keys(relations)
+    )
+
+    with connection() as conn:
+
+        # Just use these. It's a Black Box.
+        db_cursor = conn.cursor()
+
+        # Write the SQL query to get the information you want
+        db_cursor.execute(sql, params)
 
         # Convert rows of data into a Python list
-        dataset = db_cursor.fetchall()
+        dataset = page.trim(db_cursor.fetchall())
+
+        # Without relations the rows go straight to JSON, with no model
+        # or dictionary built per row
+        if not relations:
+            return encoder.encode(dataset)
 
         # Iterate list of data returned from database
-        for row in dataset:
+        employees = [encoder.to_dict(row) for row in dataset]
+        load_relations(conn, relations, dataset, employees)
 
-            # Create an animal instance from the current row.
-            # Note that the database fields are specified in
-            # exact order of the parameters defined in the
-            # Animal class above.
-            employee = Employee(
-                row["id"], row["name"], row["address"], row["location_id"]
-            )
+    return json.dumps(employees)
 
-            location = Location(
-                row["id"], row["location_name"], row["location_address"]
-            )
 
-            employee.location = location.__dict__
+def iter_all_employees(fields=None, query=None, page=None, relations=()):
+    """Yields the employees that match a query string as dictionaries,
+    reading the cursor in batches"""
+    (sql, params, encoder) = EMPLOYEE_QUERY.build(
+        query, page, fields, relation_keys(relations)
+    )
+    with connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(sql, params)
 
-            employees.append(employee.__dict__)
+        # Relations are loaded for each batch, one query per batch
+        for rows in iter_batches(db_cursor):
+            items = [encoder.to_dict(row) for row in rows]
+            load_relations(conn, relations, rows, items)
+            yield from items
 
-    return json.dumps(employees)
 
+def get_single_employee(id, fields=None, relations=()):
+    (sql, encoder) = (
+        EMPLOYEE_FIELDS.select(fields, relation_keys(relations)) if fields
+        else (EMPLOYEE_SQL, EMPLOYEE_ENCODER)
+    )
 
-def get_single_employee(id):
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-        conn.row_factory = sqlite3.Row
+    with connection() as conn:
         db_cursor = conn.cursor()
 
         # Use a ? parameter to inject a variable's value
         # into the SQL statement.
-        db_cursor.execute(
-            """
-        SELECT
-            e.id,
-            e.name,
-            e.address,
-            e.location_id
-        FROM employee e
-        WHERE e.id = ?
-        """,
-            (id,),
-        )
+        db_cursor.execute(sql + " WHERE e.id = ?", (id,))
 
         # Load the single result into memory
         data = db_cursor.fetchone()
+        if data is None:
+            return None
 
-        # Create an animal instance from the current row
-        employee = Employee(
-            data["id"], data["name"], data["address"], data["location_id"]
-        )
+        if not relations:
+            return encoder.encode_one(data)
+
+        item = encoder.to_dict(data)
+        load_relations(conn, relations, [data], [item])
+
+        return json.dumps(item)
 
-        return json.dumps(employee.__dict__)
 
+def get_employee_by_location(location_id, page=None, fields=None):
+    return get_all_employees(page, fields, {"location_id": [str(location_id)]})
 
-def get_employee_by_location(location_id):
 
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-        conn.row_factory = sqlite3.Row
+@queued_write
+@retry_on_locked
+def create_employee(new_employee):
+    with connection() as conn:
         db_cursor = conn.cursor()
 
-        # Write the SQL query to get the information you want
         db_cursor.execute(
             """
-        select
-            e.id,
-            e.name,
-            e.address,
-            e.location_id
-        FROM employee e
-        WHERE e.location_id = ?
+        INSERT INTO Employee
+        ( name, address, location_id )
+        VALUES
+        ( ?, ?, ? );
         """,
-            (location_id,),
+            (new_employee["name"], new_employee["address"], new_employee["location_id"]),
         )
 
-        employees = []
-        dataset = db_cursor.fetchall()
-
-        for row in dataset:
-            employee = Employee(
-                row["id"], row["name"], row["address"], row["location_id"]
-            )
-            employees.append(employee.__dict__)
-
-    return json.dumps(employees)
+        # Send the primary key back to the client with the employee
+        new_employee["id"] = db_cursor.lastrowid
 
+    return new_employee
 
-def create_employee(employee):
-    # Get the id value of the last animal in the list
-    max_id = EMPLOYEES[-1]["id"]
 
-    # Add 1 to whatever that number is
-    new_id = max_id + 1
+@retry_on_locked
+def create_employees(new_employees):
+    """Adds many employees with one executemany in one transaction
 
-    # Add an `id` property to the animal dictionary
-    employee["id"] = new_id
-
-    # Add the animal dictionary to the list
-    EMPLOYEES.append(employee)
-
-    # Return the dictionary with `id` property added
-    return employee
+    Returns:
+        list: the ids given to the employees, in order
+    """
+    return insert_many("Employee", ("name", "address", "location_id"), new_employees)
 
 
+@queued_write
+@retry_on_locked
 def delete_employee(id):
-    # Initial -1 value for animal index, in case one isn't found
-    employee_index = -1
+    with connection() as conn:
+        db_cursor = conn.cursor()
 
-    # Iterate the ANIMALS list, but use enumerate() so that you
-    # can access the index value of each item
-    for index, employee in enumerate(EMPLOYEES):
-        if employee["id"] == id:
-            # Found the animal. Store the current index.
-            employee_index = index
+        db_cursor.execute(
+            """
+        DELETE FROM employee
+        WHERE id = ?
+        """,
+            (id,),
+        )
 
-    # If the animal was found, use pop(int) to remove it from list
-    if employee_index >= 0:
-        EMPLOYEES.pop(employee_index)
+        return db_cursor.rowcount > 0
 
 
+@queued_write
+@retry_on_locked
 def update_employee(id, new_employee):
-    # Iterate the ANIMALS list, but use enumerate() so that
-    # you can access the index value of each item.
-    for index, employee in enumerate(EMPLOYEES):
-        if employee["id"] == id:
-            # Found the animal. Update the value.
-            EMPLOYEES[index] = new_employee
-            break
+    with connection() as conn:
+        db_cursor = conn.cursor()
+
+        db_cursor.execute(
+            """
+        UPDATE Employee
+            SET
+                name = ?,
+                address = ?,
+                location_id = ?
+        WHERE id = ?
+        """,
+            (
+                new_employee["name"],
+                new_employee["address"],
+                new_employee["location_id"],
+                id,
+            ),
+        )
+
+        # False when there is no employee with the id, a 404
+        return db_cursor.rowcount > 0
@@ -0,0 +1,179 @@
+from itertools import repeat
+from json import dumps
+from json.encoder import encode_basestring_ascii
+
+import cache
+import db
+
+# How a value of each type sqlite returns is written in JSON, the same text
+# json.dumps writes for it. Other types, e.g. float, go through json.dumps.
+VALUE_ENCODERS = {
+    str: encode_basestring_ascii,
+    int: int.__repr__,
+    type(None): lambda value: "null",
+}
+
+# Rows turned into columns at once by RowEncoder.fragments
+ENCODE_BATCH_SIZE = 1000
+
+
+class Value:
+    """A value of a layout that is the same for every row, e.g. the null
+    location of an animal read without its location"""
+
+    def __init__(self, value):
+        self.value = value
+
+
+class RowEncoder:
+    """Turns the rows of a query into JSON text without building a model or
+    dictionary per row. The keys and nesting are written into a template
+    once per query, and each column is encoded for all rows with one
+    function picked from its first value, so a row costs a single string
+    formatting. The text is what json.dumps would write for to_dict(row).
+
+    Args:
+        layout (tuple): (key, source) pairs in the order of the JSON object.
+            The source is a column name, a Value, or a layout of its own for
+            a nested object
+        to_dict (function): builds the dictionary of a row, for callers that
+            add to it, e.g. relations. Defaults to one built from layout
+        versions (tuple): columns that change whenever the JSON of a row
+            does, e.g. the versions of the row and of the rows joined to it.
+            With them the text of each row is kept in cache.fragment_cache
+            and only rows read at another version are encoded again
+    """
+
+    def __init__(self, layout, to_dict=None, versions=None):
+        self.layout = layout
+        self._to_dict = to_dict
+        self.versions = versions
+        # Column names of a query -> its template and the columns it reads
+        self._compiled = {}
+
+    def to_dict(self, row):
+        if self._to_dict is not None:
+            return self._to_dict(row)
+        return layout_dict(self.layout, row)
+
+    def fragments(self, rows):
+        """Returns the JSON text of every row, in order
+
+        Args:
+            rows (list): sqlite3.Row objects of one query
+        """
+        if not rows:
+            return []
+        names = tuple(rows[0].keys())
+        compiled = self._compiled.get(names)
+        if compiled is None:
+            compiled = self._compiled[names] = compile_layout(self.layout, names)
+        (template, columns) = compiled
+
+        fragments = []
+        # A slice at a time, so the columns in between stay small
+        for start in range(0, len(rows), ENCODE_BATCH_SIZE):
+            batch = rows[start : start + ENCODE_BATCH_SIZE]
+            # Inside a transaction the rows may be rolled back, and their
+            # version then given again to other text
+            if (
+                self.versions is None
+                or not cache.fragment_cache.enabled
+                or db.in_transaction()
+            ):
+                fragments.extend(encode_rows(batch, template, columns))
+            else:
+                fragments.extend(self._cached(batch, names, template, columns))
+        return fragments
+
+    def _cached(self, rows, names, template, columns):
+        """Encodes the rows that are not in the fragment cache at the version
+        they were read at, and takes the others from it"""
+        values = list(zip(*rows))
+        # The template stands for the shape of the JSON, the table included
+        keys = list(
+            zip(
+                repeat(template),
+                values[names.index("id")],
+                *(values[names.index(column)] for column in self.versions),
+            )
+        )
+        fragments = cache.fragment_cache.get_many(keys)
+        missing = [index for (index, fragment) in enumerate(fragments) if fragment is None]
+        if missing:
+            encoded = encode_rows([rows[index] for index in missing], template, columns)
+            for (index, fragment) in zip(missing, encoded):
+                fragments[index] = fragment
+            cache.fragment_cache.put_many(
+                zip((keys[index] for index in missing), encoded)
+            )
+        return fragments
+
+    def encode(self, rows):
+        """Returns the rows as the bytes of a JSON array"""
+        return ("[" + ", ".join(self.fragments(rows)) + "]").encode()
+
+    def encode_one(self, row):
+        """Returns one row as the bytes of a JSON object"""
+        return self.fragments([row])[0].encode()
+
+
+def compile_layout(layout, names):
+    """Writes a layout as a %-template with a %s per value, and lists the
+    indexes of the columns that fill them, in order"""
+    columns = []
+
+    def write(layout):
+        pieces = []
+        for (key, source) in layout:
+            if isinstance(source, Value):
+                value = dumps(source.value).replace("%", "%%")
+            elif isinstance(source, tuple):
+                value = write(source)
+            else:
+                columns.append(names.index(source))
+                value = "%s"
+            pieces.append(f"{encode_basestring_ascii(key).replace('%', '%%')}: {value}")
+        return "{" + ", ".join(pieces) + "}"
+
+    return (write(layout), columns)
+
+
+def encode_rows(rows, template, columns):
+    """Fills a template compiled by compile_layout with every row"""
+    values = list(zip(*rows))
+    encoded = {}
+    for column in columns:
+        if column not in encoded:
+            encoded[column] = encode_column(values[column])
+    return list(map(template.__mod__, zip(*(encoded[column] for column in columns))))
+
+
+def encode_column(values):
+    """Encodes the values of one column. The whole column goes through the
+    encoder of its first value's type, or value by value when that fails on
+    another type, e.g. a null among numbers, or the first value is null."""
+    encode = None if values[0] is None else VALUE_ENCODERS.get(type(values[0]))
+    if encode is not None:
+        try:
+            return list(map(encode, values))
+        except TypeError:
+            pass
+    return [encode_value(value) for value in values]
+
+
+def encode_value(value):
+    encode = VALUE_ENCODERS.get(type(value))
+    return dumps(value) if encode is None else encode(value)
+
+
+def layout_dict(layout, row):
+    """Builds the dictionary a layout describes from one row"""
+    return {
+        key: (
+            source.value if isinstance(source, Value)
+            else layout_dict(source, row) if isinstance(source, tuple)
+            else row[source]
+        )
+        for (key, source) in layout
+    }
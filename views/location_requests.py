@@ -1,117 +1,193 @@
-import sqlite3
 import json
+
+from db import connection, iter_batches, queued_write, retry_on_locked
 from models import Location
+from .bulk import insert_many
+from .encoder import RowEncoder
+from .paging import Page
+from .projection import Projection
+from .query import QueryBuilder
+from .relations import Relation, load_relations, relation_keys
+
+ALL_LOCATIONS_SQL = """
+        SELECT
+            l.id,
+            l.name,
+            l.address,
+            l.version
+        FROM location l
+        """
+
+# What ?fields= may ask for, all of them columns of Location
+LOCATION_FIELDS = Projection("Location", "l", ("id", "name", "address", "updated_at"))
+
+
+def location_from_row(row):
+    """Builds the dictionary of a location from a row of ALL_LOCATIONS_SQL"""
+    return Location.from_row(row).to_dict()
+
+
+# The JSON of a row of ALL_LOCATIONS_SQL, the same as that of location_from_row,
+# cached per row version
+LOCATION_ENCODER = RowEncoder(
+    (("id", "id"), ("name", "name"), ("address", "address")),
+    location_from_row,
+    versions=("version",),
+)
+
+
+# The location of an animal or employee, for ?_expand=location
+LOCATION_RELATION = Relation(
+    "location_id", ALL_LOCATIONS_SQL, "l.id", location_from_row
+)
+
+
+# The sort orders of GET /locations, e.g. ?_sortBy=name
+LOCATION_QUERY = QueryBuilder(
+    LOCATION_FIELDS,
+    minimums={"updated_since": "updated_at"},
+    sorts=("id", "name"),
+    full=(ALL_LOCATIONS_SQL, LOCATION_ENCODER),
+)
 
-LOCATIONS = [
-    {"id": 1, "name": "Nashville North", "address": "8422 Johnson Pike"},
-    {"id": 2, "name": "Nashville South", "address": "209 Emory Drive"},
-]
 
+def get_all_locations(page=None, fields=None, query=None, relations=()):
+    page = page or Page()
+    (sql, params, encoder) = LOCATION_QUERY.build(
+        query, page, fields, relation_keys(relations)
+    )
 
-def get_all_locations():
-    with sqlite3.connect("./kennel.sqlite3") as conn:
+    with connection() as conn:
 
         # Just use these. It's a Black Box.
-        conn.row_factory = sqlite3.Row
         db_cursor = conn.cursor()
 
         # Write the SQL query to get the information you want
-        db_cursor.execute(
-            """
-        SELECT
-            l.id,
-            l.name,
-            l.address
-        FROM location l
-        """
-        )
-
-        # Initialize an empty list to hold all animal representations
-        locations = []
+        db_cursor.execute(sql, params)
 
         # Convert rows of data into a Python list
-        dataset = db_cursor.fetchall()
+        dataset = page.trim(db_cursor.fetchall())
+
+        # Without relations the rows go straight to JSON, with no model
+        # or dictionary built per row
+        if not relations:
+            return encoder.encode(dataset)
 
         # Iterate list of data returned from database
-        for row in dataset:
+        locations = [encoder.to_dict(row) for row in dataset]
+        load_relations(conn, relations, dataset, locations)
 
-            # Create an animal instance from the current row.
-            # Note that the database fields are specified in
-            # exact order of the parameters defined in the
-            # Animal class above.
-            location = Location(row["id"], row["name"], row["address"])
+    return json.dumps(locations)
 
-            locations.append(location.__dict__)
 
-    return json.dumps(locations)
+def iter_all_locations(fields=None, query=None, page=None, relations=()):
+    """Yields every location as a dictionary, reading the cursor in batches"""
+    (sql, params, encoder) = LOCATION_QUERY.build(
+        query, page, fields, relation_keys(relations)
+    )
+    with connection() as conn:
+        db_cursor = conn.cursor()
+        db_cursor.execute(sql, params)
+
+        # Relations are loaded for each batch, one query per batch
+        for rows in iter_batches(db_cursor):
+            items = [encoder.to_dict(row) for row in rows]
+            load_relations(conn, relations, rows, items)
+            yield from items
+
 
+def get_single_location(id, fields=None, relations=()):
+    (sql, encoder) = (
+        LOCATION_FIELDS.select(fields, relation_keys(relations)) if fields
+        else (ALL_LOCATIONS_SQL, LOCATION_ENCODER)
+    )
 
-def get_single_location(id):
-    with sqlite3.connect("./kennel.sqlite3") as conn:
-        conn.row_factory = sqlite3.Row
+    with connection() as conn:
         db_cursor = conn.cursor()
 
         # Use a ? parameter to inject a variable's value
         # into the SQL statement.
-        db_cursor.execute(
-            """
-        SELECT
-            l.id,
-            l.name,
-            l.address
-        FROM location l
-        WHERE l.id = ?
-        """,
-            (id,),
-        )
+        db_cursor.execute(sql + " WHERE l.id = ?", (id,))
 
         # Load the single result into memory
         data = db_cursor.fetchone()
+        if data is None:
+            return None
+
+        if not relations:
+            return encoder.encode_one(data)
 
-        # Create an animal instance from the current row
-        location = Location(data["id"], data["name"], data["address"])
+        item = encoder.to_dict(data)
+        load_relations(conn, relations, [data], [item])
 
-        return json.dumps(location.__dict__)
+        return json.dumps(item)
 
 
-def create_location(location):
-    # Get the id value of the last animal in the list
-    max_id = LOCATIONS[-1]["id"]
+@queued_write
+@retry_on_locked
+def create_location(new_location):
+    with connection() as conn:
+        db_cursor = conn.cursor()
+
+        db_cursor.execute(
+            """
+        INSERT INTO Location
+        ( name, address )
+        VALUES
+        ( ?, ? );
+        """,
+            (new_location["name"], new_location["address"]),
+        )
+
+        # Send the primary key back to the client with the location
+        new_location["id"] = db_cursor.lastrowid
 
-    # Add 1 to whatever that number is
-    new_id = max_id + 1
+    return new_location
 
-    # Add an `id` property to the animal dictionary
-    location["id"] = new_id
 
-    # Add the animal dictionary to the list
-    LOCATIONS.append(location)
+@retry_on_locked
+def create_locations(new_locations):
+    """Adds many locations with one executemany in one transaction
 
-    # Return the dictionary with `id` property added
-    return location
+    Returns:
+        list: the ids given to the locations, in order
+    """
+    return insert_many("Location", ("name", "address"), new_locations)
 
 
+@queued_write
+@retry_on_locked
 def delete_location(id):
-    # Initial -1 value for animal index, in case one isn't found
-    location_index = -1
+    with connection() as conn:
+        db_cursor = conn.cursor()
 
-    # Iterate the ANIMALS list, but use enumerate() so that you
-    # can access the index value of each item
-    for index, location in enumerate(LOCATIONS):
-        if location["id"] == id:
-            # Found the animal. Store the current index.
-            location_index = index
+        db_cursor.execute(
+            """
+        DELETE FROM location
+        WHERE id = ?
+        """,
+            (id,),
+        )
 
-    # If the animal was found, use pop(int) to remove it from list
-    if location_index >= 0:
-        LOCATIONS.pop(location_index)
+        return db_cursor.rowcount > 0
 
 
+@queued_write
+@retry_on_locked
 def update_location(id, new_location):
-    # Iterate the ANIMALS list, but use enumerate() so that
-    # you can access the index value of each item.
-    for index, location in enumerate(LOCATIONS):
-        if location["id"] == id:
-            # Found the location. Update the value.
-            LOCATIONS[index] = new_location
-            break
+    with connection() as conn:
+        db_cursor = conn.cursor()
+
+        db_cursor.execute(
+            """
+        UPDATE Location
+            SET
+                name = ?,
+                address = ?
+        WHERE id = ?
+        """,
+            (new_location["name"], new_location["address"], id),
+        )
+
+        # False when there is no location with the id, a 404
+        return db_cursor.rowcount > 0
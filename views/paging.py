@@ -0,0 +1,117 @@
+import base64
+import json
+
+MAX_LIMIT = 1000
+
+
+class Page:
+    """A keyset page of a collection: the rows that come after `after` in
+    the sort order, at most `limit` of them. The database finds the first
+    row through an index, so deep pages cost the same as the first one,
+    unlike an OFFSET scan.
+
+    Args:
+        limit (number): rows per page, None for all of them
+        after: the last row of the previous page, None to start. Its id, or
+            (sort value, id) when the page is sorted on another column
+        sort (string): the column to order by, None for the id
+        descending (bool): whether to return the largest values first
+    """
+
+    def __init__(self, limit=None, after=None, sort=None, descending=False):
+        self.limit = None if limit is None else min(limit, MAX_LIMIT)
+        self.after = after
+        self.sort = None if sort == "id" else sort
+        self.descending = descending
+        # Set by trim() when there are rows past this page
+        self.next_after = None
+
+    def shape(self):
+        """What the SQL of this page depends on, as a hashable tuple"""
+        return (
+            self.sort,
+            self.descending,
+            self.after is not None,
+            self.limit is not None,
+        )
+
+    def sql(self, id_column, where=False, sort_column=None):
+        """Returns the SQL to append to a query for this page
+
+        Args:
+            id_column (string): the column holding the row id, e.g. "a.id"
+            where (bool): whether the query already has a WHERE clause
+            sort_column (string): the column of `sort`, e.g. "a.name"
+        """
+        return page_sql(self.shape(), id_column, where, sort_column)
+
+    def params(self):
+        """Returns the parameters for the placeholders sql() added"""
+        params = ()
+        if self.after is not None:
+            params += tuple(self.after) if self.sort else (self.after,)
+        if self.limit is not None:
+            # One extra row tells whether there is a next page
+            params += (self.limit + 1,)
+        return params
+
+    def trim(self, rows):
+        """Drops the extra row fetched by params() and records the cursor of
+        the next page"""
+        if self.limit is not None and len(rows) > self.limit:
+            rows = rows[: self.limit]
+            last = rows[-1]
+            self.next_after = (last[self.sort], last["id"]) if self.sort else last["id"]
+        return rows
+
+    def cursor(self):
+        """Returns next_after as the text of ?after= for the next page"""
+        if not self.sort:
+            return str(self.next_after)
+        text = json.dumps(list(self.next_after)).encode()
+        return base64.urlsafe_b64encode(text).decode()
+
+    def parse_cursor(self, text):
+        """Reads ?after= written by cursor() into after
+
+        Raises:
+            ValueError: when the text is not a cursor of this sort
+        """
+        if not self.sort:
+            try:
+                self.after = int(text)
+            except ValueError:
+                raise ValueError("after must be a whole number.") from None
+            return
+        try:
+            (value, id) = json.loads(base64.urlsafe_b64decode(text.encode()))
+            self.after = (value, int(id))
+        except (ValueError, TypeError):
+            raise ValueError("after is not a cursor of this sort order.") from None
+
+
+def page_sql(shape, id_column, where=False, sort_column=None):
+    """Builds the WHERE, ORDER BY and LIMIT of a page from its shape(). With
+    a sort column the id breaks ties, and the cursor compares both as a row
+    value so an index on the sort column, which ends with the id, serves it."""
+    (sort, descending, after, limit) = shape
+    direction = " DESC" if descending else ""
+    sql = ""
+    if after:
+        operator = "<" if descending else ">"
+        if sort:
+            sql += (
+                f" {'AND' if where else 'WHERE'} ({sort_column}, {id_column})"
+                f" {operator} (?, ?)"
+            )
+        else:
+            sql += f" {'AND' if where else 'WHERE'} {id_column} {operator} ?"
+    # Always ordered: without ORDER BY sqlite returns the rows in the order of
+    # whichever index it picked, e.g. by name for SELECT id, name
+    if sort:
+        sql += f" ORDER BY {sort_column}{direction}, {id_column}{direction}"
+    else:
+        sql += f" ORDER BY {id_column}{direction}"
+    if limit:
+        sql += " LIMIT ?"
+    return sql
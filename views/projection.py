@@ -0,0 +1,73 @@
+from .encoder import RowEncoder
+
+
+class Projection:
+    """The fields of a resource a client may pick with ?fields=, and the
+    columns and joins that produce each of them. A query built by select()
+    reads only what was asked for, and joins a table only when one of its
+    rows is embedded in the response.
+
+    Args:
+        table (string): the table of the resource, e.g. "Animal"
+        alias (string): its alias in the queries of the view, e.g. "a"
+        columns (tuple): the columns returned as fields of the same name
+        relations (dict): field -> (table, alias, foreign key, columns) of a
+            row embedded as an object, e.g. the location of an animal
+    """
+
+    def __init__(self, table, alias, columns, relations=None):
+        self.table = table
+        self.alias = alias
+        self.columns = columns
+        self.relations = relations or {}
+
+    @property
+    def names(self):
+        return self.columns + tuple(self.relations)
+
+    def check(self, fields):
+        """Raises ValueError when a field is not one of names"""
+        unknown = [field for field in fields if field not in self.names]
+        if unknown:
+            raise ValueError(
+                f"Unknown field {', '.join(unknown)}. "
+                f"Choose from {', '.join(self.names)}."
+            )
+
+    def select(self, fields, extra=()):
+        """Builds the SELECT list, FROM and JOINs for some fields
+
+        Args:
+            fields (tuple): names the client asked for, already checked
+            extra (tuple): columns to read without returning them
+
+        Returns:
+            tuple: the SQL, to be followed by a WHERE clause or a page, and
+                the RowEncoder of its rows
+        """
+        # The id is read even when it is not asked for, keyset pages need it
+        select = []
+        for column in ("id",) + tuple(extra):
+            if column not in fields and f"{self.alias}.{column}" not in select:
+                select.append(f"{self.alias}.{column}")
+        joins = []
+        layout = []
+        for field in fields:
+            if field in self.relations:
+                (table, alias, key, columns) = self.relations[field]
+                joins.append(
+                    f"JOIN {table} {alias} ON {alias}.id = {self.alias}.{key}"
+                )
+                select.extend(f"{alias}.{column} {field}__{column}" for column in columns)
+                layout.append(
+                    (field, tuple((column, f"{field}__{column}") for column in columns))
+                )
+            else:
+                select.append(f"{self.alias}.{field}")
+                layout.append((field, field))
+
+        sql = f"SELECT {', '.join(select)} FROM {self.table} {self.alias}"
+        if joins:
+            sql += " " + " ".join(joins)
+
+        return (sql, RowEncoder(tuple(layout)))
@@ -0,0 +1,127 @@
+from functools import lru_cache
+
+from .paging import Page, page_sql
+
+
+class QueryBuilder:
+    """Builds the one parameterized SELECT behind GET /resource, whatever
+    combination of filters, fields, sort and page the query string asks for.
+    Filters are ANDed together. A parameter given several values, repeated or
+    comma separated, becomes an IN list. The SQL text only depends on the
+    shape of the request, which names are used and how many values each one
+    has, so it is built once per shape and sqlite's statement cache can reuse
+    the compiled statement.
+
+    Args:
+        projection (Projection): the fields and joins of the resource
+        filters (tuple): columns matched by ?column=value
+        prefixes (dict): query parameter -> column matched by prefix, e.g.
+            {"breed": "breed"}. A range on the column, so it can
+            search an index; case sensitive like the index
+        minimums (dict): query parameter -> column that must be at least
+            its value, e.g. {"updated_since": "updated_at"}
+        sorts (tuple): columns ?_sortBy= may order by
+        full (tuple): the SQL and RowEncoder of an unfiltered request that
+            does not pick its fields
+        flat (tuple): the same for a filtered one, None to use full
+    """
+
+    def __init__(self, projection, filters=(), prefixes=None, minimums=None,
+                 sorts=("id",), full=None, flat=None):
+        self.projection = projection
+        self.filters = filters
+        self.prefixes = prefixes or {}
+        self.minimums = minimums or {}
+        self.sorts = sorts
+        self.full = full
+        self.flat = flat or full
+        # The SQL and encoder of each query shape, built once. The builders
+        # live as long as the module, so the cache holding self is harmless
+        self._compiled = lru_cache(maxsize=256)(self._compile_sql)
+
+    def build(self, query=None, page=None, fields=None, keys=()):
+        """Returns the SQL, its parameters and the RowEncoder of its rows
+
+        Args:
+            query (dict): the parsed query string, parameter -> list of values.
+                Parameters other than the filters are ignored
+            page (Page): the sort and keyset page
+            fields (tuple): the fields to read, every one of them when None
+            keys (tuple): columns the rows need besides the fields, e.g. the
+                foreign keys of relations loaded afterwards. Asking for any
+                also drops the joins of the full query, the relations
+                replace them
+        """
+        page = page or Page()
+        (shape, params) = self._match(query or {})
+        (sql, encoder) = self._compiled(shape, page.shape(), fields, tuple(keys))
+        return (sql, params + page.params(), encoder)
+
+    def _match(self, query):
+        """Splits the filters in the query into a shape and the parameters"""
+        shape = []
+        params = ()
+        for column in self.filters:
+            values = split_values(query.get(column))
+            if values:
+                shape.append((column, len(values)))
+                params += tuple(values)
+        for (name, column) in self.prefixes.items():
+            prefix = (query.get(name) or [""])[0]
+            if prefix:
+                shape.append((name, 0))
+                params += prefix_range(prefix)
+        for name in self.minimums:
+            minimum = (query.get(name) or [""])[0]
+            if minimum:
+                shape.append((name, 0))
+                params += (minimum,)
+        return (tuple(shape), params)
+
+    def _compile_sql(self, shape, page_shape, fields, keys):
+        alias = self.projection.alias
+        sort = page_shape[0]
+
+        if fields:
+            # Keyset pages read the sort column even when it is not asked for
+            extra = keys + ((sort,) if sort else ())
+            (sql, encoder) = self.projection.select(fields, extra)
+        elif shape or keys:
+            (sql, encoder) = self.flat
+        else:
+            (sql, encoder) = self.full
+
+        conditions = []
+        for (name, count) in shape:
+            if name in self.prefixes:
+                column = f"{alias}.{self.prefixes[name]}"
+                conditions.append(f"{column} >= ? AND {column} < ?")
+            elif name in self.minimums:
+                conditions.append(f"{alias}.{self.minimums[name]} >= ?")
+            elif count == 1:
+                conditions.append(f"{alias}.{name} = ?")
+            else:
+                conditions.append(f"{alias}.{name} IN ({', '.join('?' * count)})")
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+
+        sort_column = None if sort is None else f"{alias}.{sort}"
+        sql += page_sql(page_shape, f"{alias}.id", bool(conditions), sort_column)
+        return (sql, encoder)
+
+
+def split_values(values):
+    """Turns ["Kennel,Treatment", "Recreation"] into the three values"""
+    return [
+        value.strip()
+        for joined in values or ()
+        for value in joined.split(",")
+        if value.strip()
+    ]
+
+
+def prefix_range(prefix):
+    """Returns the bounds of the strings that start with prefix, so
+    column >= low AND column < high finds them through an index. The
+    largest code point sorts after any character that can follow it."""
+    return (prefix, prefix + "\U0010ffff")
@@ -0,0 +1,65 @@
+# Values per IN (...) list, below the 999 variables older sqlite allows
+IN_BATCH_SIZE = 500
+
+
+class Relation:
+    """Rows of another table that are loaded for a whole page of rows with
+    one IN (...) query, instead of one query or HTTP call per row
+
+    Args:
+        key (string): the column of the page's rows that points at the
+            related rows, e.g. "location_id", or "id" for rows pointing back
+        sql (string): the SELECT of the related rows, without a WHERE
+        column (string): the column of the related rows compared with key,
+            e.g. "l.id" or "a.location_id"
+        to_dict (function): builds the dictionary of a related row
+        many (bool): whether a row has a list of related rows instead of one
+    """
+
+    def __init__(self, key, sql, column, to_dict, many=False):
+        self.key = key
+        self.sql = sql
+        self.column = column
+        self.to_dict = to_dict
+        self.many = many
+
+    def load(self, conn, name, rows, items):
+        """Adds the related rows to the dictionaries built from rows
+
+        Args:
+            conn (Connection): the connection the rows were read with
+            name (string): the key to store the related rows under
+            rows (list): the rows of the page, each one with the key column
+            items (list): the dictionaries built from rows, in the same order
+        """
+        keys = sorted({row[self.key] for row in rows if row[self.key] is not None})
+        # The related rows' alias, and the name their column is selected as
+        (alias, related_key) = self.column.split(".")
+
+        found = {}
+        for start in range(0, len(keys), IN_BATCH_SIZE):
+            batch = keys[start : start + IN_BATCH_SIZE]
+            sql = (
+                f"{self.sql} WHERE {self.column} IN ({', '.join('?' * len(batch))})"
+                f" ORDER BY {alias}.id"
+            )
+            for related in conn.execute(sql, batch):
+                value = self.to_dict(related)
+                if self.many:
+                    found.setdefault(related[related_key], []).append(value)
+                else:
+                    found[related[related_key]] = value
+
+        for (row, item) in zip(rows, items):
+            item[name] = found.get(row[self.key], [] if self.many else None)
+
+
+def load_relations(conn, relations, rows, items):
+    """Runs Relation.load for every (name, relation) pair"""
+    for (name, relation) in relations:
+        relation.load(conn, name, rows, items)
+
+
+def relation_keys(relations):
+    """Returns the columns the rows need for some (name, Relation) pairs"""
+    return tuple(relation.key for (_, relation) in relations)
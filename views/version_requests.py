@@ -0,0 +1,17 @@
+import sqlite3
+
+from db import connection
+
+
+def get_table_versions():
+    """Returns how many times each table has changed, as counted by the
+    ChangeVersion triggers, or None when the migration has not been applied"""
+    with connection() as conn:
+        try:
+            rows = conn.execute(
+                "SELECT table_name, version FROM ChangeVersion"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            return None
+
+    return {row["table_name"]: row["version"] for row in rows}